@@ -0,0 +1,281 @@
+# Asyncio server hosting many King & Assassins matches in one process
+# Players connect, wait in a lobby and are paired two by two; every match has
+# its own KingAndAssassinsState and runs as a task of the same event loop
+#
+# Messages are JSON objects, one per line:
+#   client -> server  {"type": "hello", "name": ...}
+#   server -> client  {"type": "start", "player": 0 or 1, "opponent": ...}
+#   server -> client  {"type": "turn", "state": <visible part of the state>}
+#   client -> server  {"assassins": [...]} or {"actions": [...]}, as for KingAndAssassinsServer
+#   server -> client  {"type": "end", "winner": ..., "reason": ...}
+#
+# A client sending {"type": "hello", "name": ..., "protocol": "binary"} switches
+# to the framed protocol of protocol.py after its hello line: control messages
+# are JSON frames, the view is sent in full once and then as versioned deltas,
+# and the actions are sent in their compact binary encoding. A client whose
+# view does not match the base version of a delta sends {"type": "resync"} and
+# gets a full view again.
+
+import asyncio
+import itertools
+import json
+import random
+import time
+
+from lib import game
+from gamelog import GameRecord
+from kingandassassins import new_game
+from views import ViewTracker, applydiff
+import protocol
+
+
+class Connection:
+    '''Class representing a connected player, using JSON lines or binary frames.'''
+
+    def __init__(self, reader, writer, name, binary=False, metrics=None):
+        self.reader = reader
+        self.writer = writer
+        self.name = name
+        self.binary = binary
+        self.metrics = metrics
+        # Version of the view the client has, 0 if it has none
+        self.version = 0
+
+    async def _write(self, data):
+        if self.metrics is not None:
+            self.metrics.sent(len(data))
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def send(self, message):
+        if self.binary:
+            await self._write(protocol.jsonframe(message))
+        else:
+            await self._write(json.dumps(message, separators=(',', ':')).encode() + b'\n')
+
+    async def sendview(self, tracker, player):
+        '''Send the view of player to play on, as a delta from the last one sent in binary mode.'''
+        if not self.binary:
+            return await self.send({'type': 'turn', 'state': tracker.view(player)['state']})
+        diff = tracker.diff(player, self.version) if self.version else None
+        if diff is None:
+            data = protocol.frame(protocol.STATE, json.dumps(tracker.view(player), separators=(',', ':')).encode())
+        else:
+            data = protocol.frame(protocol.DELTA, protocol.encodediff(diff))
+        self.version = tracker.version
+        await self._write(data)
+
+    async def receive(self, timeout=None):
+        line = await asyncio.wait_for(self.reader.readline(), timeout)
+        if not line:
+            raise ConnectionError('{}: connection closed'.format(self.name))
+        if self.metrics is not None:
+            self.metrics.received(len(line))
+        return line.decode()
+
+    async def receivemove(self, timeout=None):
+        '''Wait for the next move and return it as a dictionary.'''
+        if not self.binary:
+            move = json.loads(await self.receive(timeout))
+        else:
+            try:
+                type, payload = await asyncio.wait_for(protocol.readframe(self.reader), timeout)
+            except asyncio.IncompleteReadError:
+                raise ConnectionError('{}: connection closed'.format(self.name))
+            if self.metrics is not None:
+                self.metrics.received(protocol.HEADER.size + len(payload))
+            if type == protocol.ACTIONS:
+                return {'actions': protocol.decodeactions(payload)}
+            if type != protocol.JSON:
+                raise protocol.ProtocolError('unexpected frame of type {}'.format(type))
+            move = json.loads(payload)
+        if not isinstance(move, dict):
+            raise protocol.ProtocolError('{}: a move must be a JSON object'.format(self.name))
+        return move
+
+    def close(self):
+        self.writer.close()
+
+
+class Match:
+    '''Class representing one match between two connections.'''
+
+    def __init__(self, players, seed, timeout, metrics=None):
+        self.players = players
+        self.state = new_game(seed)
+        self.views = ViewTracker(self.state)
+        self.record = GameRecord.fromstate(self.state)
+        self.timeout = timeout
+        self.metrics = metrics
+        self.winner = None
+        self.reason = None
+
+    async def run(self):
+        state = self.state
+        for nb, player in enumerate(self.players):
+            await player.send({'type': 'start', 'player': nb, 'opponent': self.players[1 - nb].name})
+        current = 0
+        while True:
+            player = self.players[current]
+            try:
+                start = time.perf_counter()
+                # One deadline for the whole turn, asking for full views again does not give more time
+                deadline = None if self.timeout is None else start + self.timeout
+                await player.sendview(self.views, current)
+                # Waiting for a move only suspends this match, the other ones keep running
+                move = await player.receivemove(self._left(deadline))
+                while move.get('type') == 'resync':
+                    player.version = 0
+                    await player.sendview(self.views, current)
+                    move = await player.receivemove(self._left(deadline))
+                if self.metrics is not None:
+                    self.metrics.observe('turn', time.perf_counter() - start)
+                self.views.apply(move, current)
+                self.record.record(move)
+            except asyncio.TimeoutError:
+                return self._end(1 - current, '{}: timeout'.format(player.name))
+            except (game.InvalidMoveException, protocol.ProtocolError, ValueError) as e:
+                if self.metrics is not None:
+                    self.metrics.invalidmove(e)
+                return self._end(1 - current, str(e))
+            except (ConnectionError, OSError) as e:
+                return self._end(1 - current, str(e))
+            except Exception as e:
+                # Any other error still ends the match, so that both players are told
+                return self._end(1 - current, '{}: {}'.format(type(e).__name__, e))
+            winner = state.winner()
+            if winner != -1:
+                return self._end(winner, 'game over')
+            current = 1 - current
+
+    @staticmethod
+    def _left(deadline):
+        # Seconds left before the deadline of the turn
+        if deadline is None:
+            return None
+        left = deadline - time.perf_counter()
+        if left <= 0:
+            raise asyncio.TimeoutError()
+        return left
+
+    def _end(self, winner, reason):
+        self.winner = winner
+        self.record.winner = winner
+        self.reason = reason
+        return winner
+
+
+class AsyncServer:
+    '''Class representing a server with a lobby pairing the players in arrival order.'''
+
+    def __init__(self, host='localhost', port=5000, timeout=10.0, seed=None, verbose=False, log=None, metrics=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.verbose = verbose
+        # GameLog every finished match is appended to
+        self.log = log
+        # Metrics (see metrics.py) collected over all the matches, written after each one
+        self.metrics = metrics
+        self.lobby = asyncio.Queue()
+        self.matches = set()
+        self.finished = 0
+        self._rng = random.Random(seed)
+        self._ids = itertools.count()
+
+    async def _connect(self, reader, writer):
+        connection = Connection(reader, writer, None, metrics=self.metrics)
+        try:
+            hello = json.loads(await connection.receive(self.timeout))
+            connection.name = str(hello.get('name', 'anonymous'))
+            connection.binary = hello.get('protocol') == 'binary'
+        except Exception:
+            connection.close()
+            return
+        await self.lobby.put(connection)
+
+    async def _matchmaker(self):
+        while True:
+            first = await self.lobby.get()
+            second = await self.lobby.get()
+            # The side of each player is drawn at random
+            players = [first, second]
+            self._rng.shuffle(players)
+            match = Match(players, self._rng.getrandbits(32), self.timeout, self.metrics)
+            task = asyncio.create_task(self._play(next(self._ids), match))
+            self.matches.add(task)
+            task.add_done_callback(self.matches.discard)
+
+    async def _play(self, id, match):
+        winner = await match.run()
+        self.finished += 1
+        # The players are told first, logging the match cannot leave them waiting
+        for player in match.players:
+            try:
+                await player.send({'type': 'end', 'winner': winner, 'reason': match.reason})
+            except (ConnectionError, OSError):
+                pass
+            player.close()
+        if self.verbose:
+            print('match {}: {} won ({})'.format(id, match.players[winner].name, match.reason))
+        if self.log is not None:
+            self.log.append(match.record)
+        if self.metrics is not None:
+            self.metrics.write()
+
+    async def serve(self):
+        server = await asyncio.start_server(self._connect, self.host, self.port)
+        matchmaker = asyncio.create_task(self._matchmaker())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            matchmaker.cancel()
+
+
+async def playremote(host, port, name, player, binary=False):
+    '''Play one match on an AsyncServer with a player callable, as in selfplay.py.
+
+    Returns the winner of the match.'''
+    from kingandassassins import KingAndAssassinsState
+    reader, writer = await asyncio.open_connection(host, port)
+    connection = Connection(reader, writer, name)
+    hello = {'type': 'hello', 'name': name}
+    if binary:
+        hello['protocol'] = 'binary'
+    await connection.send(hello)
+    connection.binary = binary
+    playernb = None
+    view = None
+    try:
+        while True:
+            if binary:
+                type, payload = await protocol.readframe(reader)
+                if type == protocol.STATE:
+                    view = json.loads(payload)
+                    message = {'type': 'turn', 'state': view['state']}
+                elif type == protocol.DELTA:
+                    if view is None or not applydiff(view, protocol.decodediff(payload)):
+                        await connection.send({'type': 'resync'})
+                        continue
+                    message = {'type': 'turn', 'state': view['state']}
+                else:
+                    message = json.loads(payload)
+            else:
+                message = json.loads(await connection.receive())
+            if message['type'] == 'start':
+                playernb = message['player']
+            elif message['type'] == 'turn':
+                # The player gets its own copy, it may change it
+                state = KingAndAssassinsState(json.loads(json.dumps(message['state'])))
+                move = player(state, playernb)
+                if message['state']['card'] is None:
+                    await connection.send({'assassins': move})
+                elif binary:
+                    await connection._write(protocol.frame(protocol.ACTIONS, protocol.encodeactions(move)))
+                else:
+                    await connection.send({'actions': move})
+            elif message['type'] == 'end':
+                return message['winner']
+    finally:
+        connection.close()
@@ -0,0 +1,125 @@
+# Beliefs of the knights' player about which villagers are the hidden assassins
+# Every triple of villagers is a hypothesis: those that contradict what has been
+# seen are pruned from a bitset, and the others are weighted by how much their
+# villagers behaved like assassins (moving towards the king)
+
+import itertools
+import math
+
+from positions import manhattan
+from rules import DIRECTIONS
+
+
+# Likelihood ratio of a villager being an assassin when it gets closer to the king
+TOWARDS = 1.5
+
+
+class AssassinBeliefs:
+    '''Class representing a probability distribution over the assassins' triples.
+
+    observe() must be called with the visible state and its PositionIndex at
+    every turn of the knights' player, it reads what the assassins' player
+    did since the last call from the index and lastopponentmove.'''
+
+    def __init__(self, names, assassins=3):
+        self.names = tuple(sorted(names))
+        self.triples = tuple(itertools.combinations(range(len(self.names)), assassins))
+        # Bit i of alive is set while the i-th triple is still possible
+        self.alive = (1 << len(self.triples)) - 1
+        self.contains = [0] * len(self.names)
+        for i, triple in enumerate(self.triples):
+            for v in triple:
+                self.contains[v] |= 1 << i
+        self.logodds = [0.0] * len(self.names)
+        self._ids = {name: v for v, name in enumerate(self.names)}
+        self._seen = None
+        self._probabilities = None
+
+    def __len__(self):
+        return bin(self.alive).count('1')
+
+    def assassin(self, name):
+        '''Keep only the triples containing name.'''
+        self._restrict(self.contains[self._ids[name]])
+
+    def innocent(self, name):
+        '''Keep only the triples not containing name.'''
+        self._restrict(~self.contains[self._ids[name]])
+
+    def _restrict(self, mask):
+        # Contradictory observations would leave no hypothesis, they are ignored
+        if self.alive & mask and self.alive & ~mask:
+            self.alive &= mask
+            self._probabilities = None
+
+    def observe(self, visible, index):
+        onboard = {index.at[coord] for coord in index.classes['villager']}
+        arrested = set(visible['arrested'])
+        # A villager who left the board without being arrested has been revealed
+        if self._seen is not None:
+            for name in self._seen - onboard - arrested:
+                self.assassin(name)
+        self._seen = onboard
+        # The game goes on, so the arrested villagers and the killed assassins are not all the assassins
+        killed = visible['killed']['assassins']
+        if arrested:
+            mask = 0
+            for i, triple in enumerate(self.triples):
+                if sum(self.names[v] in arrested for v in triple) + killed < len(triple):
+                    mask |= 1 << i
+            self._restrict(mask)
+        self._moves(visible['people'], index.where.get('king'), visible['lastopponentmove'])
+
+    def _moves(self, people, king, moves):
+        # Undo the moves on a copy of the board to know who did each one and from where
+        if king is None or not moves:
+            return
+        board = [list(row) for row in people]
+        for move in reversed(moves):
+            if move[0] != 'move':
+                continue
+            x, y = int(move[1]), int(move[2])
+            dx, dy = DIRECTIONS[move[3]]
+            nx, ny = x + dx, y + dy
+            if not (0 <= nx < len(board) and 0 <= ny < len(board[nx])):
+                continue
+            name = board[nx][ny]
+            board[x][y], board[nx][ny] = name, None
+            if name in self._ids:
+                closer = manhattan((nx, ny), king) - manhattan((x, y), king)
+                self.logodds[self._ids[name]] -= closer * math.log(TOWARDS)
+                self._probabilities = None
+
+    def probabilities(self):
+        '''Probability of each villager to be an assassin, as a dictionary.'''
+        if self._probabilities is None:
+            self._probabilities = self._marginals()
+        return self._probabilities
+
+    def _marginals(self):
+        weights = [0.0] * len(self.names)
+        total = 0.0
+        alive = self.alive
+        for i, triple in enumerate(self.triples):
+            if alive >> i & 1:
+                w = math.exp(sum(self.logodds[v] for v in triple))
+                total += w
+                for v in triple:
+                    weights[v] += w
+        return {name: weights[v] / total for v, name in enumerate(self.names)}
+
+    def suspect(self, coord, candidates, maxdist=None):
+        '''Coordinates of the most probable assassin among the candidates, (coordinates, name) pairs.
+
+        Ties are broken by the distance to coord. Returns None if no candidate
+        is within maxdist.'''
+        probabilities = self.probabilities()
+        best, bestkey = None, None
+        for target, name in candidates:
+            dist = manhattan(coord, target)
+            if name not in probabilities or maxdist is not None and dist > maxdist:
+                continue
+            key = (-probabilities[name], dist, target)
+            if best is None or key < bestkey:
+                best, bestkey = target, key
+        return best
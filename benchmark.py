@@ -0,0 +1,138 @@
+# Benchmarks of the engine and AI hot paths
+# Run with: python kingandassassins.py bench [--output results.json]
+# Every fixture is built from a seed so that two runs can be compared
+
+import json
+import platform
+import random
+import statistics
+import time
+
+from kingandassassins import KingAndAssassinsState, KingAndAssassinsClient, POPULATION, new_game
+from bestway import bestway
+from lookout import lookout
+from nextto import nextto
+from movegen import END, budget, spend, legalactions, piece, pushed
+from selfplay import playgame, RandomPlayer, ScriptedPlayer
+
+
+def _randomturn(state, player, rng):
+    left = budget(state._state['visible']['card'], player)
+    actions = []
+    while True:
+        action = rng.choice(legalactions(state, player, left))
+        if action == END:
+            return actions
+        left = spend(left, action, piece(state, action), pushed(state, action))
+        state.make(action, player)
+        actions.append(action)
+
+
+def opening(seed):
+    '''State right after the assassins have been chosen, the king's team to play.'''
+    state = new_game(seed)
+    state.setassassins(random.Random(seed).sample(sorted(POPULATION), 3))
+    state.update([], 0)
+    return state
+
+
+def midgame(seed, plies=8):
+    '''State after a few turns of random play, the king's team to play.'''
+    rng = random.Random(seed)
+    state = opening(seed)
+    for ply in range(plies):
+        player = 1 - ply % 2
+        _randomturn(state, player, rng)
+        state.make(END, player)
+        if state.winner() != -1:
+            break
+    return state
+
+
+def crowded(seed):
+    '''Opening where the knights are packed in the middle of the villagers.'''
+    state = opening(seed)
+    people = state._state['visible']['people']
+    knights = [(x, y) for x in range(10) for y in range(10) if people[x][y] == 'knight']
+    free = [(x, y) for x in range(3, 8) for y in range(2, 8) if people[x][y] is None]
+    for (x, y), (nx, ny) in zip(knights, random.Random(seed).sample(free, len(knights))):
+        state._setcell(x, y, None)
+        state._setcell(nx, ny, 'knight')
+    return KingAndAssassinsState.frombitboard(state.tobitboard())
+
+
+FIXTURES = {'opening': opening, 'midgame': midgame, 'crowded': crowded}
+
+
+def measure(run, setup=None, repeat=200):
+    '''Time repeat calls of run(arg), arg = setup() being built outside of the timing.'''
+    times = []
+    for i in range(repeat):
+        arg = setup() if setup is not None else None
+        start = time.perf_counter()
+        run(arg)
+        times.append(time.perf_counter() - start)
+    return {
+        'calls': repeat,
+        'min_us': min(times) * 1e6,
+        'median_us': statistics.median(times) * 1e6,
+        'mean_us': statistics.mean(times) * 1e6
+    }
+
+
+def _client(playernb, state):
+    client = KingAndAssassinsClient.__new__(KingAndAssassinsClient)
+    client._ai = None
+    client._book = None
+    client._beliefs = None
+    client._playernb = playernb
+    # Turns 1 and 2 of the scripted assassins are special, benchmark the general case
+    client._turn = 5
+    # The assassins of the fixture, as the client chose them, so that the planner has something to plan
+    where = state.index().where
+    client.allassassins = [[name, *where.get(name, (None, None))] for name in sorted(state._state['hidden']['assassins'])]
+    client.assassins_1, client.assassins_2, client.assassins_3 = client.allassassins
+    return client
+
+
+def benchmarks(seed, repeat):
+    '''Yield (name, run, setup, repeat) for every benchmark, to be given to measure().
+
+    They must be measured as they are generated since they share the fixture.'''
+    for fixture, build in FIXTURES.items():
+        state = build(seed)
+        visible = state._state['visible']
+        rng = random.Random(seed)
+        turn = _randomturn(state.fork(), 1, rng)
+
+        def fresh():
+            return state.fork()
+
+        yield fixture + '/update', lambda s: s.update(turn, 1), fresh, repeat
+        yield fixture + '/winner', lambda s: state.winner(), None, repeat
+        yield fixture + '/getcoord', lambda s: state._getcoord((5, 5, 'N')), None, repeat
+        yield fixture + '/bestway', lambda s: bestway(1, 9, 9, 4, 1), None, repeat
+        yield fixture + '/lookout', lambda s: lookout(5, 5, 5, 'knight', visible), None, repeat
+        yield fixture + '/nextto', lambda s: nextto(5, 5, 5, 6), None, repeat
+        for playernb in range(2):
+            # The client gets the state as it would from the server, decoded from JSON
+            def view():
+                return _client(playernb, state), KingAndAssassinsState(json.loads(json.dumps(visible)))
+            yield fixture + '/nextmove{}'.format(playernb), lambda a: a[0]._nextmove(a[1]), view, repeat
+    games = max(1, repeat // 20)
+    yield 'game/random', lambda s: playgame((RandomPlayer(), RandomPlayer()), seed), None, games
+    yield 'game/scripted', lambda s: playgame((ScriptedPlayer(), ScriptedPlayer()), seed), None, games
+
+
+def runbenchmarks(seed=0, repeat=200, only=None):
+    results = {}
+    for name, run, setup, count in benchmarks(seed, repeat):
+        if only is None or only in name:
+            results[name] = measure(run, setup, count)
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'seed': seed,
+        'repeat': repeat,
+        'results': results
+    }
@@ -0,0 +1,292 @@
+# Compact representation of a King & Assassins state
+# Each class of pieces is stored as a 100-bit integer mask (bit 10*x+y is the
+# cell (x, y)) and the identity of each piece is kept in a flat array of ids
+
+import functools
+
+from lib import game
+from rules import DIR_INDEX, DIRECTIONS, KILLED, VILLAGER, RuleTables
+
+SIZE = 10
+CELLS = SIZE * SIZE
+FULL = (1 << CELLS) - 1
+
+# Masks used to stop horizontal shifts from wrapping around a row
+NOT_WEST = FULL
+NOT_EAST = FULL
+for _x in range(SIZE):
+    NOT_WEST &= ~(1 << (_x * SIZE))
+    NOT_EAST &= ~(1 << (_x * SIZE + SIZE - 1))
+
+
+# Piece ids stored in the array, villagers get the ids after ASSASSIN (the
+# ids are the types of rules.py, every id from VILLAGER on being a villager)
+EMPTY, KING, KNIGHT, ASSASSIN = 0, 1, 2, 3
+FIXED_NAMES = (None, 'king', 'knight', 'assassin')
+
+
+def cell(x, y):
+    return x * SIZE + y
+
+
+def coord(c):
+    return divmod(c, SIZE)
+
+
+def shift(mask, dir):
+    '''Move every bit of the mask of one cell in direction dir, dropping off-board bits.'''
+    if dir == 'E':
+        return (mask << 1) & NOT_WEST
+    if dir == 'W':
+        return (mask >> 1) & NOT_EAST
+    if dir == 'S':
+        return (mask << SIZE) & FULL
+    return mask >> SIZE
+
+
+def neighbour(c, dir):
+    '''Index of the cell next to c in direction dir, or -1 if it is off the board.'''
+    bit = shift(1 << c, dir)
+    return bit.bit_length() - 1
+
+
+def neighbours(mask):
+    '''Mask of all the cells adjacent to at least one cell of mask.'''
+    return shift(mask, 'E') | shift(mask, 'W') | shift(mask, 'S') | shift(mask, 'N')
+
+
+@functools.lru_cache(maxsize=None)
+def _rules(board, castle):
+    # Tables of the standard rules for a board, shared by the bitboards built on it
+    return RuleTables(board, castle)
+
+
+def cells(mask):
+    '''Iterate over the indices of the cells set in mask.'''
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class BitboardState:
+    '''Class representing a King & Assassins state with bit masks.'''
+
+    def __init__(self):
+        self.king = 0
+        self.knights = 0
+        self.villagers = 0
+        self.assassins = 0
+        self.roofs = 0
+        self.doors = 0
+        self.ids = [EMPTY] * CELLS
+        self.names = FIXED_NAMES
+        self.health = 'healthy'
+        self.card = None
+        self.castle = []
+        self.arrested = []
+        self.killed = {'knights': 0, 'assassins': 0}
+        self.cards = None
+        self.hidden = None
+        self.rules = None
+
+    @property
+    def occupied(self):
+        return self.king | self.knights | self.villagers | self.assassins
+
+    @classmethod
+    def fromstate(cls, visible, hidden=None, rules=None):
+        '''Build a bitboard from the visible (and optionally hidden) dictionaries of a state.
+
+        The actions are checked against the RuleTables rules, the standard
+        rules of the board of visible by default.'''
+        bb = cls()
+        if rules is None:
+            rules = _rules(tuple(map(tuple, visible['board'])), tuple(map(tuple, visible['castle'])))
+        bb.rules = rules
+        people = visible['people']
+        villagers = set(visible['arrested'])
+        if hidden is not None and hidden['assassins'] is not None:
+            villagers |= set(hidden['assassins'])
+        for row in people:
+            villagers.update(p for p in row if p is not None and p not in FIXED_NAMES)
+        bb.names = FIXED_NAMES + tuple(sorted(villagers))
+        index = {name: i for i, name in enumerate(bb.names)}
+        for x in range(SIZE):
+            for y in range(SIZE):
+                c = cell(x, y)
+                if visible['board'][x][y] == 'R':
+                    bb.roofs |= 1 << c
+                p = people[x][y]
+                if p is not None:
+                    bb._place(c, index[p])
+        bb.castle = [tuple(door) for door in visible['castle']]
+        for x, y, d in bb.castle:
+            bb.doors |= shift(1 << cell(x, y), d)
+        bb.health = visible['king']
+        bb.card = visible['card']
+        bb.arrested = list(visible['arrested'])
+        bb.killed = dict(visible['killed'])
+        if hidden is not None:
+            bb.cards = list(hidden['cards'])
+            bb.hidden = None if hidden['assassins'] is None else set(hidden['assassins'])
+        return bb
+
+    def tostate(self):
+        '''Convert back to the (visible, hidden) dictionaries used by KingAndAssassinsState.'''
+        people = [[self.names[self.ids[cell(x, y)]] for y in range(SIZE)] for x in range(SIZE)]
+        board = tuple(
+            tuple('R' if self.roofs >> cell(x, y) & 1 else 'G' for y in range(SIZE))
+            for x in range(SIZE)
+        )
+        visible = {
+            'board': board,
+            'people': people,
+            'castle': list(self.castle),
+            'card': self.card,
+            'king': self.health,
+            'lastopponentmove': [],
+            'arrested': list(self.arrested),
+            'killed': dict(self.killed)
+        }
+        hidden = None
+        if self.cards is not None:
+            hidden = {
+                'assassins': None if self.hidden is None else set(self.hidden),
+                'cards': list(self.cards)
+            }
+        return visible, hidden
+
+    def _place(self, c, id):
+        bit = 1 << c
+        self.ids[c] = id
+        if id == KING:
+            self.king |= bit
+        elif id == KNIGHT:
+            self.knights |= bit
+        elif id == ASSASSIN:
+            self.assassins |= bit
+        else:
+            self.villagers |= bit
+
+    def _clear(self, c):
+        bit = ~(1 << c)
+        self.ids[c] = EMPTY
+        self.king &= bit
+        self.knights &= bit
+        self.villagers &= bit
+        self.assassins &= bit
+
+    def _target(self, move):
+        x, y, d = int(move[1]), int(move[2]), move[3]
+        if not (0 <= x < SIZE and 0 <= y < SIZE) or d not in DIRECTIONS:
+            raise game.InvalidMoveException('{}: invalid position or direction'.format(move))
+        c = cell(x, y)
+        t = neighbour(c, d)
+        if t < 0:
+            raise game.InvalidMoveException('{}: cannot go off the board'.format(move))
+        return c, t
+
+    def _kind(self, c):
+        return min(self.ids[c], VILLAGER)
+
+    def _chain(self, move, c, t):
+        # Cells of the people pushed by a knight moving from c to t, followed by the free cell they are pushed to
+        chain, reason = self.rules.push(self._kind, c, DIR_INDEX[move[3]])
+        if chain is None:
+            raise game.InvalidMoveException('{}: {}'.format(move, reason))
+        return chain
+
+    def validate(self, move, player):
+        '''Check that a single action can be applied, raise InvalidMoveException otherwise.'''
+        rules = self.rules
+        action = move[0]
+        if action not in rules.actor:
+            raise game.InvalidMoveException('{}: unknown action'.format(move))
+        if action == 'reveal':
+            if not rules.allowed['reveal'][player]:
+                raise game.InvalidMoveException('raise action only possible for player 0')
+            c = cell(int(move[1]), int(move[2]))
+            if not rules.actor['reveal'][player][self._kind(c)] or self.hidden is None or self.names[self.ids[c]] not in self.hidden:
+                raise game.InvalidMoveException('{}: the specified villager is not an assassin'.format(move))
+            return
+        if not rules.allowed[action][player]:
+            raise game.InvalidMoveException('{} action only possible for player {}'.format(action, 1 - player))
+        c, t = self._target(move)
+        kind, tkind = self._kind(c), self._kind(t)
+        if action == 'move':
+            if kind == EMPTY:
+                raise game.InvalidMoveException('{}: there is no one to move'.format(move))
+            if not rules.target['move'][kind][tkind]:
+                raise game.InvalidMoveException('{}: cannot move on a cell that is not free'.format(move))
+            if kind == KING and not rules.kingstep[c][DIR_INDEX[move[3]]]:
+                raise game.InvalidMoveException('{}: the king cannot move on a roof'.format(move))
+            if not rules.actor['move'][player][kind]:
+                if player != 0:
+                    raise game.InvalidMoveException('{}: villagers and assassins can only be moved by player 0'.format(move))
+                raise game.InvalidMoveException('{}: the king and knights can only be moved by player 1'.format(move))
+            if tkind != EMPTY:
+                self._chain(move, c, t)
+            return
+        if not rules.actor[action][player][kind]:
+            if action == 'kill' and kind in (ASSASSIN, KNIGHT):
+                raise game.InvalidMoveException('{}: kill action for {} only possible for player {}'.format(move, FIXED_NAMES[kind], 1 - player))
+            if action != 'kill':
+                raise game.InvalidMoveException('{}: the attacker is not {}'.format(move, 'a knight' if action == 'arrest' else 'an assassin'))
+        if action == 'arrest':
+            if not rules.target['arrest'][kind][tkind]:
+                raise game.InvalidMoveException('{}: only villagers can be arrested'.format(move))
+        elif action == 'kill':
+            if tkind == EMPTY:
+                raise game.InvalidMoveException('{}: there is no one to kill'.format(move))
+            if not rules.target['kill'][kind][tkind] or not rules.actor['kill'][player][kind]:
+                raise game.InvalidMoveException('{}: forbidden kill'.format(move))
+        elif not rules.target['attack'][kind][tkind]:
+            raise game.InvalidMoveException('{}: only the king can be attacked'.format(move))
+
+    def apply(self, move, player):
+        '''Validate and apply a single action.'''
+        self.validate(move, player)
+        kind = move[0]
+        if kind == 'reveal':
+            c = cell(int(move[1]), int(move[2]))
+            self._clear(c)
+            self._place(c, ASSASSIN)
+            return
+        c, t = self._target(move)
+        if kind == 'move':
+            # A knight moving on an occupied cell pushes the chain of people in front of it
+            if self.ids[t] != EMPTY:
+                chain = self._chain(move, c, t)
+                for dst, src in zip(reversed(chain), reversed(chain[:-1])):
+                    self._place(dst, self.ids[src])
+                    self._clear(src)
+            id = self.ids[c]
+            self._clear(c)
+            self._place(t, id)
+        elif kind == 'arrest':
+            self.arrested.append(self.names[self.ids[t]])
+            self._clear(t)
+        elif kind == 'kill':
+            self.killed[KILLED[self._kind(t)]] += 1
+            self._clear(t)
+        elif kind == 'attack':
+            self.health = 'injured' if self.health == 'healthy' else 'dead'
+
+    def update(self, moves, player):
+        for move in moves:
+            self.apply(move, player)
+        if player == 0:
+            self.card = self.cards.pop()
+
+    def winner(self):
+        if self.king & self.doors:
+            return 1
+        if self.cards is not None and len(self.cards) == 0:
+            return 0
+        if self.health == 'dead':
+            return 0
+        if self.hidden is not None:
+            if self.killed['assassins'] + len(set(self.arrested) & self.hidden) == 3:
+                return 1
+        return -1
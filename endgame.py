@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+# endgame.py
+# Endgame tablebase of the king against one or two revealed assassins
+# Run with: python endgame.py [--assassins 1 2] [--output endgame.tb]
+#
+# Every position of the king and the assassins is solved by backward
+# induction over the turns left, for each AP the cards give to the king and
+# to the assassins. A position is keyed by the cells of the pieces, the
+# health of the king and the phase of the turn, the phase telling who plays
+# and how many AP they have left. The assassins win when the cards run out,
+# so a position is stored as the number of turns the king needs after the
+# current one to force his way into the castle: he wins it if at least that
+# many cards are left after the current one.
+#
+# The results are not exact: the tables assume the APs of the current card
+# for the rest of the game, and the villagers are static blockers, the
+# assassins' team only moving the assassins. The villagers only ever help
+# the assassins, who may leave them still, so a win of the assassins found
+# with them still is a win; for the king it may not be, and play() leaves
+# those positions to the search, as it does every position with a knight.
+# The empty-board tables are built offline, the tables of a board with
+# blockers are solved the first time they are probed (for one assassin only,
+# two take seconds).
+#
+# File format: MAGIC, the number of tables (u8) and for each one the number
+# of assassins, the AP of the king and of the assassins (u8) and the offset
+# of the table (u32), then the tables. A table has one byte per position,
+# the turns the king needs or NEVER, and is cut into blocks of BLOCK
+# positions compressed with zlib: it starts with the offsets of its blocks
+# and of their end (u32 each). Only the ground cells are counted for the
+# king and the two assassins are an unordered pair, so the tables hold about
+# a third of the naive placements.
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import zlib
+from collections import OrderedDict
+
+from rules import RuleTables, CELLS, DIRS, OFF
+
+MAGIC = b'KATB\x02'
+ENTRY = '>BBBI'
+OFFSET = struct.Struct('>I')
+DEFAULT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'endgame.tb')
+
+# Results of a probe, for the player to move
+WIN, LOSS = 1, -1
+
+# Turns the king needs in a position he cannot win
+NEVER = 255
+
+# Most turns of the king after the current one, a game has 15 cards and the
+# first one is drawn before his first turn
+TURNS = 14
+
+# Positions of a compressed block, and blocks kept decompressed
+BLOCK = 4096
+BLOCKS = 64
+
+# Most assassins of the tables solved when first probed, and tables kept
+SOLVED = 1
+CAPACITY = 16
+
+HEALTH = {'injured': 0, 'healthy': 1}
+
+
+def pairs(count):
+    '''Number of unordered placements of count assassins.'''
+    return CELLS if count == 1 else CELLS * (CELLS - 1) // 2
+
+
+def placement(cells):
+    '''Index of the unordered placement of the assassins on cells.'''
+    if len(cells) == 1:
+        return cells[0]
+    a, b = sorted(cells)
+    return b * (b - 1) // 2 + a
+
+
+class Geometry:
+    '''Class numbering the positions of a board.
+
+    A position is (health, phase, king, assassins), the phases 0 to
+    assassinap - 1 are those of the assassins' turn and the next kingap
+    ones those of the king's turn.'''
+
+    def __init__(self, board, castle):
+        self.rules = RuleTables(board, castle)
+        self.grounds = tuple(c for c in range(CELLS) if board[c // 10][c % 10] == 'G')
+        self.ground = {c: i for i, c in enumerate(self.grounds)}
+        self.doors = frozenset(self.rules.step(x, y, d) for x, y, d in castle)
+
+    def size(self, count, kingap, assassinap):
+        return 2 * (kingap + assassinap) * len(self.grounds) * pairs(count)
+
+    def index(self, count, kingap, assassinap, health, phase, king, assassins):
+        return ((health * (kingap + assassinap) + phase) * len(self.grounds) + self.ground[king]) * pairs(count) + placement(assassins)
+
+    def phase(self, player, ap, kingap, assassinap):
+        '''Phase of a turn of player with ap left.'''
+        return assassinap - ap if player == 0 else assassinap + kingap - ap
+
+    def actions(self, health, phase, king, assassins, kingap, assassinap, blockers=frozenset()):
+        '''Actions of the player to move, as (action, result) pairs.
+
+        result is the next (health, phase, king, assassins) position, or WIN
+        when the action wins the game. No piece moves on the cells of
+        blockers. END is the last action.'''
+        neighbour = self.rules.neighbour
+        if phase < assassinap:
+            following = phase + 1 if phase + 1 < assassinap else assassinap
+            for i, a in enumerate(assassins):
+                for d, t in zip(DIRS, neighbour[a]):
+                    if t != OFF and t != king and t not in assassins and t not in blockers:
+                        moved = assassins[:i] + (t,) + assassins[i + 1:]
+                        yield ('move',) + divmod(a, 10) + (d,), (health, following, king, moved)
+                for d, t in zip(DIRS, neighbour[a]):
+                    if t == king:
+                        action = ('attack',) + divmod(a, 10) + (d,)
+                        yield action, WIN if health == 0 else (health - 1, following, king, assassins)
+            yield ('end',), (health, assassinap, king, assassins)
+        else:
+            following = phase + 1 if phase + 1 < assassinap + kingap else 0
+            for d, t, step in zip(DIRS, neighbour[king], self.rules.kingstep[king]):
+                if step and t not in assassins and t not in blockers:
+                    action = ('move',) + divmod(king, 10) + (d,)
+                    yield action, WIN if t in self.doors else (health, following, t, assassins)
+            yield ('end',), (health, 0, king, assassins)
+
+
+class Tablebase:
+    '''Class representing a tablebase file.
+
+    The file is mapped in memory on the first probe, a missing file gives
+    an empty tablebase. A probe reads one byte of a block, the block being
+    decompressed on its first read.'''
+
+    def __init__(self, board, castle, path=DEFAULT):
+        self.board = board
+        self.castle = castle
+        self.path = path
+        self._geometry = None
+        self._tables = None
+        self._map = None
+        self._blocks = OrderedDict()
+        self._solved = OrderedDict()
+
+    def _load(self):
+        self._geometry = Geometry(self.board, self.castle)
+        self._tables = {}
+        try:
+            with open(self.path, 'rb') as file:
+                self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError('{}: not a tablebase'.format(self.path))
+        count = self._map[len(MAGIC)]
+        for t in range(count):
+            start = len(MAGIC) + 1 + t * struct.calcsize(ENTRY)
+            assassins, kingap, assassinap, offset = struct.unpack_from(ENTRY, self._map, start)
+            self._tables[assassins, kingap, assassinap] = offset
+
+    def tables(self):
+        if self._tables is None:
+            self._load()
+        return sorted(self._tables)
+
+    def _entry(self, offset, i):
+        # Byte i of the table at offset, through the cache of decompressed blocks
+        block = i // BLOCK
+        data = self._blocks.get((offset, block))
+        if data is None:
+            start, = OFFSET.unpack_from(self._map, offset + block * OFFSET.size)
+            end, = OFFSET.unpack_from(self._map, offset + (block + 1) * OFFSET.size)
+            data = self._blocks[offset, block] = zlib.decompress(self._map[start:end])
+            if len(self._blocks) > BLOCKS:
+                self._blocks.popitem(last=False)
+        else:
+            self._blocks.move_to_end((offset, block))
+        return data[i % BLOCK]
+
+    def _reader(self, key, blockers):
+        # Function giving the bytes of the table of key with blockers, None if there is none
+        if self._tables is None:
+            self._load()
+        if not blockers and key in self._tables:
+            offset = self._tables[key]
+            return lambda i: self._entry(offset, i)
+        if key[0] > SOLVED:
+            return None
+        table = self._solved.get((key, blockers))
+        if table is None:
+            try:
+                table = solve(self._geometry, *key, blockers)
+            except ImportError:
+                # Without NumPy, only the tables of the file are probed
+                return None
+            self._solved[key, blockers] = table
+            if len(self._solved) > CAPACITY:
+                self._solved.popitem(last=False)
+        else:
+            self._solved.move_to_end((key, blockers))
+        return table.__getitem__
+
+    def probe(self, king, assassins, health, player, ap, card, cardsleft, blockers=()):
+        '''Result of a position for player to move with ap left, as a (result, turns) pair.
+
+        king, assassins and blockers are coordinates, health is 'healthy' or
+        'injured', card is the current card and cardsleft the number of cards
+        not drawn yet. turns is the number of turns the king needs after the
+        current one to win, None if he cannot. Returns None if there is no
+        table for the position.'''
+        key = (len(assassins), int(card[0]), int(card[3]))
+        reader = self._reader(key, frozenset(x * 10 + y for x, y in blockers))
+        if reader is None:
+            return None
+        g = self._geometry
+        king = king[0] * 10 + king[1]
+        assassins = tuple(x * 10 + y for x, y in assassins)
+        if king not in g.ground:
+            return None
+        turns = reader(g.index(key[0], key[1], key[2], HEALTH[health], g.phase(player, ap, key[1], key[2]), king, assassins))
+        kingwins = turns <= cardsleft - 1
+        return (WIN if kingwins == (player == 1) else LOSS), (None if turns == NEVER else turns)
+
+    def play(self, visible, player, cardsleft, assassins=()):
+        '''Best turn of player on visible if it is an endgame of the tablebase, None otherwise.
+
+        cardsleft is the number of cards not drawn yet and assassins the
+        names of the hidden assassins of player 0. Only the positions the
+        tables are sound for are played, those without a knight and, for the
+        king, without a villager, and only when player wins them: the king
+        plays the fastest win and the assassins make the king need more
+        turns than there are cards left, killing him if they can.'''
+        if visible['card'] is None or cardsleft < 1:
+            return None
+        king, revealed, blockers = None, [], set()
+        for x, row in enumerate(visible['people']):
+            for y, name in enumerate(row):
+                if name == 'king':
+                    king = x * 10 + y
+                elif name == 'assassin':
+                    revealed.append(x * 10 + y)
+                elif name == 'knight':
+                    # A knight may arrest, kill or push, which the tables do not model
+                    return None
+                elif name is not None:
+                    # A hidden assassin may still reveal itself, and the villagers the
+                    # king's opponent moves may block him where the tables keep them still
+                    if name in assassins or player == 1:
+                        return None
+                    blockers.add(x * 10 + y)
+        card = visible['card']
+        key = (len(revealed), int(card[0]), int(card[3]))
+        blockers = frozenset(blockers)
+        reader = self._reader(key, blockers) if revealed else None
+        if reader is None or king is None or king not in self._geometry.ground:
+            return None
+        g = self._geometry
+        _, kingap, assassinap = key
+        position = (HEALTH[visible['king']], g.phase(player, card[0] if player == 1 else card[3], kingap, assassinap), king, tuple(revealed))
+        # A lost position is left to the search, which may use the pieces the tables keep still
+        if (reader(g.index(*key, *position)) <= cardsleft - 1) != (player == 1):
+            return None
+        turn = []
+        while (position[1] < assassinap) == (player == 0):
+            best, bestkey = None, None
+            for action, result in g.actions(*position, kingap, assassinap, blockers):
+                if result == WIN:
+                    turns = -1 if player == 1 else NEVER + 1
+                else:
+                    health, phase, k, a = result
+                    turns = reader(g.index(*key, health, phase, k, a))
+                    # The assassins' turn ends with a card drawn, the king then needs one turn less
+                    if player == 0 and phase >= assassinap and turns != NEVER:
+                        turns += 1
+                # The king needs as few turns as possible, the assassins make it as many as they can
+                rank = turns if player == 1 else -turns
+                if bestkey is None or rank < bestkey:
+                    best, bestkey = (action, result), rank
+            action, result = best
+            if action == ('end',):
+                break
+            turn.append(action)
+            if result == WIN:
+                break
+            position = result
+        return turn
+
+
+def solve(geometry, count, kingap, assassinap, blockers=frozenset(), turns=TURNS):
+    '''Table of the positions with count assassins for a card with kingap and assassinap, as bytes.
+
+    The positions are solved once for each number of turns the king has
+    after the current one, from none to turns: the turns of each side are
+    solved from their last phase to their first, the king winning if one of
+    his actions wins and the assassins if all of theirs do. A position
+    stores the fewest turns the king wins it with, NEVER if he cannot.'''
+    import numpy as np
+
+    g = geometry
+    phases = kingap + assassinap
+    kings = np.array(g.grounds)
+    if count == 1:
+        placed = np.arange(CELLS)[:, None]
+    else:
+        placed = np.array([(a, b) for b in range(CELLS) for a in range(b)])
+    npos = len(g.grounds) * len(placed)
+    positions = np.arange(npos)
+    # Cells of the pieces of each placement, index = king * len(placed) + assassins
+    K = np.repeat(kings, len(placed))
+    A = np.tile(placed, (len(g.grounds), 1))
+    # The last cell stands for OFF
+    blocked = np.zeros(CELLS + 1, bool)
+    blocked[list(blockers)] = True
+    valid = (A != K[:, None]).all(axis=1) & ~blocked[K] & ~blocked[A].any(axis=1)
+    neighbour = np.array(g.rules.neighbour)
+    kingstep = np.array(g.rules.kingstep)
+    groundof = np.full(CELLS + 1, -1)
+    groundof[list(g.grounds)] = np.arange(len(g.grounds))
+    doors = np.zeros(CELLS + 1, bool)
+    doors[list(g.doors)] = True
+
+    def where(k, a):
+        # Placement index of the king on k and the assassins on the columns of a
+        if count == 1:
+            p = a[:, 0]
+        else:
+            lo, hi = np.minimum(a[:, 0], a[:, 1]), np.maximum(a[:, 0], a[:, 1])
+            p = hi * (hi - 1) // 2 + lo
+        return groundof[k] * len(placed) + p
+
+    # Actions of the placements: (target placement or -1 if illegal, attack or door) for each slot
+    amoves, kmoves = [], []
+    for i in range(count):
+        for d in range(len(DIRS)):
+            t = neighbour[A[:, i], d]
+            legal = valid & (t != OFF) & (t != K) & ~blocked[t]
+            for j in range(count):
+                if j != i:
+                    legal &= t != A[:, j]
+            moved = A.copy()
+            moved[:, i] = np.where(legal, t, 0)
+            amoves.append((np.where(legal, where(K, moved), -1), False))
+        near = valid & (neighbour[A[:, i]] == K[:, None]).any(axis=1)
+        amoves.append((np.where(near, positions, -1), True))
+    for d in range(len(DIRS)):
+        t = neighbour[K, d]
+        legal = valid & kingstep[K, d] & ~blocked[t]
+        for j in range(count):
+            legal &= t != A[:, j]
+        door = legal & doors[t]
+        step = legal & ~door
+        kmoves.append((np.where(step, where(np.where(step, t, K), A), -1), door))
+
+    table = np.full((2, phases, npos), NEVER, np.uint8)
+    # Whether the king wins at the start of his next turn, never once the cards have run out
+    start = np.zeros((2, npos), bool)
+    previous = None
+    for left in range(turns + 1):
+        wins = np.zeros((2, phases, npos), bool)
+        for phase in reversed(range(assassinap)):
+            for health in range(2):
+                def after(h):
+                    return wins[h, phase + 1] if phase + 1 < assassinap else start[h]
+                # Ending the turn gives the same position to the king
+                won = valid & start[health]
+                for target, attack in amoves:
+                    legal = target >= 0
+                    if attack and health == 0:
+                        won &= ~legal
+                    else:
+                        won &= ~legal | after(health - 1 if attack else health)[np.maximum(target, 0)]
+                wins[health, phase] = won
+        for phase in reversed(range(assassinap, phases)):
+            for health in range(2):
+                after = wins[health, phase + 1] if phase + 1 < phases else wins[health, 0]
+                won = valid & wins[health, 0]
+                for target, door in kmoves:
+                    won |= door | (target >= 0) & after[np.maximum(target, 0)]
+                wins[health, phase] = won
+        table[wins & (table == NEVER)] = left
+        # The positions won with one more turn stay the same once they stop growing
+        if previous is not None and (wins == previous).all():
+            break
+        previous = wins
+        start = wins[:, assassinap]
+    return table.tobytes()
+
+
+def encodetables(tables):
+    '''Encode a {(assassins, kingap, assassinap): table} dictionary.'''
+    data = bytearray(MAGIC)
+    data.append(len(tables))
+    offset = len(MAGIC) + 1 + len(tables) * struct.calcsize(ENTRY)
+    blocks = {}
+    for key, table in sorted(tables.items()):
+        data += struct.pack(ENTRY, *key, offset)
+        blocks[key] = [zlib.compress(table[i:i + BLOCK], 9) for i in range(0, len(table), BLOCK)]
+        offset += (len(blocks[key]) + 1) * OFFSET.size + sum(len(block) for block in blocks[key])
+    for key in sorted(tables):
+        start = len(data) + (len(blocks[key]) + 1) * OFFSET.size
+        for block in blocks[key]:
+            data += OFFSET.pack(start)
+            start += len(block)
+        data += OFFSET.pack(start)
+        for block in blocks[key]:
+            data += block
+    return bytes(data)
+
+
+def build(board, castle, counts=(1,), cards=()):
+    '''Solve the tables of every number of assassins in counts for every (kingap, assassinap) of the cards.'''
+    geometry = Geometry(board, castle)
+    aps = sorted({(card[0], card[3]) for card in cards})
+    return {(count, k, a): solve(geometry, count, k, a) for count in counts for k, a in aps}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='King & Assassins endgame tablebase builder')
+    parser.add_argument('--assassins', help='numbers of assassins of the tables (default: 1)', type=int, nargs='+', choices=(1, 2), default=[1])
+    parser.add_argument('--output', help='tablebase file to write (default: {})'.format(DEFAULT), default=DEFAULT)
+    args = parser.parse_args()
+
+    from kingandassassins import BOARD, CARDS, KA_INITIAL_STATE
+    tables = build(BOARD, KA_INITIAL_STATE['castle'], args.assassins, CARDS)
+    data = encodetables(tables)
+    with open(args.output, 'wb') as file:
+        file.write(data)
+    summary = {'bytes': len(data)}
+    for key, table in sorted(tables.items()):
+        summary['{}-{}-{}'.format(*key)] = {
+            'won': sum(1 for v in table if v != NEVER), 'positions': len(table)
+        }
+    print(json.dumps(summary, indent=2))
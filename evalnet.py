@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# evalnet.py
+# Learned evaluation of King & Assassins positions
+# Run with: python evalnet.py games.log [more.log ...] [--output evalnet.npz]
+#
+# A position is encoded as feature planes over the board, and a small
+# network gives the probability that the assassins win (value) and a
+# distribution over the (cell, direction) of the next action (policy). The
+# network is trained on the games of self-play logs (see gamelog.py) and
+# evaluates positions by batches, so that a search can evaluate many leaves
+# with one matrix product. An Evaluator puts a transposition table keyed by
+# the Zobrist hash of the state in front of it.
+
+import argparse
+import json
+import os
+import numpy as np
+
+from kingandassassins import BOARD, CARDS, KNIGHTS, POPULATION, KA_INITIAL_STATE, RULES
+from rules import DIRS, DIR_INDEX, OFF
+from zobrist import KEYS, TranspositionTable
+
+SIZE = 10
+CELLS = SIZE * SIZE
+DEFAULT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'evalnet.npz')
+
+# Feature planes of a position, the last ones are constant planes holding a scalar
+PLANES = (
+    'king', 'knight', 'assassin', 'villager', 'roof', 'door',
+    'injured', 'kingap', 'knightap', 'fetter', 'populationap',
+    'arrested', 'killedknights', 'killedassassins', 'player'
+)
+PIECES = {'king': 0, 'knight': 1, 'assassin': 2}
+FEATURES = len(PLANES) * CELLS
+# Policy outputs, the action of the piece on cell c in direction DIRS[i] is c * len(DIRS) + i
+ACTIONS = CELLS * len(DIRS)
+
+# Scales of the scalar planes, so that every feature is between 0 and 1
+SCALES = (
+    max(card[0] for card in CARDS), max(card[1] for card in CARDS), 1, max(card[3] for card in CARDS),
+    len(POPULATION), len(KNIGHTS), 3
+)
+
+# Buckets of the transposition table of an Evaluator, as a power of two
+BITS = 12
+
+
+def _static():
+    planes = np.zeros((2, SIZE, SIZE), np.float32)
+    for x in range(SIZE):
+        for y in range(SIZE):
+            planes[0, x, y] = BOARD[x][y] == 'R'
+    for x, y, d in KA_INITIAL_STATE['castle']:
+        t = RULES.step(x, y, d)
+        if t != OFF:
+            planes[1, t // SIZE, t % SIZE] = 1
+    return planes
+
+
+STATIC = _static()
+
+
+def encode(visible, player):
+    '''Feature planes of a visible state with player to move, as a PLANES x 10 x 10 array.'''
+    planes = np.zeros((len(PLANES), SIZE, SIZE), np.float32)
+    for x, row in enumerate(visible['people']):
+        for y, name in enumerate(row):
+            if name is not None:
+                planes[PIECES.get(name, 3), x, y] = 1
+    planes[4:6] = STATIC
+    card = visible['card'] or (0, 0, False, 0)
+    killed = visible['killed']
+    scalars = (
+        visible['king'] == 'injured', card[0], card[1], bool(card[2]), card[3],
+        len(visible['arrested']), killed['knights'], killed['assassins']
+    )
+    planes[6] = scalars[0]
+    for i, (value, scale) in enumerate(zip(scalars[1:], SCALES)):
+        planes[7 + i] = value / scale
+    planes[14] = player
+    return planes
+
+
+def actionindex(action):
+    '''Index of an action in the policy, None for the actions without a direction.'''
+    if len(action) < 4:
+        return None
+    return (int(action[1]) * SIZE + int(action[2])) * len(DIRS) + DIR_INDEX[action[3]]
+
+
+def _sigmoid(z):
+    return 1 / (1 + np.exp(-np.clip(z, -30, 30)))
+
+
+def _softmax(z):
+    z = z - z.max(axis=1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=1, keepdims=True)
+
+
+class EvalNet:
+    '''Class representing the value/policy network.
+
+    One hidden layer of ReLU units feeds a sigmoid value head and a softmax
+    policy head. Inputs are batches of encoded positions.'''
+
+    def __init__(self, hidden=64, seed=0):
+        rng = np.random.default_rng(seed)
+        self.params = {
+            'w1': (rng.standard_normal((FEATURES, hidden)) * np.sqrt(2 / FEATURES)).astype(np.float32),
+            'b1': np.zeros(hidden, np.float32),
+            'wv': (rng.standard_normal((hidden, 1)) * np.sqrt(1 / hidden)).astype(np.float32),
+            'bv': np.zeros(1, np.float32),
+            'wp': (rng.standard_normal((hidden, ACTIONS)) * np.sqrt(1 / hidden)).astype(np.float32),
+            'bp': np.zeros(ACTIONS, np.float32)
+        }
+
+    @classmethod
+    def load(cls, path=DEFAULT):
+        net = cls.__new__(cls)
+        with np.load(path) as data:
+            net.params = {name: data[name] for name in data.files}
+        return net
+
+    def save(self, path=DEFAULT):
+        # np.savez adds .npz to names without it, the file is written under a temporary name and renamed
+        temp = path + '.tmp.npz'
+        np.savez(temp, **self.params)
+        os.replace(temp, path)
+
+    def _hidden(self, x):
+        p = self.params
+        return np.maximum(x.reshape(len(x), -1) @ p['w1'] + p['b1'], 0)
+
+    def forward(self, x):
+        '''Values and policies of a batch of encoded positions, as arrays of shape (n,) and (n, ACTIONS).'''
+        p = self.params
+        h = self._hidden(x)
+        return _sigmoid(h @ p['wv'] + p['bv'])[:, 0], _softmax(h @ p['wp'] + p['bp'])
+
+    def train(self, x, values, actions, epochs=10, batch=256, rate=1e-3, seed=0):
+        '''Fit the network with Adam and return the loss of each epoch.
+
+        values are the targets of the value head (1 when the assassins won)
+        and actions the indices of the actions played, -1 for the positions
+        whose action has no direction. The loss is the binary cross-entropy
+        of the value plus the cross-entropy of the policy.'''
+        rng = np.random.default_rng(seed)
+        x = x.reshape(len(x), -1)
+        p = self.params
+        moments = {name: (np.zeros_like(w), np.zeros_like(w)) for name, w in p.items()}
+        beta1, beta2, eps = 0.9, 0.999, 1e-8
+        step = 0
+        losses = []
+        for epoch in range(epochs):
+            order = rng.permutation(len(x))
+            total = 0.0
+            for start in range(0, len(x), batch):
+                rows = order[start:start + batch]
+                xb, vb, ab = x[rows], values[rows], actions[rows]
+                n = len(rows)
+                pre = xb @ p['w1'] + p['b1']
+                h = np.maximum(pre, 0)
+                v = _sigmoid(h @ p['wv'] + p['bv'])[:, 0]
+                pol = _softmax(h @ p['wp'] + p['bp'])
+                mask = ab >= 0
+                target = np.zeros_like(pol)
+                target[np.nonzero(mask)[0], ab[mask]] = 1
+                total += float(-np.sum(vb * np.log(v + 1e-7) + (1 - vb) * np.log(1 - v + 1e-7)))
+                total += float(-np.sum(np.log(pol[mask, ab[mask]] + 1e-7)))
+                dv = ((v - vb) / n)[:, None].astype(np.float32)
+                dp = ((pol - target) * mask[:, None] / n).astype(np.float32)
+                dh = (dv @ p['wv'].T + dp @ p['wp'].T) * (pre > 0)
+                grads = {
+                    'wv': h.T @ dv, 'bv': dv.sum(axis=0),
+                    'wp': h.T @ dp, 'bp': dp.sum(axis=0),
+                    'w1': xb.T @ dh, 'b1': dh.sum(axis=0)
+                }
+                step += 1
+                for name, g in grads.items():
+                    m, s = moments[name]
+                    m *= beta1
+                    m += (1 - beta1) * g
+                    s *= beta2
+                    s += (1 - beta2) * g * g
+                    mhat = m / (1 - beta1 ** step)
+                    shat = s / (1 - beta2 ** step)
+                    p[name] -= (rate * mhat / (np.sqrt(shat) + eps)).astype(np.float32)
+            losses.append(total / len(x))
+        return losses
+
+
+class Evaluator:
+    '''Class evaluating states with a network by batches, through a transposition table.
+
+    The table has 2 ** (bits + 1) entries keyed by the Zobrist hash of the
+    state, the player to move and the card (see zobrist.py).'''
+
+    def __init__(self, network, bits=BITS):
+        self.network = network
+        self.hits = 0
+        self.misses = 0
+        self._table = TranspositionTable(bits)
+
+    @staticmethod
+    def key(state, player):
+        key = state.zobrist() ^ KEYS.card(state._state['visible']['card'])
+        # The hash has the side key of the player to move, the network may be asked about the other one
+        return key if player == state._tomove else key ^ KEYS.side
+
+    def evaluate(self, positions):
+        '''(value, policy) of each (key, planes) pair, planes being given by encode().'''
+        table = self._table
+        results = [None] * len(positions)
+        missing = {}
+        for i, (key, planes) in enumerate(positions):
+            entry = table.probe(key)
+            if entry is not None:
+                results[i] = entry[1]
+                self.hits += 1
+            else:
+                missing.setdefault(key, []).append(i)
+        if missing:
+            self.misses += len(missing)
+            keys = list(missing)
+            values, policies = self.network.forward(np.stack([positions[missing[key][0]][1] for key in keys]))
+            for key, value, policy in zip(keys, values, policies):
+                result = (float(value), policy)
+                for i in missing[key]:
+                    results[i] = result
+                # Every evaluation is as deep, the newest one takes the slot of the deepest
+                table.store(key, 0, result)
+        return results
+
+    def evaluatestates(self, states, players):
+        '''(value, policy) of each state with the given player to move.'''
+        return self.evaluate([(self.key(s, p), encode(s._state['visible'], p)) for s, p in zip(states, players)])
+
+
+def examples(records):
+    '''Encoded positions, values and actions of the finished games of records.
+
+    Every action of every turn gives one example: the position before it,
+    whether the assassins won the game and the index of the action.'''
+    from gamelog import Replay
+    x, values, actions = [], [], []
+    for record in records:
+        if record.winner is None:
+            continue
+        replay = Replay(record)
+        for turn in range(1, len(replay)):
+            player = turn % 2
+            state = replay.state(turn)
+            for action in record.turns[turn]:
+                x.append(encode(state._state['visible'], player))
+                values.append(1.0 - record.winner)
+                index = actionindex(action)
+                actions.append(-1 if index is None else index)
+                state._apply(action, player)
+    return np.array(x, np.float32), np.array(values, np.float32), np.array(actions, np.int64)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='King & Assassins evaluation network trainer')
+    parser.add_argument('logs', help='self-play game logs to train on', nargs='+')
+    parser.add_argument('--output', help='weights file to write (default: {})'.format(DEFAULT), default=DEFAULT)
+    parser.add_argument('--hidden', help='hidden units (default: 64)', type=int, default=64)
+    parser.add_argument('--epochs', help='passes over the positions (default: 10)', type=int, default=10)
+    parser.add_argument('--rate', help='learning rate (default: 0.001)', type=float, default=1e-3)
+    parser.add_argument('--seed', help='seed of the initial weights and of the batches (default: 0)', type=int, default=0)
+    args = parser.parse_args()
+
+    from gamelog import GameReader
+    parts = []
+    for path in args.logs:
+        with GameReader(path) as reader:
+            parts.append(examples(reader))
+    x, values, actions = (np.concatenate(arrays) for arrays in zip(*parts))
+    net = EvalNet(args.hidden, args.seed)
+    losses = net.train(x, values, actions, args.epochs, rate=args.rate, seed=args.seed)
+    net.save(args.output)
+    print(json.dumps({'positions': len(x), 'losses': [round(loss, 4) for loss in losses]}))
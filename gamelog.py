@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# gamelog.py
+# Append-only log of played games and replay of any of their turns
+#
+# A log file starts with MAGIC and is followed by one record per game: a u32
+# length and a body made of
+#   u8   winner (0xff if unknown)
+#   12 B villager of each cell of sorted(VILLAGERS), as an index in NAMES
+#   15 B cards of the deck, as indexes in CARDS (the last one is drawn first)
+#   3 B  assassins, as indexes in NAMES
+#   u16  number of turns
+# and then, for each call to update(), the number of actions (u16) and the
+# actions in the two-byte encoding of protocol.py. Turn i is played by player
+# i % 2, turn 0 being the empty turn of the assassins drawing the first card.
+
+import argparse
+import json
+import mmap
+import os
+import struct
+
+from kingandassassins import CARDS, KA_INITIAL_STATE, POPULATION, TEMPLATE, VILLAGERS, KingAndAssassinsState
+from protocol import encodeactions, decodeactions
+
+MAGIC = b'KAGL\x02'
+LENGTH = struct.Struct('>I')
+HEADER = struct.Struct('>B12s15s3sH')
+COUNT = struct.Struct('>H')
+# Winner or assassins not known yet
+UNSET = 0xff
+
+NAMES = tuple(sorted(POPULATION))
+CELLS = tuple(sorted(VILLAGERS))
+
+
+class GameRecord:
+    '''Class representing one logged game.
+
+    The turns are only decoded when they are first used, so that scanning
+    the headers of many records stays cheap.'''
+
+    def __init__(self, winner, layout, cards, assassins, turns):
+        self.winner = winner
+        self.layout = layout
+        self.cards = cards
+        self.assassins = assassins
+        self._turns = turns
+
+    @classmethod
+    def fromstate(cls, state):
+        '''Start the record of a game from its initial server-side state.'''
+        people = state._state['visible']['people']
+        layout = bytes(NAMES.index(people[x][y]) for x, y in CELLS)
+        cards = bytes(CARDS.index(card) for card in state._state['hidden']['cards'])
+        return cls(None, layout, cards, None, [])
+
+    @classmethod
+    def decode(cls, data):
+        winner, layout, cards, assassins, count = HEADER.unpack_from(data)
+        if assassins[0] == UNSET:
+            assassins = None
+        return cls(None if winner == UNSET else winner, layout, cards, assassins, (data, count))
+
+    def encode(self):
+        assassins = self.assassins if self.assassins is not None else bytes([UNSET] * 3)
+        winner = UNSET if self.winner is None else self.winner
+        data = bytearray(HEADER.pack(winner, self.layout, self.cards, assassins, len(self.turns)))
+        for actions in self.turns:
+            data += COUNT.pack(len(actions))
+            data += encodeactions(actions)
+        return bytes(data)
+
+    @property
+    def turns(self):
+        if isinstance(self._turns, tuple):
+            data, count = self._turns
+            turns = []
+            i = HEADER.size
+            for turn in range(count):
+                n, = COUNT.unpack_from(data, i)
+                i += COUNT.size
+                turns.append(decodeactions(data[i:i + 2 * n]))
+                i += 2 * n
+            self._turns = turns
+        return self._turns
+
+    def setassassins(self, assassins):
+        self.assassins = bytes(NAMES.index(name) for name in sorted(assassins))
+
+    def addturn(self, actions):
+        '''Record the actions given to update() by the player of the next turn.'''
+        self.turns.append(list(actions))
+
+    def record(self, move):
+        '''Record a move just applied with playmove().'''
+        if isinstance(move, (str, bytes)):
+            move = json.loads(move)
+        if 'assassins' in move and self.assassins is None:
+            self.setassassins(move['assassins'])
+            self.addturn([])
+        else:
+            self.addturn(move['actions'])
+
+    def initialstate(self):
+        '''Build the state of the game before the assassins are chosen.'''
+        people = [list(row) for row in TEMPLATE]
+        for (x, y), name in zip(CELLS, self.layout):
+            people[x][y] = NAMES[name]
+        visible = dict(KA_INITIAL_STATE)
+        visible.update({
+            'people': people,
+            'castle': list(KA_INITIAL_STATE['castle']),
+            'lastopponentmove': [],
+            'arrested': [],
+            'killed': {'knights': 0, 'assassins': 0}
+        })
+        state = KingAndAssassinsState(visible)
+        state._state['hidden'] = {
+            'assassins': None,
+            'cards': [CARDS[card] for card in self.cards]
+        }
+        return state
+
+
+class GameLog:
+    '''Class representing a game log file opened for appending.
+
+    Every record is written with a single write, a crash can at worst leave
+    a truncated last record, which readers ignore.'''
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+            self._file.flush()
+
+    def append(self, record):
+        data = record.encode()
+        self._file.write(LENGTH.pack(len(data)) + data)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class GameReader:
+    '''Class reading a game log through a memory map.
+
+    Records are located by their offset in the file, index() lists them and
+    scan() only decodes their fixed-size header.'''
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError('{}: not a game log'.format(path))
+        self._offsets = None
+
+    def _records(self):
+        data = self._map
+        offset = len(MAGIC)
+        while offset + LENGTH.size <= len(data):
+            length, = LENGTH.unpack_from(data, offset)
+            if offset + LENGTH.size + length > len(data):
+                break
+            yield offset, length
+            offset += LENGTH.size + length
+
+    def index(self):
+        '''Return the offsets of all the records, computed on first use.'''
+        if self._offsets is None:
+            self._offsets = [offset for offset, length in self._records()]
+        return self._offsets
+
+    def __len__(self):
+        return len(self.index())
+
+    def __getitem__(self, i):
+        return self.read(self.index()[i])
+
+    def __iter__(self):
+        for offset, length in self._records():
+            start = offset + LENGTH.size
+            yield GameRecord.decode(self._map[start:start + length])
+
+    def read(self, offset):
+        '''Decode the record starting at offset.'''
+        length, = LENGTH.unpack_from(self._map, offset)
+        start = offset + LENGTH.size
+        return GameRecord.decode(self._map[start:start + length])
+
+    def scan(self):
+        '''Yield (offset, winner, turns) for every record without decoding the turns.'''
+        for offset, length in self._records():
+            winner, layout, cards, assassins, count = HEADER.unpack_from(self._map, offset + LENGTH.size)
+            yield offset, None if winner == UNSET else winner, count
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class Replay:
+    '''Class rebuilding the state of a logged game after any number of turns.
+
+    A bitboard snapshot is kept every interval turns the first time they are
+    replayed, seeking to a turn then only replays the turns since the last
+    snapshot before it.'''
+
+    def __init__(self, record, interval=8):
+        self.record = record
+        self.interval = interval
+        self._snapshots = {0: record.initialstate().tobitboard()}
+
+    def __len__(self):
+        return len(self.record.turns)
+
+    def state(self, turn):
+        '''Return a new state as it was after turn turns, 0 being the initial state.'''
+        turns = self.record.turns
+        if not 0 <= turn <= len(turns):
+            raise IndexError('turn {} out of range'.format(turn))
+        start = max(t for t in self._snapshots if t <= turn)
+        state = KingAndAssassinsState.frombitboard(self._snapshots[start])
+        for t in range(start, turn):
+            if t == 0:
+                state.setassassins(NAMES[name] for name in self.record.assassins)
+            state.update(turns[t], t % 2)
+            if (t + 1) % self.interval == 0:
+                self._snapshots[t + 1] = state.tobitboard()
+        if turn > 0:
+            state._state['visible']['lastopponentmove'] = list(turns[turn - 1])
+        return state
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='King & Assassins game log')
+    parser.add_argument('log', help='game log file')
+    parser.add_argument('game', help='index of the game to show (default: summary of the log)', type=int, nargs='?')
+    parser.add_argument('--turn', help='turn of the game to show (default: last one)', type=int, default=None)
+    args = parser.parse_args()
+
+    with GameReader(args.log) as reader:
+        if args.game is None:
+            games, wins, turns = 0, [0, 0], 0
+            for offset, winner, count in reader.scan():
+                games += 1
+                turns += count
+                if winner is not None:
+                    wins[winner] += 1
+            print(json.dumps({'games': games, 'wins': wins, 'turns': turns}))
+        else:
+            replay = Replay(reader[args.game])
+            replay.state(len(replay) if args.turn is None else args.turn).prettyprint()
@@ -3,16 +3,17 @@
 # Author: Sébastien Combéfis
 # Version: April 29, 2016
 
-import argparse
+import functools
 import json
 import random
-import socket
-import sys
+import types
 
 from lib import game
-from bestway import *
-from nextto import *
-from lookout import *
+from bitboard import BitboardState
+from positions import PositionIndex
+from rules import RuleTables, kindof, EMPTY, KING, KNIGHT, ASSASSIN, DIR_INDEX, DIRECTIONS, KILLED, OFF
+from zobrist import KEYS as ZOBRIST
+from snapshot import SharedGrid
 
 BUFFER_SIZE = 2048
 
@@ -60,51 +61,216 @@ VILLAGERS = {
     (5, 7), (5, 9), (7, 1), (7, 5), (8, 3), (9, 5)
 }
 
-# Separate board containing the position of the pawns
-PEOPLE = [[None for column in range(10)] for row in range(10)]
 
-# Place the king in the right-bottom corner
-PEOPLE[9][9] = 'king'
+def _template():
+    # Board of the pawns without the villagers, the king in the right-bottom corner
+    people = [[None for column in range(10)] for row in range(10)]
+    people[9][9] = 'king'
+    for x, y in KNIGHTS:
+        people[x][y] = 'knight'
+    return tuple(tuple(row) for row in people)
 
-# Place the knights on the board
-for coord in KNIGHTS:
-    PEOPLE[coord[0]][coord[1]] = 'knight'
 
-# Place the villagers on the board
-# random.sample(A, len(A)) returns a list where the elements are shuffled
-# this randomizes the position of the villagers
-for villager, coord in zip(random.sample(POPULATION, len(POPULATION)), VILLAGERS):
-    PEOPLE[coord[0]][coord[1]] = villager
-    #print(PEOPLE)
-    #print(PEOPLE[1][7])
+TEMPLATE = _template()
 
-KA_INITIAL_STATE = {
+
+def placepeople(rng=None):
+    '''Build the separate board containing the position of the pawns.
+
+    The villagers are shuffled with rng, a random.Random instance can be
+    given to get a reproducible layout. Without one, they are placed in the
+    order of their names.'''
+    people = [list(row) for row in TEMPLATE]
+    villagers = sorted(POPULATION)
+    if rng is not None:
+        # random.sample(A, len(A)) returns a list where the elements are shuffled
+        # this randomizes the position of the villagers
+        villagers = rng.sample(villagers, len(villagers))
+    for villager, (x, y) in zip(villagers, sorted(VILLAGERS)):
+        people[x][y] = villager
+    return people
+
+
+# Visible state of a game before the villagers are shuffled, read-only so that no
+# game can change the next ones: a state copies what it changes (see _private)
+KA_INITIAL_STATE = types.MappingProxyType({
     'board': BOARD,
-    'people': PEOPLE,
-    'castle': [(2, 2, 'N'), (4, 1, 'W')],
+    'people': tuple(tuple(row) for row in placepeople()),
+    'castle': ((2, 2, 'N'), (4, 1, 'W')),
     'card': None,
     'king': 'healthy',
-    'lastopponentmove': [],
-    'arrested': [],
-    'killed': {
+    'lastopponentmove': (),
+    'arrested': (),
+    'killed': types.MappingProxyType({
         'knights': 0,
         'assassins': 0
-    }
-}
+    })
+})
+
+
+# Tables of the rules used to validate the actions
+RULES = RuleTables(BOARD, KA_INITIAL_STATE['castle'])
+
+
+# The helpers of the AI are only imported and built when the client first uses them
+@functools.lru_cache(maxsize=None)
+def paths():
+    '''Shortest paths between all the cells of the board, for the AI.'''
+    from pathtable import PathTable
+    return PathTable(BOARD)
+
+
+@functools.lru_cache(maxsize=None)
+def planner():
+    '''Planner of the assassins' turns, sharing the path tables.'''
+    from planner import AssassinPlanner
+    return AssassinPlanner(paths())
+
+
+@functools.lru_cache(maxsize=None)
+def tablebase():
+    '''Endgame tablebase of the AI, only mapped when a position is first probed.'''
+    from endgame import Tablebase
+    return Tablebase(BOARD, KA_INITIAL_STATE['castle'])
+
+
+def _private(visible):
+    # Copy of the containers of a visible state that update() changes in place, the rows of people are shared until written
+    people = visible['people']
+    visible = dict(visible)
+    visible['people'] = people.fork() if isinstance(people, SharedGrid) else SharedGrid(people)
+    visible['arrested'] = list(visible['arrested'])
+    visible['killed'] = dict(visible['killed'])
+    return visible
 
 
 class KingAndAssassinsState(game.GameState):
     '''Class representing a state for the King & Assassins game.'''
 
-    DIRECTIONS = {
-        'E': (0, 1),
-        'W': (0, -1),
-        'S': (1, 0),
-        'N': (-1, 0)
-    }
+    DIRECTIONS = DIRECTIONS
+
+    # Tables of the rules the actions are checked against, a state may be given others to play a variant
+    rules = RULES
 
-    def __init__(self, initialstate=KA_INITIAL_STATE):
-        super().__init__(initialstate)
+    def __init__(self, initialstate=KA_INITIAL_STATE, tomove=0):
+        # The state never changes the dictionary it is given, KA_INITIAL_STATE stays the same from game to game
+        super().__init__(_private(initialstate))
+        self._index = None
+        self._hash = None
+        # Player to move, hashed with the side key
+        self._tomove = tomove
+        self._journal = None
+
+    def fork(self):
+        '''Return a copy of the state to branch on, both sharing the rows of people neither changes.
+
+        Only the scalars, the arrested villagers and the cards are copied,
+        the cost of a fork is then that of the rows changed afterwards.'''
+        state = type(self)(self._state['visible'])
+        hidden = self._state['hidden']
+        if hidden is not None:
+            state._state['hidden'] = dict(hidden, cards=list(hidden['cards']))
+        state.rules = self.rules
+        state._hash = self._hash
+        state._tomove = self._tomove
+        if self._index is not None:
+            state._index = self._index.copy()
+        return state
+
+    def index(self):
+        '''Return the position index of the pieces, built on first use and then kept up to date.'''
+        if self._index is None:
+            self._index = PositionIndex.fromgrid(self._state['visible']['people'])
+        return self._index
+
+    def zobrist(self):
+        '''Return the Zobrist hash of the state, computed on first use and then updated incrementally.
+
+        The side key is in the hash when player 1 is to move, the other
+        player being to move after update() and after make() of ('end',).'''
+        if self._hash is None:
+            self._hash = ZOBRIST.full(self._state['visible'], self._state['hidden'], self._tomove)
+        return self._hash
+
+    def _setside(self, player):
+        if player != self._tomove:
+            self._tomove = player
+            if self._hash is not None:
+                self._hash ^= ZOBRIST.side
+
+    def _setcell(self, x, y, value):
+        # Every change of the people grid goes through here to keep the index and hash in sync
+        people = self._state['visible']['people']
+        if self._hash is not None:
+            if people[x][y] is not None:
+                self._hash ^= ZOBRIST.piece(people[x][y], x, y)
+            if value is not None:
+                self._hash ^= ZOBRIST.piece(value, x, y)
+        if self._journal is not None:
+            self._journal.append((x, y, people[x][y]))
+        people.set(x, y, value)
+        if self._index is not None:
+            self._index.set((x, y), value)
+
+    def recordchanges(self):
+        '''Start recording the cells changed by update(), until takechanges() is called.'''
+        self._journal = []
+
+    def takechanges(self):
+        '''Stop recording and return the changes as a list of (x, y, previous value).'''
+        journal, self._journal = self._journal, None
+        return journal
+
+    def _scalars(self):
+        visible = self._state['visible']
+        return (
+            visible['king'], visible['killed']['knights'], visible['killed']['assassins'],
+            len(visible['arrested']), visible['card']
+        )
+
+    def make(self, action, player):
+        '''Apply a single action in place and return a record to give to unmake().
+
+        The ('end',) action ends the turn of player, drawing a new card after
+        the assassins' turn. The action must be legal (see movegen.py), an
+        illegal one raises InvalidMoveException after possibly being partially
+        applied.'''
+        visible = self._state['visible']
+        hidden = self._state['hidden']
+        record = (action, player, self._scalars(), [])
+        if self._hash is not None:
+            self._hash ^= ZOBRIST.scalars(visible, hidden)
+        self._journal = record[3]
+        try:
+            if action[0] == 'end':
+                if player == 0:
+                    self._drawcard()
+                self._setside(1 - player)
+            else:
+                self._apply(action, player)
+        finally:
+            self._journal = None
+            if self._hash is not None:
+                self._hash ^= ZOBRIST.scalars(visible, hidden)
+        return record
+
+    def unmake(self, record):
+        '''Undo an action applied with make(), records must be undone in reverse order.'''
+        action, player, scalars, journal = record
+        visible = self._state['visible']
+        hidden = self._state['hidden']
+        if self._hash is not None:
+            self._hash ^= ZOBRIST.scalars(visible, hidden)
+        for x, y, value in reversed(journal):
+            self._setcell(x, y, value)
+        if action[0] == 'end':
+            if player == 0:
+                hidden['cards'].append(visible['card'])
+            self._setside(player)
+        visible['king'], visible['killed']['knights'], visible['killed']['assassins'], arrested, visible['card'] = scalars
+        del visible['arrested'][arrested:]
+        if self._hash is not None:
+            self._hash ^= ZOBRIST.scalars(visible, hidden)
 
     def _nextfree(self, x, y, dir):
         nx, ny = self._getcoord((x, y, dir))
@@ -112,94 +278,115 @@ class KingAndAssassinsState(game.GameState):
     def update(self, moves, player):
         visible = self._state['visible']
         hidden = self._state['hidden']
-        people = visible['people']
+        if self._hash is not None:
+            self._hash ^= ZOBRIST.scalars(visible, hidden)
+        try:
+            self._update(moves, player)
+            self._setside(1 - player)
+        finally:
+            if self._hash is not None:
+                self._hash ^= ZOBRIST.scalars(visible, hidden)
+
+    def _update(self, moves, player):
         for move in moves:
-            print(move)
-            # ('move', x, y, dir): moves person at position (x,y) of one cell in direction dir
-            if move[0] == 'move':
-                x, y, d = int(move[1]), int(move[2]), move[3]
-                p = people[x][y]
-                if p is None:
-                    raise game.InvalidMoveException('{}: there is no one to move'.format(move))
-                nx, ny = self._getcoord((x, y, d))
-                new = people[nx][ny]
-                # King, assassins, villagers can only move on a free cell
-                if p != 'knight' and new is not None:
-                    raise game.InvalidMoveException('{}: cannot move on a cell that is not free'.format(move))
-                if p == 'king' and BOARD[nx][ny] == 'R':
-                    raise game.InvalidMoveException('{}: the king cannot move on a roof'.format(move))
-                if p in {'assassin'}.union(POPULATION) and player != 0:
-                    raise game.InvalidMoveException('{}: villagers and assassins can only be moved by player 0'.format(move))
-                if p in {'king', 'knight'} and player != 1:
-                    raise game.InvalidMoveException('{}: the king and knights can only be moved by player 1'.format(move))
-                # Move granted if cell is free
-                if new is None:
-                    people[x][y], people[nx][ny] = people[nx][ny], people[x][y]
-                # If cell is not free, check if the knight can push villagers
-                else:
-                    pass
-            # ('arrest', x, y, dir): arrests the villager in direction dir with knight at position (x, y)
-            elif move[0] == 'arrest':
-                if player != 1:
-                    raise game.InvalidMoveException('arrest action only possible for player 1')
-                x, y, d = int(move[1]), int(move[2]), move[3]
-                arrester = people[x][y]
-                if arrester != 'knight':
-                    raise game.InvalidMoveException('{}: the attacker is not a knight'.format(move))
-                tx, ty = self._getcoord((x, y, d))
-                target = people[tx][ty]
-                if target not in POPULATION:
-                    raise game.InvalidMoveException('{}: only villagers can be arrested'.format(move))
-                visible['arrested'].append(people[tx][ty])
-                people[tx][ty] = None
-            # ('kill', x, y, dir): kills the assassin/knight in direction dir with knight/assassin at position (x, y)
-            elif move[0] == 'kill':
-                x, y, d = int(move[1]), int(move[2]), move[3]
-                killer = people[x][y]
-                if killer == 'assassin' and player != 0:
-                    raise game.InvalidMoveException('{}: kill action for assassin only possible for player 0'.format(move))
-                if killer == 'knight' and player != 1:
-                    raise game.InvalidMoveException('{}: kill action for knight only possible for player 1'.format(move))
-                tx, ty = self._getcoord((x, y, d))
-                target = people[tx][ty]
-                if target is None:
-                    raise game.InvalidMoveException('{}: there is no one to kill'.format(move))
-                if killer == 'assassin' and target == 'knight':
-                    visible['killed']['knights'] += 1
-                    people[tx][ty] = None
-                elif killer == 'knight' and target == 'assassin':
-                    visible['killed']['assassins'] += 1
-                    people[tx][ty] = None
-                else:
-                    raise game.InvalidMoveException('{}: forbidden kill'.format(move))
-            # ('attack', x, y, dir): attacks the king in direction dir with assassin at position (x, y)
-            elif move[0] == 'attack':
-                if player != 0:
-                    raise game.InvalidMoveException('attack action only possible for player 0')
-                x, y, d = int(move[1]), int(move[2]), move[3]
-                attacker = people[x][y]
-                if attacker != 'assassin':
-                    raise game.InvalidMoveException('{}: the attacker is not an assassin'.format(move))
-                tx, ty = self._getcoord((x, y, d))
-                target = people[tx][ty]
-                if target != 'king':
-                    raise game.InvalidMoveException('{}: only the king can be attacked'.format(move))
-                visible['king'] = 'injured' if visible['king'] == 'healthy' else 'dead'
-            # ('reveal', x, y): reveals villager at position (x,y) as an assassin
-            elif move[0] == 'reveal':
-                if player != 0:
-                    raise game.InvalidMoveException('raise action only possible for player 0')
-                x, y = int(move[1]), int(move[2])
-                p = people[x][y]
-                if p not in hidden['assassins']:
-                    raise game.InvalidMoveException('{}: the specified villager is not an assassin'.format(move))
-                people[x][y] = 'assassin'
+            self._apply(move, player)
+        # The other player plays next, he gets to know what has just been done
+        self._state['visible']['lastopponentmove'] = list(moves)
         # If assassins' team just played, draw a new card
         if player == 0:
-            visible['card'] = hidden['cards'].pop()
+            self._drawcard()
+
+    def _drawcard(self):
+        self._state['visible']['card'] = self._state['hidden']['cards'].pop()
+
+    def _apply(self, move, player):
+        visible = self._state['visible']
+        hidden = self._state['hidden']
+        people = visible['people']
+        action = move[0]
+        if action not in self.rules.actor:
+            raise game.InvalidMoveException('{}: unknown action'.format(move))
+        # ('reveal', x, y): reveals villager at position (x,y) as an assassin
+        if action == 'reveal':
+            if not self.rules.allowed['reveal'][player]:
+                raise game.InvalidMoveException('raise action only possible for player 0')
+            x, y = self._cell(move)
+            p = people[x][y]
+            if not self.rules.actor['reveal'][player][kindof(p)] or p not in hidden['assassins']:
+                raise game.InvalidMoveException('{}: the specified villager is not an assassin'.format(move))
+            self._setcell(x, y, 'assassin')
+            return
+        if not self.rules.allowed[action][player]:
+            raise game.InvalidMoveException('{} action only possible for player {}'.format(action, 1 - player))
+        x, y = self._cell(move)
+        p = people[x][y]
+        kind = kindof(p)
+        # ('move', x, y, dir): moves person at position (x,y) of one cell in direction dir
+        if action == 'move':
+            if kind == EMPTY:
+                raise game.InvalidMoveException('{}: there is no one to move'.format(move))
+            nx, ny = self._getcoord((x, y, move[3]))
+            # King, assassins, villagers can only move on a free cell
+            if not self.rules.target['move'][kind][kindof(people[nx][ny])]:
+                raise game.InvalidMoveException('{}: cannot move on a cell that is not free'.format(move))
+            # The king can only go on a roof to enter the castle through one of its doors
+            if kind == KING and not self.rules.kingstep[x * 10 + y][DIR_INDEX[move[3]]]:
+                raise game.InvalidMoveException('{}: the king cannot move on a roof'.format(move))
+            if not self.rules.actor['move'][player][kind]:
+                if player == 1:
+                    raise game.InvalidMoveException('{}: villagers and assassins can only be moved by player 0'.format(move))
+                raise game.InvalidMoveException('{}: the king and knights can only be moved by player 1'.format(move))
+            # If cell is not free, the knight pushes the whole chain of people in front of it of one cell
+            if people[nx][ny] is not None:
+                chain, reason = self.rules.push(lambda t: kindof(people[t // 10][t % 10]), x * 10 + y, DIR_INDEX[move[3]])
+                if chain is None:
+                    raise game.InvalidMoveException('{}: {}'.format(move, reason))
+                for dst, src in zip(reversed(chain), reversed(chain[:-1])):
+                    self._setcell(*self.rules.coords[dst], people[src // 10][src % 10])
+            self._setcell(nx, ny, p)
+            self._setcell(x, y, None)
+            return
+        if not self.rules.actor[action][player][kind]:
+            if action == 'kill' and kind in (ASSASSIN, KNIGHT):
+                raise game.InvalidMoveException('{}: kill action for {} only possible for player {}'.format(move, p, 1 - player))
+            if action != 'kill':
+                raise game.InvalidMoveException('{}: the attacker is not {}'.format(move, 'a knight' if action == 'arrest' else 'an assassin'))
+        tx, ty = self._getcoord((x, y, move[3]))
+        target = people[tx][ty]
+        tkind = kindof(target)
+        # ('arrest', x, y, dir): arrests the villager in direction dir with knight at position (x, y)
+        if action == 'arrest':
+            if not self.rules.target['arrest'][kind][tkind]:
+                raise game.InvalidMoveException('{}: only villagers can be arrested'.format(move))
+            visible['arrested'].append(target)
+            self._setcell(tx, ty, None)
+        # ('kill', x, y, dir): kills the assassin/knight in direction dir with knight/assassin at position (x, y)
+        elif action == 'kill':
+            if tkind == EMPTY:
+                raise game.InvalidMoveException('{}: there is no one to kill'.format(move))
+            if not self.rules.target['kill'][kind][tkind] or not self.rules.actor['kill'][player][kind]:
+                raise game.InvalidMoveException('{}: forbidden kill'.format(move))
+            visible['killed'][KILLED[tkind]] += 1
+            self._setcell(tx, ty, None)
+        # ('attack', x, y, dir): attacks the king in direction dir with assassin at position (x, y)
+        elif action == 'attack':
+            if not self.rules.target['attack'][kind][tkind]:
+                raise game.InvalidMoveException('{}: only the king can be attacked'.format(move))
+            visible['king'] = 'injured' if visible['king'] == 'healthy' else 'dead'
+
+    def _cell(self, move):
+        # Coordinates of the piece doing an action, which must be on the board
+        x, y = int(move[1]), int(move[2])
+        if not (0 <= x < 10 and 0 <= y < 10):
+            raise game.InvalidMoveException('{}: position off the board'.format(move))
+        return x, y
 
     def _getcoord(self, coord):
-        return tuple(coord[i] + KingAndAssassinsState.DIRECTIONS[coord[2]][i] for i in range(2))
+        # Coordinates of the cell next to (x, y) in direction dir, which must be on the board
+        t = self.rules.step(coord[0], coord[1], coord[2])
+        if t == OFF:
+            raise game.InvalidMoveException('{}: cannot go off the board'.format(tuple(coord)))
+        return self.rules.coords[t]
 
     def winner(self):
         visible = self._state['visible']
@@ -220,7 +407,23 @@ class KingAndAssassinsState(game.GameState):
             return 1
         return -1
 
+    def tobitboard(self):
+        '''Return a compact bitboard copy of this state.'''
+        return BitboardState.fromstate(self._state['visible'], self._state['hidden'], self.rules)
+
+    @classmethod
+    def frombitboard(cls, bb):
+        visible, hidden = bb.tostate()
+        state = cls(visible)
+        state._state['hidden'] = hidden
+        if bb.rules is not None:
+            state.rules = bb.rules
+        return state
+
     def isinitial(self):
+        # Clients do not know the hidden part, the first card is only drawn once the assassins are chosen
+        if self._state['hidden'] is None:
+            return self._state['visible']['card'] is None
         return self._state['hidden']['assassins'] is None
 
     def setassassins(self, assassins):
@@ -247,57 +450,125 @@ class KingAndAssassinsState(game.GameState):
         return BUFFER_SIZE
 
 
+def new_game(seed=None):
+    '''Build a fresh server-side state, villagers and cards being shuffled with seed.
+
+    The state is made from KA_INITIAL_STATE with its own random.Random, the
+    same seed always gives the same game and no global state is used.'''
+    rng = random.Random(seed)
+    state = KingAndAssassinsState(dict(KA_INITIAL_STATE, people=placepeople(rng)))
+    state._state['hidden'] = {
+        'assassins': None,
+        'cards': rng.sample(CARDS, len(CARDS))
+    }
+    return state
+
+
 class KingAndAssassinsServer(game.GameServer):
     '''Class representing a server for the King & Assassins game'''
 
-    def __init__(self, verbose=False):
-        super().__init__('King & Assassins', 2, KingAndAssassinsState(), verbose=verbose)
-        self._state._state['hidden'] = {
-            'assassins': None,
-            'cards': random.sample(CARDS, len(CARDS))
-        }
-
-    def _setassassins(self, move):
-        state = self._state
-        if 'assassins' not in move:
-            raise game.InvalidMoveException('The dictionary must contain an "assassins" key')
-        if not isinstance(move['assassins'], list):
-            raise game.InvalidMoveException('The value of the "assassins" key must be a list')
-        for assassin in move['assassins']:
-            if not isinstance(assassin, str):
-                raise game.InvalidMoveException('The "assassins" must be identified by their name')
-            if not assassin in POPULATION:
-                raise game.InvalidMoveException('Unknown villager: {}'.format(assassin))
-        state.setassassins(move['assassins'])
-        state.update([], 0)
+    def __init__(self, verbose=False, seed=None):
+        self._verbose = verbose
+        # With a seed, both the villagers and the cards are shuffled reproducibly
+        super().__init__('King & Assassins', 2, new_game(seed), verbose=verbose)
 
     def applymove(self, move):
         try:
-            state = self._state
-            move = json.loads(move)
-            if state.isinitial():
-                self._setassassins(move)
-            else:
-                self._state.update(move['actions'], self.currentplayer)
+            playmove(self._state, move, self.currentplayer)
         except game.InvalidMoveException as e:
+            if self._verbose and e.__cause__ is not None:
+                print(e.__cause__)
             raise e
-        except Exception as e:
-            print(e)
-            raise game.InvalidMoveException('A valid move must be a dictionary')
+
+
+def setassassins(state, move):
+    '''Check the assassins chosen in the first move of player 0 and draw the first card.'''
+    if 'assassins' not in move:
+        raise game.InvalidMoveException('The dictionary must contain an "assassins" key')
+    if not isinstance(move['assassins'], list):
+        raise game.InvalidMoveException('The value of the "assassins" key must be a list')
+    for assassin in move['assassins']:
+        if not isinstance(assassin, str):
+            raise game.InvalidMoveException('The "assassins" must be identified by their name')
+        if not assassin in POPULATION:
+            raise game.InvalidMoveException('Unknown villager: {}'.format(assassin))
+    state.setassassins(move['assassins'])
+    state.update([], 0)
+
+
+def knightpush(people, knight):
+    '''Push cost function of PathTable.astar() for the knight at the given coordinates.'''
+    start = knight[0] * 10 + knight[1]
+
+    def kindat(t):
+        # The cell the knight leaves is free once it has moved
+        return EMPTY if t == start else kindof(people[t // 10][t % 10])
+
+    return lambda c, i: RULES.pushcost(kindat, c, i)
+
+
+def knightcost(people, x, y, d):
+    '''AP spent by the knight at (x, y) moving in direction d, pushes included, None if it cannot.'''
+    t = RULES.step(x, y, d)
+    if t == OFF:
+        return None
+    if people[t // 10][t % 10] is None:
+        return 1
+    cost = RULES.pushcost(lambda c: kindof(people[c // 10][c % 10]), x * 10 + y, DIR_INDEX[d])
+    return None if cost is None else 1 + cost
+
+
+def _tryaction(state, action):
+    # Apply an action of the knights' player if it is valid, the state is left unchanged otherwise
+    try:
+        state._apply(action, 1)
+    except game.InvalidMoveException:
+        return False
+    return True
+
+
+def playmove(state, move, player):
+    '''Apply the JSON move sent by player to state, raise InvalidMoveException if it is not valid.
+
+    The move may also be given already decoded, as a dictionary.'''
+    try:
+        if isinstance(move, (str, bytes)):
+            move = json.loads(move)
+        if state.isinitial():
+            setassassins(state, move)
+        else:
+            state.update(move['actions'], player)
+    except game.InvalidMoveException as e:
+        raise e
+    except Exception as e:
+        raise game.InvalidMoveException('A valid move must be a dictionary') from e
 
 
 class KingAndAssassinsClient(game.GameClient):
     '''Class representing a client for the King & Assassins game'''
 
-    def __init__(self, name, server, verbose=False):
+    def __init__(self, name, server, verbose=False, ai=None, book=None):
+        # ai is an optional player callable ai(state, playernb) replacing the scripted AI,
+        # it returns the list of assassins for the first move and a list of actions otherwise
+        # book is an optional OpeningBook used by the scripted AI for the first turns
         self._turn = -1
         self.__name = name
+        self._ai = ai
+        self._book = book
+        self._beliefs = None
         super().__init__(server, KingAndAssassinsState, verbose=verbose)
 
 
     def _handle(self, message):
         pass
 
+    def _opening(self, visible):
+        # The first turn with a card is answered by the opening book without any search
+        if self._book is None or self._turn != 1 - self._playernb:
+            return None
+        assassins = [assassin[0] for assassin in self.allassassins] if self._playernb == 0 else None
+        return self._book.play(visible, self._playernb, assassins)
+
     def _nextmove(self, state):
         self._turn += 1
         # Two possible situations:
@@ -310,199 +581,103 @@ class KingAndAssassinsClient(game.GameClient):
         #   ('kill', x, y, dir): kills the assassin/knight in direction dir with knight/assassin at position (x, y)
         #   ('attack', x, y, dir): attacks the king in direction dir with assassin at position (x, y)
         #   ('reveal', x, y): reveals villager at position (x,y) as an assassin
+        if self._ai is not None:
+            move = self._ai(state, self._playernb)
+            key = 'assassins' if state._state['visible']['card'] is None else 'actions'
+            return json.dumps({key: move}, separators=(',', ':'))
+
+        index = state.index()
         state = state._state['visible']
 
         if state['card'] is None:
-            # choose the assassins
-            ass1 = state['people'][7][1]
-            ass2 = state['people'][5][5]
-            ass3 = state['people'][3][4]
-            self.assassins_1 = [ass1, 7, 1]
-            self.assassins_2 = [ass2, 5, 5]
-            self.assassins_3 = [ass3, 3, 4]
-            self.allassassins = [self.assassins_1, self.assassins_2, self.assassins_3]
-            return json.dumps({'assassins': [ass1 , ass2 , ass3]}, separators=(',', ':'))
+            # choose the assassins, in the best cells of the opening book if there is one
+            cells = self._book.triple() if self._book is not None else None
+            if cells is None:
+                cells = ((7, 1), (5, 5), (3, 4))
+            self.allassassins = [[state['people'][x][y], x, y] for x, y in cells]
+            self.assassins_1, self.assassins_2, self.assassins_3 = self.allassassins
+            return json.dumps({'assassins': [assassin[0] for assassin in self.allassassins]}, separators=(',', ':'))
         else:
+            opening = self._opening(state)
+            if opening is not None:
+                return json.dumps({'actions': opening}, separators=(',', ':'))
+            # the king alone against revealed assassins is played from the tablebase without any search,
+            # the client has seen one card a turn
+            cardsleft = len(CARDS) - self._turn - self._playernb
+            hidden = [assassin[0] for assassin in self.allassassins] if self._playernb == 0 else ()
+            endgame = tablebase().play(state, self._playernb, cardsleft, hidden)
+            if endgame is not None:
+                return json.dumps({'actions': endgame}, separators=(',', ':'))
             # assassins and villagers AI.
             # check each turn if there is someone to kill next to them (in a range of th ap they have)
             # and kill it, if there is nothing to kill, stay hidden.
             if self._playernb == 0:
                 # the comment below can win in one turn ;-)
                 #return json.dumps({'actions':[('reveal', 7, 1), ('move', 7, 1, 'W'), ('move', 7, 0, 'S'), ('move', 8, 0, 'S'), ('attack', 9, 0, 'W'), ('attack', 9, 0, 'W')]})
-                if self._turn == 1:
-                    # place one of the assassins closer to a knight for the next turn
-                    turnone = [('move', 7, 1, 'W')]
-                    state['card'][3] -= 1
-                    for i in range(10):
-                        for j in range(10):
-                            if state['people'][i][j] in self.assassins_3:
-                                x = i
-                                y = j
-                    targ = lookout(1, 3, state['card'][3], 'knight', state)
-                    if targ != None:
-                        dx = abs(targ[0]-x)
-                        dy = abs(targ[1]-y)
-                        if dx + dy <= state['card'][3]:
-                            turnone += [('reveal', x, y)]
-                            for i in range(state['card'][3]):
-                                now = nextto(x, y, targ[0], targ[1])
-                                print(state['card'][3])
-                                print(i)
-                                if now[1]:
-                                    turnone += [('kill', x, y, now[0])]
-                                    break
-                                else:
-                                    best = bestway(self._playernb, x, y, targ[0], targ[1])
-                                    turnone += [('move', x, y, best[2])]
-                                    x += best[0]
-                                    y += best[1]
-                            print(turnone)
-                        return json.dumps({'actions' : turnone})
-                elif self._turn == 2:
-                    turntwo = []
-                    for i in range(10):
-                        for j in range(10):
-                            if state['people'][i][j] in self.assassins_1:
-                                x = i
-                                y = j
-                    targ = lookout(3, 0, state['card'][3], 'knight', state)
-                    if targ != None:
-                        dx = abs(targ[0]-x)
-                        dy = abs(targ[1]-y)
-                        if dx + dy <= state['card'][3]:
-                            turntwo += [('reveal', x, y)]
-                            for i in range(state['card'][3]):
-                                now = nextto(x, y, targ[0], targ[1])
-                                if now[1]:
-                                    turntwo += [('kill', x, y, now[0])]
-                                    break
-                                else:
-                                    best = bestway(self._playernb, x, y, targ[0], targ[1])
-                                    turntwo += [('move', x, y, best[2])]
-                                    x += best[0]
-                                    y += best[1]
-                            print(turntwo)
-                            return json.dumps({'actions' : turntwo})
-                        else:
-                            return json.dumps({'actions': []}, separators=(',', ':'))
-                    return json.dumps({'actions': []}, separators=(',', ':'))
-                else:
-                    # each turn the assassins will check if there is a target next to them
-                    turn = []
-                    for k in range(len(self.allassassins)):
-                        for i in range(10):
-                            for j in range(10):
-                                if state['people'][i][j] in self.allassassins[k]:
-                                    x = i
-                                    y = j
-                                    targ = lookout(x, y, state['card'][3], 'knight', state)
-                                    targk = lookout(x, y, state['card'][3], 'king', state)
-                                    if targk != None:
-                                        dxk = abs(targk[0]-x)
-                                        dyk = abs(targk[1]-y)
-                                        if dxk + dyk <= state['card'][3]:
-                                            turn += [('reveal', x, y)]
-                                            for i in range(state['card'][3]):
-                                                now = nextto(x, y, targk[0], targk[1])
-                                                if now[1]:
-                                                    turn += [('attack', x, y, now[0])]
-                                                    state['card'][3] -= 1
-                                                else:
-                                                    best = bestway(self._playernb, x, y, targk[0], targk[1])
-                                                    turn += [('move', x, y, best[2])]
-                                                    state['card'][3] -= 1
-                                                    x += best[0]
-                                                    y += best[1]
-                                    elif targ != None:
-                                        dx = abs(targ[0]-x)
-                                        dy = abs(targ[1]-y)
-                                        if dx + dy <= state['card'][3]:
-                                            turn += [('reveal', x, y)]
-                                            for i in range(state['card'][3]):
-                                                now = nextto(x, y, targ[0], targ[1])
-                                                if now[1]:
-                                                    turn += [('kill', x, y, now[0])]
-                                                    state['card'][3] -= 1
-                                                    break
-                                                else:
-                                                    best = bestway(self._playernb, x, y, targ[0], targ[1])
-                                                    turn += [('move', x, y, best[2])]
-                                                    state['card'][3] -= 1
-                                                    x += best[0]
-                                                    y += best[1]
-                    return json.dumps({'actions' : turn})
+                # the planner scores every (assassin, target) pair at once and assigns the targets jointly,
+                # an assassin with nothing in reach stays hidden
+                hidden = [index.where[assassin[0]] for assassin in self.allassassins if assassin[0] in index.where]
+                revealed = sorted(index.classes['assassin'])
+                health = {'healthy': 2, 'injured': 1}.get(state['king'], 0)
+                turn = planner().plan(state['people'], index, hidden + revealed, [True] * len(hidden) + [False] * len(revealed), state['card'][3], health)
+                return json.dumps({'actions': turn}, separators=(',', ':'))
 
 ######################################################################################
             # knight and king AI is not finish (doesn't work, sorry)
             # but is based on the same logic, check if they can kill or arrest someone
             # and if not, move to the doors.
             elif self._playernb == 1:
+                from beliefs import AssassinBeliefs
+                from bestway import bestway
+                from nextto import nextto
+                # the knights keep track of who the hidden assassins may be, and arrest the most suspect villager
+                if self._beliefs is None:
+                    self._beliefs = AssassinBeliefs(POPULATION)
+                self._beliefs.observe(state, index)
+                villagers = [(coord, index.at[coord]) for coord in index.classes['villager']]
+                # the actions are tried on a copy of the state, so that the knights can go through crowds by pushing
+                # people without ever sending an action the rules forbid
+                scratch = KingAndAssassinsState(state)
+                people = scratch._state['visible']['people']
+                ap, fetter = state['card'][1], state['card'][2]
                 turn = []
-                for i in range(10):
-                    for j in range(10):
-                        if state['people'][i][j] == 'knight':
-                            x = i
-                            y = j
-                            try:
-                                targa = lookout(x, y, state['card'][1], 'assassin', state)
-                                targv = lookout(x, y, state['card'][1], 'villager', state)
-                            except IndexError:
-                                pass
-                            if targa != None:
-                                dxa = abs(targa[0]-x)
-                                dya = abs(targa[1]-y)
-                                if dxa + dya <= state['card'][1]:
-                                    for i in range(state['card'][1]):
-                                        now = nextto(x, y, targa[0], targa[1])
-                                        if now[1]:
-                                            turn += [('kill', x, y, now[0])]
-                                            state['card'][1] -= 1
-                                        else:
-                                            bestk = bestway(self._playernb, x, y, targa[0], targa[1])
-                                            turn += [('move', x, y, bestk[2])]
-                                            state['card'][1] -= 1
-                                            x += bestk[0]
-                                            y += bestk[1]
-                            elif targv != None and state['card'][2] == True:
-                                dxv = abs(targv[0]-x)
-                                dyv = abs(targv[1]-y)
-                                if dxv + dyv <= state['card'][1]:
-                                    for i in range(state['card'][1]):
-                                        now = nextto(x, y, targv[0], targv[1])
-                                        if now[1]:
-                                            turn += [('arrest', x, y, now[0])]
-                                            state['card'][1] -= 1
-                                            #k += 1
-                                            state['card'][2] = False
-                                        else:
-                                            bestk = bestway(self._playernb, x, y, targv[0], targv[1])
-                                            turn += [('move', x, y, bestk[2])]
-                                            state['card'][1] -= 1
-                                            x += bestk[0]
-                                            y += bestk[1]
-                for i in range(10):
-                    for j in range(10):
-                        if state['people'][i][j] == 'knight' and state['card'][1] > 0:
-                            x = i
-                            y = j
-                            bestk = bestway(self._playernb, x, y, 4, 1)
-                            turn += [('move', x, y, bestk[2])]
-                            state['card'][1] -= 1
+                knights = []
+                for x, y in sorted(index.classes['knight']):
+                    targa = index.nearest((x, y), 'assassin', ap)
+                    targv = self._beliefs.suspect((x, y), villagers, ap) if fetter else None
+                    target, action = (targa, 'kill') if targa is not None else (targv, 'arrest')
+                    if target is not None and people[x][y] == 'knight':
+                        route = paths().approach(people, (x, y), target, push=knightpush(people, (x, y))) or []
+                        for d in route:
+                            cost = knightcost(people, x, y, d)
+                            if cost is None or cost > ap or not _tryaction(scratch, ('move', x, y, d)):
+                                break
+                            turn.append(('move', x, y, d))
+                            ap -= cost
+                            x += KingAndAssassinsState.DIRECTIONS[d][0]
+                            y += KingAndAssassinsState.DIRECTIONS[d][1]
+                        now = nextto(x, y, target[0], target[1])
+                        if now[1] and ap > 0 and _tryaction(scratch, (action, x, y, now[0])):
+                            turn.append((action, x, y, now[0]))
+                            ap -= 1
+                            fetter = fetter and action != 'arrest'
+                    knights.append((x, y))
+                for x, y in knights:
+                    bestk = bestway(self._playernb, x, y, 4, 1)
+                    cost = knightcost(people, x, y, bestk[2]) if bestk[2] else None
+                    if cost is not None and cost <= ap and _tryaction(scratch, ('move', x, y, bestk[2])):
+                        turn.append(('move', x, y, bestk[2]))
+                        ap -= cost
                 # the king just move to the doors
-                for i in range(10):
-                    for j in range(10):
-                        if state['people'][i][j] == 'king':
-                            x = i
-                            y = j
-                            if x == 4 and y == 1:
-                                turn += [('move', x, y, 'W')]
-                            else:
-                                for i in range(state['card'][0]):
-                                    best = bestway(self._playernb, x, y, 4, 1)
-                                    turn += [('move', x, y, best[2])]
-                                    state['card'][0] -= 1
-                                    x += best[0]
-                                    y += best[1]
+                if 'king' in index.where:
+                    x, y = index.where['king']
+                    route = paths().kingroute(people, (x, y), state['castle']) or []
+                    for d in route[:state['card'][0]]:
+                        if not _tryaction(scratch, ('move', x, y, d)):
+                            break
+                        turn += [('move', x, y, d)]
+                        x += KingAndAssassinsState.DIRECTIONS[d][0]
+                        y += KingAndAssassinsState.DIRECTIONS[d][1]
                 return json.dumps({'actions': turn})
 ########################################
             else:
@@ -510,10 +685,14 @@ class KingAndAssassinsClient(game.GameClient):
 
 
 if __name__ == '__main__':
+    import argparse
+    import socket
+    import sys
+
     # Create the top-level parser
     parser = argparse.ArgumentParser(description='King & Assassins game')
     subparsers = parser.add_subparsers(
-        description='server client',
+        description='server client bench',
         help='King & Assassins game components',
         dest='component'
     )
@@ -522,6 +701,13 @@ if __name__ == '__main__':
     server_parser = subparsers.add_parser('server', help='launch a server')
     server_parser.add_argument('--host', help='hostname (default: localhost)', default='localhost')
     server_parser.add_argument('--port', help='port to listen on (default: 5000)', default=5000)
+    server_parser.add_argument('--seed', help='seed for the villagers and cards shuffle', type=int, default=None)
+    server_parser.add_argument('--async', help='host many matches with a lobby on one event loop',
+                               dest='asyncmode', action='store_true')
+    server_parser.add_argument('--timeout', help='seconds allowed per move in async mode (default: 10)', type=float, default=10.0)
+    server_parser.add_argument('--log', help='game log file to append the matches to in async mode', default=None)
+    server_parser.add_argument('--metrics', help='file to write the metrics to, as JSON if it ends with .json (Prometheus text otherwise)', default=None)
+    server_parser.add_argument('--profile', help='file to write the cProfile statistics of the match to', default=None)
     server_parser.add_argument('-v', '--verbose', action='store_true')
     # Create the parser for the 'client' subcommand
     client_parser = subparsers.add_parser('client', help='launch a client')
@@ -529,11 +715,88 @@ if __name__ == '__main__':
     client_parser.add_argument('--host', help='hostname of the server (default: localhost)',
                                default=socket.gethostbyname(socket.gethostname()))
     client_parser.add_argument('--port', help='port of the server (default: 5000)', default=5000)
+    client_parser.add_argument('--ai', help='AI playing the game (default: scripted)', choices=['scripted', 'mcts'], default='scripted')
+    client_parser.add_argument('--seconds', help='thinking time per turn of the mcts AI (default: 1.0)', type=float, default=1.0)
+    client_parser.add_argument('--workers', help='processes used by the mcts AI (default: 1)', type=int, default=1)
+    client_parser.add_argument('--network', help='weights of the evaluation network of the mcts AI (default: playouts)', default=None)
+    client_parser.add_argument('--book', help='opening book of the scripted AI (default: openings.book)', default=None)
+    client_parser.add_argument('--metrics', help='file to write the metrics to, as JSON if it ends with .json (Prometheus text otherwise)', default=None)
     client_parser.add_argument('-v', '--verbose', action='store_true')
+    # Create the parser for the 'bench' subcommand
+    bench_parser = subparsers.add_parser('bench', help='run the benchmarks')
+    bench_parser.add_argument('--seed', help='seed of the fixtures (default: 0)', type=int, default=0)
+    bench_parser.add_argument('--repeat', help='calls per benchmark (default: 200)', type=int, default=200)
+    bench_parser.add_argument('--only', help='only run the benchmarks whose name contains this', default=None)
+    bench_parser.add_argument('--output', help='JSON file to write (default: standard output)', default=None)
     # Parse the arguments of sys.args
     args = parser.parse_args()
 
-    if args.component == 'server':
-        KingAndAssassinsServer(verbose=args.verbose).run()
+    # Instrumentation is opt-in, nothing is wrapped without --metrics
+    metrics = None
+    if args.component in ('server', 'client') and args.metrics is not None:
+        from metrics import Metrics, install
+        metrics = Metrics(args.metrics)
+        # The classic server and the client use the classes of this script, the async server those of the module
+        if args.component == 'server' and args.asyncmode:
+            install(metrics)
+        else:
+            install(metrics, sys.modules[__name__])
+    profiler = None
+    if args.component == 'server' and args.profile is not None:
+        import cProfile
+        profiler = cProfile.Profile()
+
+    if args.component == 'server' and args.asyncmode:
+        import asyncio
+        from asyncserver import AsyncServer
+        from gamelog import GameLog
+        log = GameLog(args.log) if args.log is not None else None
+        server = AsyncServer(args.host, int(args.port), args.timeout, args.seed, args.verbose, log, metrics)
+        try:
+            # The matches share one thread, they can only be profiled together
+            if profiler is not None:
+                profiler.enable()
+            asyncio.run(server.serve())
+        finally:
+            if log is not None:
+                log.close()
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(args.profile)
+    elif args.component == 'server':
+        server = KingAndAssassinsServer(verbose=args.verbose, seed=args.seed)
+        if profiler is not None:
+            profiler.runcall(server.run)
+            profiler.dump_stats(args.profile)
+        else:
+            server.run()
+        if metrics is not None:
+            metrics.write()
+    elif args.component == 'bench':
+        from benchmark import runbenchmarks
+        results = json.dumps(runbenchmarks(args.seed, args.repeat, args.only), indent=2, sort_keys=True)
+        if args.output is None:
+            print(results)
+        else:
+            with open(args.output, 'w') as file:
+                file.write(results + '\n')
     else:
-        KingAndAssassinsClient(args.name, (args.host, args.port), verbose=args.verbose)
+        ai = None
+        if args.ai == 'mcts':
+            from mcts import MCTSPlayer
+            evaluator = None
+            if args.network is not None:
+                from evalnet import EvalNet, Evaluator
+                evaluator = Evaluator(EvalNet.load(args.network))
+            ai = MCTSPlayer(seconds=args.seconds, workers=args.workers, evaluator=evaluator)
+        # The book is only read when the first move is asked for
+        from openingbook import OpeningBook, DEFAULT
+        book = OpeningBook(args.book or DEFAULT)
+        try:
+            KingAndAssassinsClient(args.name, (args.host, args.port), verbose=args.verbose, ai=ai, book=book)
+        finally:
+            # The search processes of the AI must not outlive the game
+            if ai is not None:
+                ai.close()
+        if metrics is not None:
+            metrics.write()
@@ -0,0 +1,313 @@
+# Monte Carlo Tree Search player for both sides
+# Hidden information is handled by determinization: each iteration samples
+# the unknown assassins and the order of the remaining cards, and only the
+# children legal in that sample are considered (information set MCTS)
+
+import math
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from kingandassassins import CARDS, POPULATION, KingAndAssassinsState, paths, tablebase
+from movegen import END, budget, spend, legalactions, piece, pushed
+from rules import DIRS
+
+
+class Node:
+    '''Class representing a node of the search tree.
+
+    player is the player who did the action leading to the node and wins
+    are counted from his point of view.'''
+
+    __slots__ = ('action', 'player', 'children', 'visits', 'wins', 'available', 'policy')
+
+    def __init__(self, action=None, player=None):
+        self.action = action
+        self.player = player
+        self.children = {}
+        self.visits = 0
+        self.wins = 0.0
+        self.available = 0
+        # Policy of the network at the node, when the node was a leaf evaluated by it
+        self.policy = None
+
+    def ucb(self, c):
+        return self.wins / self.visits + c * math.sqrt(math.log(self.available) / self.visits)
+
+    def summary(self, depth):
+        '''Nested (visits, wins, children) statistics, used to merge root-parallel searches.'''
+        children = {}
+        if depth > 0:
+            for action, child in self.children.items():
+                children[action] = child.summary(depth - 1 if action == END else depth)
+        return (self.visits, self.wins, children)
+
+    def merge(self, summary):
+        visits, wins, children = summary
+        self.visits += visits
+        self.wins += wins
+        for action, sub in children.items():
+            if action not in self.children:
+                self.children[action] = Node(action)
+            self.children[action].merge(sub)
+
+
+def evaluate(visible, index):
+    '''Heuristic probability that the assassins win, used when a rollout is cut.
+
+    index is the PositionIndex of the people of visible.'''
+    value = 0.5
+    if visible['king'] == 'injured':
+        value += 0.2
+    value -= 0.1 * visible['killed']['assassins']
+    value += 0.03 * visible['killed']['knights']
+    king = index.where.get('king')
+    if king is not None:
+        doors = [paths().distance(king, door[:2], 'ground') for door in visible['castle']]
+        doors = [d for d in doors if d is not None]
+        if doors:
+            value -= 0.2 / (1 + min(doors))
+    return min(1.0, max(0.0, value))
+
+
+def _prior(policy, action):
+    # Probability of an action in a policy of evalnet.py, the actions without a direction get the mean
+    if len(action) < 4:
+        return 1.0 / len(policy)
+    return policy[((int(action[1]) * 10 + int(action[2])) * 4 + DIRS.index(action[3]))]
+
+
+class Search:
+    '''One search tree together with the knowledge of the searching player.
+
+    With an evaluator (see evalnet.py), the leaves are not played out but
+    evaluated by the network, batch leaves at a time: the visits of a
+    pending leaf are counted at once and its result when the batch is
+    evaluated. The untried children of a node evaluated by the network are
+    expanded in the order of its policy.'''
+
+    def __init__(self, visible, player, assassins, cardsleft, seen, c=0.7, maxplies=6, seed=0, evaluator=None, batch=16):
+        self.state = KingAndAssassinsState(visible, player)
+        self.player = player
+        self.assassins = assassins
+        self.cardsleft = cardsleft
+        self.seen = list(seen)
+        self.c = c
+        self.maxplies = maxplies
+        self.rng = random.Random(seed)
+        self.root = Node(player=1 - player)
+        self.evaluator = evaluator
+        self.batch = batch
+        if evaluator is not None:
+            from evalnet import encode
+            self._encode = encode
+
+    def determinize(self):
+        '''Sample the hidden part of the state consistently with what the player knows.'''
+        visible = self.state._state['visible']
+        rng = self.rng
+        deck = list(CARDS)
+        for card in self.seen:
+            if tuple(card) in deck:
+                deck.remove(tuple(card))
+        cards = rng.sample(deck, min(self.cardsleft, len(deck)))
+        if self.assassins is not None:
+            assassins = set(self.assassins)
+        else:
+            index = self.state.index()
+            revealed = len(index.classes['assassin']) + visible['killed']['assassins']
+            candidates = sorted(set(index.where) - {'king'} | set(visible['arrested']))
+            assassins = set(rng.sample(candidates, max(0, min(3 - revealed, len(candidates)))))
+        self.state._state['hidden'] = {'assassins': assassins, 'cards': cards}
+
+    def iterate(self, pending=None):
+        state = self.state
+        self.determinize()
+        visible = state._state['visible']
+        node = self.root
+        path = [node]
+        records = []
+        player = self.player
+        left = budget(visible['card'], player)
+        plies = 0
+        winner = -1
+        # Selection and expansion
+        while winner == -1:
+            actions = legalactions(state, player, left)
+            for action in actions:
+                if action in node.children:
+                    node.children[action].available += 1
+            untried = [a for a in actions if a not in node.children]
+            if untried:
+                if node.policy is not None:
+                    action = max(untried, key=lambda a: _prior(node.policy, a))
+                else:
+                    action = self.rng.choice(untried)
+                child = node.children[action] = Node(action, player)
+                child.available = 1
+            else:
+                child = max((node.children[a] for a in actions), key=lambda n: n.ucb(self.c))
+                action = child.action
+            node = child
+            path.append(node)
+            if action != END:
+                left = spend(left, action, piece(state, action), pushed(state, action))
+            records.append(state.make(action, player))
+            if action == END:
+                plies += 1
+                winner = state.winner()
+                player = 1 - player
+                left = budget(visible['card'], player)
+            if untried:
+                break
+        # The network evaluates the leaf in place of a playout, with the next batch
+        if winner == -1 and pending is not None:
+            pending.append((path, self.evaluator.key(state, player), self._encode(visible, player)))
+            for record in reversed(records):
+                state.unmake(record)
+            for node in path:
+                node.visits += 1
+            return
+        # Simulation
+        while winner == -1 and plies < self.maxplies:
+            action = self.rng.choice(legalactions(state, player, left))
+            if action != END:
+                left = spend(left, action, piece(state, action), pushed(state, action))
+            records.append(state.make(action, player))
+            if action == END:
+                plies += 1
+                winner = state.winner()
+                player = 1 - player
+                left = budget(visible['card'], player)
+        result = evaluate(visible, state.index()) if winner == -1 else 1.0 - winner
+        for record in reversed(records):
+            state.unmake(record)
+        # Backpropagation, result is the value for player 0
+        for node in path:
+            node.visits += 1
+            node.wins += result if node.player == 0 else 1.0 - result
+
+    def flush(self, pending):
+        '''Evaluate the pending leaves with the network and back their results up.'''
+        results = self.evaluator.evaluate([(key, planes) for path, key, planes in pending])
+        for (path, key, planes), (value, policy) in zip(pending, results):
+            path[-1].policy = policy
+            for node in path:
+                node.wins += value if node.player == 0 else 1.0 - value
+        del pending[:]
+
+    def run(self, iterations=None, seconds=None):
+        deadline = None if seconds is None else time.monotonic() + seconds
+        done = 0
+        pending = [] if self.evaluator is not None else None
+        while (iterations is None or done < iterations) and (deadline is None or time.monotonic() < deadline):
+            self.iterate(pending)
+            done += 1
+            if pending and len(pending) >= self.batch:
+                self.flush(pending)
+        if pending:
+            self.flush(pending)
+        return done
+
+
+def _parallelsearch(args):
+    visible, player, assassins, cardsleft, seen, iterations, seconds, seed, evaluator = args
+    search = Search(visible, player, assassins, cardsleft, seen, seed=seed, evaluator=evaluator)
+    search.run(iterations, seconds)
+    return search.root.summary(1)
+
+
+class MCTSPlayer:
+    '''Player choosing each turn with an ISMCTS search.
+
+    The search stops after iterations iterations or seconds seconds,
+    whichever comes first. With workers > 1, independent searches are run in
+    that many processes and their root statistics are merged (root
+    parallelization). With a single worker, the tree is reused from one turn
+    to the next when the opponent's actions are known. An evaluator of
+    evalnet.py replaces the playouts by batched network evaluations.
+
+    The worker processes are kept from one turn to the next, close() (or
+    leaving a with block) shuts them down.'''
+
+    def __init__(self, iterations=None, seconds=1.0, workers=1, seed=0, evaluator=None):
+        self.iterations = iterations
+        self.evaluator = evaluator
+        self.seconds = seconds
+        self.workers = workers
+        self.rng = random.Random(seed)
+        self.assassins = None
+        self.seen = []
+        self._search = None
+        self._played = None
+        self._pool = None
+
+    def __call__(self, state, playernb):
+        visible = state._state['visible']
+        if visible['card'] is None:
+            self.assassins = self.rng.sample(sorted(POPULATION), 3)
+            return list(self.assassins)
+        self.seen.append(tuple(visible['card']))
+        # The player only knows how many cards were drawn, not which ones are left
+        cardsleft = len(CARDS) - len(self.seen)
+        assassins = self.assassins if playernb == 0 else None
+        # Endgames of the tablebase are played without searching, the next search starts afresh
+        endgame = tablebase().play(visible, playernb, cardsleft, assassins or ())
+        if endgame is not None:
+            self._search = self._played = None
+            return endgame
+        if self.workers > 1:
+            root = self._parallel(visible, playernb, assassins, cardsleft)
+        else:
+            search = self._reuse(visible, playernb, assassins, cardsleft)
+            search.run(self.iterations, self.seconds)
+            root = search.root
+        actions = []
+        node = root
+        while node.children:
+            node = max(node.children.values(), key=lambda n: n.visits)
+            if node.action == END:
+                break
+            actions.append(node.action)
+        self._played = actions
+        return actions
+
+    def _reuse(self, visible, playernb, assassins, cardsleft):
+        search = self._search
+        node = None
+        if search is not None and self._played is not None and visible['lastopponentmove']:
+            node = search.root
+            for action in self._played + [END] + [tuple(a) for a in visible['lastopponentmove']] + [END]:
+                node = node.children.get(action)
+                if node is None:
+                    break
+        fresh = Search(visible, playernb, assassins, cardsleft, self.seen, seed=self.rng.getrandbits(32), evaluator=self.evaluator)
+        if node is not None:
+            fresh.root = node
+        self._search = fresh
+        return fresh
+
+    def _parallel(self, visible, playernb, assassins, cardsleft):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        iterations = None if self.iterations is None else -(-self.iterations // self.workers)
+        tasks = [
+            (visible, playernb, assassins, cardsleft, self.seen, iterations, self.seconds, self.rng.getrandbits(32), self.evaluator)
+            for worker in range(self.workers)
+        ]
+        root = Node(player=1 - playernb)
+        for summary in self._pool.map(_parallelsearch, tasks):
+            root.merge(summary)
+        return root
+
+    def close(self):
+        '''Shut down the worker processes, a later parallel search starts new ones.'''
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
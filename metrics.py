@@ -0,0 +1,232 @@
+# Opt-in instrumentation of the game engine, the servers and the AI
+# install() wraps the hot methods with timing code, nothing is measured (and
+# nothing costs anything) until it is called. The metrics can be written as
+# JSON or in the Prometheus text format, for the textfile collector. The
+# bytes are those of the frames of the async server only, the classic server
+# sends and receives through lib/game.py, which is not instrumented.
+
+import functools
+import json
+import os
+import re
+import time
+
+from lib import game
+import kingandassassins as ka
+import views
+
+# Upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds of the actions per turn buckets
+ACTION_BUCKETS = tuple(range(11))
+
+# Messages of InvalidMoveException start with the offending action (a tuple or a JSON list), which is dropped from the reason
+ACTION_PREFIX = re.compile(r'^[(\[].*?[)\]]: ')
+
+
+def reason(exception):
+    '''Reason of an invalid move, without the coordinates it happened at.'''
+    return ACTION_PREFIX.sub('', str(exception))
+
+
+class Histogram:
+    '''Class representing a cumulative histogram, as in Prometheus.'''
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        i = 0
+        buckets = self.buckets
+        while i < len(buckets) and value > buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+    def todict(self):
+        return {'buckets': list(self.buckets), 'counts': list(self.counts), 'sum': self.sum, 'count': self.count}
+
+
+class Metrics:
+    '''Class collecting the latencies, actions and invalid moves of a process, and the bytes of its async server.
+
+    path is the default file written by write().'''
+
+    def __init__(self, path=None):
+        self.path = path
+        self.latency = {}
+        self.actions = [Histogram(ACTION_BUCKETS), Histogram(ACTION_BUCKETS)]
+        self.invalid = {}
+        self.bytes = {'sent': 0, 'received': 0}
+
+    def observe(self, name, seconds):
+        if name not in self.latency:
+            self.latency[name] = Histogram(LATENCY_BUCKETS)
+        self.latency[name].observe(seconds)
+
+    def turn(self, player, actions):
+        self.actions[player].observe(len(actions))
+
+    def invalidmove(self, exception):
+        key = reason(exception)
+        self.invalid[key] = self.invalid.get(key, 0) + 1
+
+    def sent(self, count):
+        self.bytes['sent'] += count
+
+    def received(self, count):
+        self.bytes['received'] += count
+
+    def todict(self):
+        return {
+            'latency_seconds': {name: h.todict() for name, h in sorted(self.latency.items())},
+            'actions_per_turn': [h.todict() for h in self.actions],
+            'invalid_moves': dict(sorted(self.invalid.items())),
+            'async_bytes': dict(self.bytes)
+        }
+
+    def toprometheus(self):
+        lines = ['# TYPE ka_latency_seconds histogram']
+        for name, h in sorted(self.latency.items()):
+            lines += _histogram('ka_latency_seconds', 'call="{}"'.format(name), h)
+        lines.append('# TYPE ka_actions_per_turn histogram')
+        for player, h in enumerate(self.actions):
+            lines += _histogram('ka_actions_per_turn', 'player="{}"'.format(player), h)
+        lines.append('# TYPE ka_invalid_moves_total counter')
+        for key, count in sorted(self.invalid.items()):
+            lines.append('ka_invalid_moves_total{{reason="{}"}} {}'.format(_escape(key), count))
+        lines.append('# HELP ka_async_bytes_total Bytes of the frames of the async server, the classic server is not counted')
+        lines.append('# TYPE ka_async_bytes_total counter')
+        for direction, count in sorted(self.bytes.items()):
+            lines.append('ka_async_bytes_total{{direction="{}"}} {}'.format(direction, count))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path=None):
+        '''Write the metrics to path, as JSON if it ends with .json and in the Prometheus format otherwise.'''
+        path = path or self.path
+        if path is None:
+            return
+        if path.endswith('.json'):
+            data = json.dumps(self.todict(), indent=2, sort_keys=True) + '\n'
+        else:
+            data = self.toprometheus()
+        # Scrapers must never read a half-written file
+        temp = path + '.tmp'
+        with open(temp, 'w') as file:
+            file.write(data)
+        os.replace(temp, path)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _histogram(name, labels, h):
+    lines = []
+    for bound, total in h.cumulative():
+        le = '+Inf' if bound == float('inf') else repr(bound)
+        lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, labels, le, total))
+    lines.append('{}_sum{{{}}} {}'.format(name, labels, h.sum))
+    lines.append('{}_count{{{}}} {}'.format(name, labels, h.count))
+    return lines
+
+
+# Original methods replaced by install(), to be put back by uninstall()
+_ORIGINALS = {}
+
+
+def _wrap(cls, name, wrapper):
+    original = getattr(cls, name)
+    _ORIGINALS[cls, name] = original
+    setattr(cls, name, functools.wraps(original)(wrapper(original)))
+
+
+def install(metrics, module=ka):
+    '''Instrument the engine, the classic server and the client with metrics.
+
+    module is the module whose classes are instrumented, it must be given
+    when kingandassassins.py is run as a script (it is then __main__). The
+    bytes are not counted here, the async server counts those of its frames.'''
+    uninstall()
+    clock = time.perf_counter
+    # Invalid moves are counted by applymove() when update() is called from it, by the match of the
+    # async server when it is called from ViewTracker.apply(), and by update() otherwise
+    applying = [False]
+
+    def update(original):
+        def wrapper(self, moves, player):
+            start = clock()
+            try:
+                result = original(self, moves, player)
+            except game.InvalidMoveException as e:
+                if not applying[0]:
+                    metrics.invalidmove(e)
+                raise
+            finally:
+                metrics.observe('update', clock() - start)
+            metrics.turn(player, moves)
+            return result
+        return wrapper
+
+    def winner(original):
+        def wrapper(self):
+            start = clock()
+            try:
+                return original(self)
+            finally:
+                metrics.observe('winner', clock() - start)
+        return wrapper
+
+    def applymove(original):
+        def wrapper(self, move):
+            start = clock()
+            applying[0] = True
+            try:
+                return original(self, move)
+            except game.InvalidMoveException as e:
+                metrics.invalidmove(e)
+                raise
+            finally:
+                applying[0] = False
+                metrics.observe('applymove', clock() - start)
+        return wrapper
+
+    def apply(original):
+        def wrapper(self, move, player):
+            applying[0] = True
+            try:
+                return original(self, move, player)
+            finally:
+                applying[0] = False
+        return wrapper
+
+    def nextmove(original):
+        def wrapper(self, state):
+            start = clock()
+            move = original(self, state)
+            metrics.observe('nextmove', clock() - start)
+            return move
+        return wrapper
+
+    _wrap(module.KingAndAssassinsState, 'update', update)
+    _wrap(module.KingAndAssassinsState, 'winner', winner)
+    _wrap(module.KingAndAssassinsServer, 'applymove', applymove)
+    _wrap(module.KingAndAssassinsClient, '_nextmove', nextmove)
+    _wrap(views.ViewTracker, 'apply', apply)
+    return metrics
+
+
+def uninstall():
+    while _ORIGINALS:
+        (cls, name), original = _ORIGINALS.popitem()
+        setattr(cls, name, original)
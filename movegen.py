@@ -0,0 +1,113 @@
+# Legal actions generator
+# Actions are generated one at a time under the action points (AP) left in the
+# turn, so that a search can apply them with KingAndAssassinsState.make() and
+# undo them with unmake() instead of copying the state
+
+from rules import DIR_INDEX, DIRECTIONS, DIRS, EMPTY, OFF, kindof
+from rules import KING as KING_TYPE
+
+
+# Pseudo-action ending the turn of a player
+END = ('end',)
+
+# AP spent by each action, revealing an assassin is free, a knight pushing
+# people also spends one AP per pushed person
+COSTS = {'move': 1, 'arrest': 1, 'kill': 1, 'attack': 1, 'reveal': 0}
+
+# Actions done on the cell next to a piece, a kill or an arrest being listed
+# before the move of a knight pushing the same person
+STEPS = ('attack', 'kill', 'arrest', 'move')
+
+# A budget is a (king AP, knights AP, population AP, fetter) tuple
+KING, KNIGHTS, POPULATION, FETTER = range(4)
+
+
+def budget(card, player):
+    '''Budget of a player at the start of a turn played with card.'''
+    if player == 0:
+        return (0, 0, card[3], False)
+    return (card[0], card[1], 0, card[2])
+
+
+def spend(budget, action, piece, pushed=0):
+    '''Budget left after action has been done by piece, pushing pushed people.'''
+    king, knights, population, fetter = budget
+    cost = COSTS[action[0]] + pushed
+    if piece == 'king':
+        king -= cost
+    elif piece == 'knight':
+        knights -= cost
+        if action[0] == 'arrest':
+            fetter = False
+    else:
+        population -= cost
+    return (king, knights, population, fetter)
+
+
+def _pushcost(rules, people, x, y, d):
+    return rules.pushcost(lambda t: kindof(people[t // 10][t % 10]), x * 10 + y, DIR_INDEX[d])
+
+
+def legalactions(state, player, budget):
+    '''List the actions player can do in state with budget, END always being the last one.
+
+    Who may do what on whom is read from the rule tables of the state, the
+    pieces being taken from its position index.'''
+    rules = state.rules
+    hidden = state._state['hidden']
+    people = state._state['visible']['people']
+    index = state.index()
+    # Pieces of each AP pool with the AP left in it, in the order their actions are listed
+    pools = (
+        (budget[KING], [index.where['king']] if 'king' in index.where else []),
+        (budget[KNIGHTS], sorted(index.classes['knight'])),
+        (budget[POPULATION], sorted(index.classes['villager'] | index.classes['assassin']))
+    )
+    actions = []
+    for ap, pieces in pools:
+        if ap <= 0:
+            continue
+        for x, y in pieces:
+            c = x * 10 + y
+            kind = kindof(people[x][y])
+            for i, d in enumerate(DIRS):
+                t = rules.neighbour[c][i]
+                if t == OFF:
+                    continue
+                tkind = kindof(people[t // 10][t % 10])
+                for action in STEPS:
+                    if not rules.actor[action][player][kind] or not rules.target[action][kind][tkind]:
+                        continue
+                    if action == 'arrest' and not budget[FETTER]:
+                        continue
+                    if action == 'move':
+                        if kind == KING_TYPE and not rules.kingstep[c][i]:
+                            continue
+                        if tkind != EMPTY:
+                            cost = _pushcost(rules, people, x, y, d)
+                            if cost is None or 1 + cost > ap:
+                                continue
+                    actions.append((action, x, y, d))
+    if rules.allowed['reveal'][player] and hidden is not None and hidden['assassins'] is not None:
+        for name in sorted(hidden['assassins']):
+            if name in index.where and rules.actor['reveal'][player][kindof(name)]:
+                actions.append(('reveal',) + index.where[name])
+    actions.append(END)
+    return actions
+
+
+def piece(state, action):
+    '''Name of the piece doing action, before it is applied.'''
+    return state._state['visible']['people'][action[1]][action[2]]
+
+
+def pushed(state, action):
+    '''Number of people pushed by action, before it is applied.'''
+    people = state._state['visible']['people']
+    if action[0] != 'move':
+        return 0
+    x, y, d = action[1], action[2], action[3]
+    nx, ny = x + DIRECTIONS[d][0], y + DIRECTIONS[d][1]
+    if people[nx][ny] is None:
+        return 0
+    return _pushcost(state.rules, people, x, y, d)
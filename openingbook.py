@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# openingbook.py
+# Opening book of the King & Assassins clients, computed offline by self-play
+# Run with: python openingbook.py [--games 200] [--output openings.book]
+#
+# The book ranks the triples of villager cells to choose the assassins from
+# and gives, for each first card, the first turn of each player. The
+# villagers are shuffled but always start on the same cells, so a triple of
+# cells and an opening only depend on the layout of KNIGHTS and VILLAGERS.
+#
+# File format: MAGIC, the number of triples (u8) and the triples as three
+# cells (10*x+y) each, best first, then the number of openings (u8) and for
+# each one the player (u8), the card (4 bytes), the number of actions (u8)
+# and the actions in the two-byte encoding of protocol.py.
+
+import argparse
+import itertools
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from lib import game
+from kingandassassins import CARDS, VILLAGERS, new_game
+from bitboard import BitboardState
+from movegen import END, budget, spend, legalactions, piece, pushed
+from protocol import encodeactions, decodeactions
+from selfplay import PLAYERS, gameseed, playgame
+
+MAGIC = b'KABK\x01'
+DEFAULT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'openings.book')
+
+# Number of triples kept in the book
+TOP = 16
+
+
+def cardkey(card):
+    '''Key of a card in the book, cards received as JSON being lists.'''
+    return (int(card[0]), int(card[1]), bool(card[2]), int(card[3]))
+
+
+class OpeningBook:
+    '''Class representing an opening book file.
+
+    The file is only read on the first query, a missing file gives an empty
+    book. Queries are dictionary lookups.'''
+
+    def __init__(self, path=DEFAULT):
+        self.path = path
+        self._triples = None
+        self._openings = None
+
+    def _load(self):
+        self._triples, self._openings = [], {}
+        try:
+            with open(self.path, 'rb') as file:
+                data = file.read()
+        except OSError:
+            return
+        if not data.startswith(MAGIC):
+            raise ValueError('{}: not an opening book'.format(self.path))
+        i = len(MAGIC)
+        for t in range(data[i]):
+            self._triples.append(tuple(divmod(c, 10) for c in data[i + 1 + 3 * t:i + 4 + 3 * t]))
+        i += 1 + 3 * data[i]
+        count = data[i]
+        i += 1
+        for o in range(count):
+            player, card, n = data[i], data[i + 1:i + 5], data[i + 5]
+            key = (card[0], card[1], bool(card[2]), card[3])
+            self._openings[key, player] = decodeactions(data[i + 6:i + 6 + 2 * n])
+            i += 6 + 2 * n
+
+    def triples(self):
+        if self._triples is None:
+            self._load()
+        return self._triples
+
+    def triple(self):
+        '''Best triple of villager cells to choose the assassins from, None if the book is empty.'''
+        triples = self.triples()
+        return triples[0] if triples else None
+
+    def opening(self, card, player):
+        '''First turn of player for the first card, None if the book has none.'''
+        if self._openings is None:
+            self._load()
+        return self._openings.get((cardkey(card), player))
+
+    def play(self, visible, player, assassins=None):
+        '''First turn of player for the current card if it can be played on visible, None otherwise.'''
+        actions = self.opening(visible['card'], player)
+        if actions is None or not playable(visible, actions, player, assassins):
+            return None
+        return list(actions)
+
+
+def encodebook(triples, openings):
+    '''Encode a list of triples and a {(card, player): actions} dictionary.'''
+    data = bytearray(MAGIC)
+    data.append(len(triples))
+    for triple in triples:
+        data += bytes(x * 10 + y for x, y in triple)
+    data.append(len(openings))
+    for (card, player), actions in sorted(openings.items()):
+        data.append(player)
+        data += bytes((card[0], card[1], int(card[2]), card[3]))
+        data.append(len(actions))
+        data += encodeactions(actions)
+    return bytes(data)
+
+
+def playable(visible, actions, player, assassins=None, rules=None):
+    '''Check that actions can be played by player on the visible state.
+
+    The assassins must be given for the actions of player 0 to reveal them,
+    the actions are checked against the RuleTables rules (the standard rules
+    of the board by default).'''
+    hidden = {'assassins': set(assassins) if assassins is not None else None, 'cards': []}
+    bb = BitboardState.fromstate(visible, hidden, rules)
+    try:
+        for action in actions:
+            bb.apply(action, player)
+    except game.InvalidMoveException:
+        return False
+    return True
+
+
+class BookPlayer:
+    '''Player choosing the assassins in a triple of cells and playing an
+    opening as its first turn when it can, base playing the rest of the game.'''
+
+    def __init__(self, base, triple=None, opening=None):
+        self.base = base
+        self.triple = triple
+        self.opening = opening
+        self._first = True
+
+    def __call__(self, state, playernb):
+        visible = state._state['visible']
+        if state.isinitial():
+            if self.triple is None:
+                return self.base(state, playernb)
+            return [visible['people'][x][y] for x, y in self.triple]
+        if self._first:
+            self._first = False
+            if self.opening is not None and playable(visible, self.opening, playernb, state._state['hidden']['assassins'], state.rules):
+                return list(self.opening)
+        return self.base(state, playernb)
+
+
+def cardseeds(card, count, seed):
+    '''Seeds of count games whose first card is card.'''
+    seeds = []
+    for index in itertools.count():
+        s = gameseed(seed, index)
+        if new_game(s)._state['hidden']['cards'][-1] == card:
+            seeds.append(s)
+            if len(seeds) == count:
+                return seeds
+
+
+def _randomturn(state, player, rng):
+    left = budget(state._state['visible']['card'], player)
+    records = []
+    while True:
+        action = rng.choice(legalactions(state, player, left))
+        if action == END:
+            break
+        left = spend(left, action, piece(state, action), pushed(state, action))
+        records.append(state.make(action, player))
+    for record in reversed(records):
+        state.unmake(record)
+    return [record[0] for record in records]
+
+
+def candidates(card, player, triple, count, seed):
+    '''Random first turns of player for card, the empty turn being the first one.
+
+    Those of the assassins are drawn after an empty first turn of the king.'''
+    state = new_game(cardseeds(card, 1, seed)[0])
+    people = state._state['visible']['people']
+    state.setassassins([people[x][y] for x, y in triple])
+    state.update([], 0)
+    if player == 0:
+        state.update([], 1)
+    rng = random.Random(seed)
+    turns = [[]]
+    for i in range(count):
+        turn = _randomturn(state, player, rng)
+        if turn not in turns:
+            turns.append(turn)
+    return turns
+
+
+def score(side, seeds, triple, opening, assassins, king):
+    '''Score of side over the seeded games, side using the triple or the opening.
+
+    The score is the number of games won, ties being broken by the number
+    of plies it took to win them: the faster the better.'''
+    wins = plies = 0
+    for s in seeds:
+        players = (
+            BookPlayer(PLAYERS[assassins](), triple, opening if side == 0 else None),
+            BookPlayer(PLAYERS[king](), None, opening if side == 1 else None)
+        )
+        winner, length, invalid = playgame(players, s)
+        if winner == side:
+            wins += 1
+            plies += length
+    return wins, -plies
+
+
+def build(games=200, count=32, seed=0, workers=None, assassins='random', king='random'):
+    '''Compute the triples and the openings of a book by self-play.
+
+    Every candidate is played games times against the same seeded games, the
+    other side being played by the assassins or king players.'''
+    seeds = [gameseed(seed, i) for i in range(games)]
+    triples = list(itertools.combinations(sorted(VILLAGERS), 3))
+    openings = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        scores = pool.map(score, *zip(*((0, seeds, t, None, assassins, king) for t in triples)), chunksize=4)
+        ranked = [t for s, t in sorted(zip(scores, triples), key=lambda e: e[0], reverse=True)][:TOP]
+        for card in sorted(set(CARDS)):
+            seeds = cardseeds(card, games, seed)
+            for player in (1, 0):
+                turns = candidates(card, player, ranked[0], count, seed)
+                args = ((player, seeds, ranked[0], turn, assassins, king) for turn in turns)
+                scores = list(pool.map(score, *zip(*args)))
+                # The empty turn is the first candidate, an opening must do better than it
+                best = max(range(len(turns)), key=lambda i: scores[i])
+                if scores[best] > scores[0]:
+                    openings[card, player] = turns[best]
+    return ranked, openings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='King & Assassins opening book builder')
+    parser.add_argument('--assassins', help='player 0 of the games (default: random)', choices=sorted(PLAYERS), default='random')
+    parser.add_argument('--king', help='player 1 of the games (default: random)', choices=sorted(PLAYERS), default='random')
+    parser.add_argument('-n', '--games', help='games per candidate (default: 200)', type=int, default=200)
+    parser.add_argument('--candidates', help='first turns tried per card and player (default: 32)', type=int, default=32)
+    parser.add_argument('--seed', help='seed of the games (default: 0)', type=int, default=0)
+    parser.add_argument('-j', '--workers', help='number of processes (default: all cores)', type=int, default=None)
+    parser.add_argument('--output', help='book file to write (default: {})'.format(DEFAULT), default=DEFAULT)
+    args = parser.parse_args()
+
+    triples, openings = build(args.games, args.candidates, args.seed, args.workers, args.assassins, args.king)
+    with open(args.output, 'wb') as file:
+        file.write(encodebook(triples, openings))
+    print(json.dumps({'triples': triples[:3], 'openings': len(openings)}))
@@ -0,0 +1,170 @@
+# Precomputed shortest paths over the board
+# Distances and next hops between every pair of cells are computed once by
+# breadth-first search for two layers: 'ground' (cells the king can walk on)
+# and 'roof' (every cell, for the pieces that can climb on roofs)
+
+import heapq
+
+from rules import DIRECTIONS, DIRS
+
+SIZE = 10
+CELLS = SIZE * SIZE
+UNREACHABLE = 255
+
+# Next hop stored when there is none, the others are indices in DIRS
+NOHOP = len(DIRS)
+
+
+def _neighbours():
+    table = []
+    for c in range(CELLS):
+        x, y = divmod(c, SIZE)
+        row = []
+        for d in DIRS:
+            nx, ny = x + DIRECTIONS[d][0], y + DIRECTIONS[d][1]
+            row.append(nx * SIZE + ny if 0 <= nx < SIZE and 0 <= ny < SIZE else -1)
+        table.append(tuple(row))
+    return tuple(table)
+
+
+# NEIGHBOURS[c][i] is the cell next to c in direction DIRS[i], -1 if off the board
+NEIGHBOURS = _neighbours()
+
+
+class PathTable:
+    '''Class holding the all-pairs distance and next hop tables of a board.'''
+
+    def __init__(self, board):
+        walkable = {
+            'ground': [board[c // SIZE][c % SIZE] == 'G' for c in range(CELLS)],
+            'roof': [True] * CELLS
+        }
+        self.walkable = walkable
+        self.dist = {}
+        self.next = {}
+        for layer, cells in walkable.items():
+            self.dist[layer], self.next[layer] = self._build(cells)
+
+    @staticmethod
+    def _build(walkable):
+        dist = []
+        for src in range(CELLS):
+            row = bytearray([UNREACHABLE]) * CELLS
+            if walkable[src]:
+                row[src] = 0
+                frontier = [src]
+                while frontier:
+                    following = []
+                    for c in frontier:
+                        for n in NEIGHBOURS[c]:
+                            if n >= 0 and walkable[n] and row[n] == UNREACHABLE:
+                                row[n] = row[c] + 1
+                                following.append(n)
+                    frontier = following
+            dist.append(bytes(row))
+        # The grid is undirected, so dist[src][dst] == dist[dst][src]
+        hops = []
+        for src in range(CELLS):
+            row = bytearray([NOHOP]) * CELLS
+            for dst in range(CELLS):
+                d = dist[src][dst]
+                if 0 < d < UNREACHABLE:
+                    for i, n in enumerate(NEIGHBOURS[src]):
+                        if n >= 0 and dist[n][dst] == d - 1:
+                            row[dst] = i
+                            break
+            hops.append(bytes(row))
+        return dist, hops
+
+    def distance(self, src, dst, layer='roof'):
+        '''Length of the shortest path between two (x, y) cells ignoring people, None if unreachable.'''
+        d = self.dist[layer][src[0] * SIZE + src[1]][dst[0] * SIZE + dst[1]]
+        return None if d == UNREACHABLE else d
+
+    def nexthop(self, src, dst, layer='roof'):
+        '''Direction of the first step of a shortest path from src to dst, None if there is none.'''
+        i = self.next[layer][src[0] * SIZE + src[1]][dst[0] * SIZE + dst[1]]
+        return None if i == NOHOP else DIRS[i]
+
+    def route(self, src, dst, layer='roof'):
+        '''Directions of a shortest path from src to dst ignoring people.'''
+        s, t = src[0] * SIZE + src[1], dst[0] * SIZE + dst[1]
+        hops = self.next[layer]
+        if self.dist[layer][s][t] == UNREACHABLE:
+            return None
+        path = []
+        while s != t:
+            i = hops[s][t]
+            path.append(DIRS[i])
+            s = NEIGHBOURS[s][i]
+        return path
+
+    def astar(self, people, src, goals, layer='roof', push=None):
+        '''Cheapest path from src to any of the goals avoiding occupied cells.
+
+        push is an optional function push(c, i) giving the AP spent on pushing
+        people when stepping from cell c in direction DIRS[i] on an occupied
+        cell, None if it cannot be done, for the knights to go through crowds.
+        The cost of a push is estimated on the board as it is, before the
+        earlier steps of the path. The distance table is a lower bound of the
+        real cost, so it is used as the heuristic. Returns a list of
+        directions or None.'''
+        goals = [g[0] * SIZE + g[1] for g in goals]
+        if push is None:
+            goals = [g for g in goals if people[g // SIZE][g % SIZE] is None or g == src[0] * SIZE + src[1]]
+        if not goals:
+            return None
+        dist = self.dist[layer]
+        walkable = self.walkable[layer]
+        start = src[0] * SIZE + src[1]
+
+        def h(c):
+            return min(dist[c][g] for g in goals)
+
+        if h(start) == UNREACHABLE:
+            return None
+        targets = set(goals)
+        parent = {start: None}
+        cost = {start: 0}
+        queue = [(h(start), 0, start)]
+        while queue:
+            _, g, c = heapq.heappop(queue)
+            if c in targets:
+                path = []
+                while parent[c] is not None:
+                    c, i = parent[c]
+                    path.append(DIRS[i])
+                return path[::-1]
+            if g > cost[c]:
+                continue
+            for i, n in enumerate(NEIGHBOURS[c]):
+                if n < 0 or not walkable[n]:
+                    continue
+                step = 1
+                if people[n // SIZE][n % SIZE] is not None and n != start:
+                    extra = push(c, i) if push is not None else None
+                    if extra is None:
+                        continue
+                    step += extra
+                if g + step < cost.get(n, UNREACHABLE):
+                    cost[n] = g + step
+                    parent[n] = (c, i)
+                    heapq.heappush(queue, (g + step + h(n), g + step, n))
+        return None
+
+    def kingroute(self, people, king, castle):
+        '''Route of the king to the nearest castle door, including the final step through it.'''
+        best = None
+        for x, y, d in castle:
+            path = self.astar(people, king, [(x, y)], 'ground')
+            if path is not None and (best is None or len(path) + 1 < len(best)):
+                best = path + [d]
+        return best
+
+    def approach(self, people, src, target, layer='roof', push=None):
+        '''Route from src to a cell next to target, for example an assassin going to the king.
+
+        The cell must be free unless push is given (see astar()).'''
+        t = target[0] * SIZE + target[1]
+        goals = [divmod(n, SIZE) for n in NEIGHBOURS[t] if n >= 0]
+        return self.astar(people, src, goals, layer, push)
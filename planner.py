@@ -0,0 +1,134 @@
+# Planner of the assassins' turns
+# Every (assassin, target) pair is first bounded with the distance table, only
+# the pairs that may fit in the AP of the turn get a real path with A*, and the
+# plans are then assigned jointly so that two assassins never chase the same
+# knight and the AP of the card are not overspent
+
+import time
+from collections import namedtuple
+
+from rules import DIRS, DIRECTIONS
+
+# Value of the outcomes of a plan
+KILL = 3
+ATTACK = 10
+REGICIDE = 100
+
+# Default time allowed to plan a turn, in seconds
+DEADLINE = 0.2
+
+Plan = namedtuple('Plan', 'assassin target path hits cost value')
+
+
+def _direction(src, dst):
+    for d in DIRS:
+        if (src[0] + DIRECTIONS[d][0], src[1] + DIRECTIONS[d][1]) == dst:
+            return d
+
+
+class AssassinPlanner:
+    '''Class planning the turns of the assassins with shared path tables.'''
+
+    def __init__(self, paths, deadline=DEADLINE):
+        self.paths = paths
+        self.deadline = deadline
+
+    def candidates(self, people, assassins, king, knights, ap, health, stop):
+        '''Plans of every assassin against every target that fit in ap, computed until time stop.
+
+        assassins are coordinates, health is the number of attacks the king
+        can still take.'''
+        bounds = []
+        for a, src in enumerate(assassins):
+            for target in ([king] if king is not None else []) + sorted(knights):
+                d = self.paths.distance(src, target)
+                # Reaching a cell next to the target costs at least d - 1 moves, and one more AP to hit
+                if d is not None and d <= ap:
+                    bounds.append((d, a, target))
+        plans = []
+        for d, a, target in sorted(bounds):
+            if time.perf_counter() > stop:
+                break
+            path = self.paths.approach(people, assassins[a], target)
+            if path is None or len(path) >= ap:
+                continue
+            if target == king:
+                hits = min(health, ap - len(path))
+                value = hits * ATTACK + (REGICIDE if hits == health else 0)
+            else:
+                hits = 1
+                value = KILL
+            plans.append(Plan(a, target, path, hits, len(path) + hits, value))
+        return plans
+
+    def assign(self, plans, count, ap, king, health):
+        '''Best set of plans, at most one per assassin and per knight, within ap.'''
+        byassassin = [[p for p in plans if p.assassin == a] for a in range(count)]
+        best = ([], (0, 0))
+
+        def search(a, chosen, cost, knights, kinghits):
+            nonlocal best
+            if a == count:
+                value = sum(p.value for p in chosen if p.target != king)
+                if kinghits:
+                    hits = min(kinghits, health)
+                    value += hits * ATTACK + (REGICIDE if hits == health else 0)
+                if (value, -cost) > best[1]:
+                    best = (list(chosen), (value, -cost))
+                return
+            search(a + 1, chosen, cost, knights, kinghits)
+            for p in byassassin[a]:
+                if cost + p.cost > ap or p.target in knights:
+                    continue
+                chosen.append(p)
+                if p.target == king:
+                    search(a + 1, chosen, cost + p.cost, knights, kinghits + p.hits)
+                else:
+                    search(a + 1, chosen, cost + p.cost, knights | {p.target}, kinghits)
+                chosen.pop()
+
+        search(0, [], 0, frozenset(), 0)
+        return best[0]
+
+    def plan(self, people, index, assassins, hidden, ap, health, deadline=None):
+        '''Actions of the assassins' turn.
+
+        index is the PositionIndex of people, assassins are the coordinates
+        of the assassins, hidden tells which ones are still villagers (they
+        are revealed only before they hit), ap is the AP of the card and
+        health the number of attacks the king can still take. The plans are replayed on a copy of the board, so
+        that a plan blocked by an earlier one is dropped instead of giving an
+        illegal action.'''
+        stop = time.perf_counter() + (self.deadline if deadline is None else deadline)
+        king = index.where.get('king')
+        knights = frozenset(index.classes['knight'])
+        plans = self.candidates(people, assassins, king, knights, ap, health, stop)
+        chosen = self.assign(plans, len(assassins), ap, king, health)
+        board = [list(row) for row in people]
+        actions = []
+        left = ap
+        for p in sorted(chosen, key=lambda p: p.cost):
+            x, y = assassins[p.assassin]
+            path = self.paths.approach(board, (x, y), p.target)
+            if path is None or len(path) + 1 > left:
+                continue
+            for d in path:
+                nx, ny = x + DIRECTIONS[d][0], y + DIRECTIONS[d][1]
+                board[nx][ny], board[x][y] = board[x][y], None
+                actions.append(('move', x, y, d))
+                x, y = nx, ny
+            left -= len(path)
+            if hidden[p.assassin]:
+                actions.append(('reveal', x, y))
+                board[x][y] = 'assassin'
+            d = _direction((x, y), p.target)
+            tx, ty = p.target
+            if board[tx][ty] == 'knight':
+                actions.append(('kill', x, y, d))
+                board[tx][ty] = None
+                left -= 1
+            elif board[tx][ty] == 'king':
+                hits = min(p.hits, left)
+                actions += [('attack', x, y, d)] * hits
+                left -= hits
+        return actions
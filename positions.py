@@ -0,0 +1,85 @@
+# Index of the positions of the pieces on the board
+# Kept up to date incrementally by KingAndAssassinsState.update() so that the
+# AI can find pieces and nearest targets without scanning the whole board
+
+# Classes of pieces, every other name is a villager
+CLASSES = ('king', 'knight', 'assassin', 'villager')
+
+
+def classof(name):
+    return name if name in ('king', 'knight', 'assassin') else 'villager'
+
+
+def manhattan(a, b):
+    return abs(a[0] - b[0]) + abs(a[1] - b[1])
+
+
+class PositionIndex:
+    '''Class mapping pieces to coordinates and coordinates to pieces.
+
+    Knights and revealed assassins are not unique, so only the king and the
+    villagers can be found by name with where, every class has a set of
+    coordinates in classes.'''
+
+    def __init__(self):
+        self.at = {}
+        self.where = {}
+        self.classes = {cls: set() for cls in CLASSES}
+
+    @classmethod
+    def fromgrid(cls, people):
+        index = cls()
+        for x, row in enumerate(people):
+            for y, name in enumerate(row):
+                if name is not None:
+                    index.place((x, y), name)
+        return index
+
+    def copy(self):
+        index = PositionIndex()
+        index.at = dict(self.at)
+        index.where = dict(self.where)
+        index.classes = {cls: set(coords) for cls, coords in self.classes.items()}
+        return index
+
+    def place(self, coord, name):
+        self.at[coord] = name
+        cls = classof(name)
+        self.classes[cls].add(coord)
+        if cls in ('king', 'villager'):
+            self.where[name] = coord
+
+    def remove(self, coord):
+        name = self.at.pop(coord)
+        cls = classof(name)
+        self.classes[cls].discard(coord)
+        if self.where.get(name) == coord:
+            del self.where[name]
+        return name
+
+    def set(self, coord, name):
+        '''Change the content of a cell, name being None for an empty cell.'''
+        if coord in self.at:
+            self.remove(coord)
+        if name is not None:
+            self.place(coord, name)
+
+    def nearest(self, coord, cls, maxdist=None, paths=None, layer='roof'):
+        '''Coordinates of the nearest piece of class cls, None if there is none within maxdist.
+
+        The distance is the Manhattan distance, or the length of the shortest
+        path ignoring people if a PathTable is given.'''
+        best, bestdist = None, None
+        for target in self.classes[cls]:
+            if paths is None:
+                dist = manhattan(coord, target)
+            else:
+                dist = paths.distance(coord, target, layer)
+                if dist is None:
+                    continue
+            # Ties are broken on the coordinates so that the result is deterministic
+            if best is None or (dist, target) < (bestdist, best):
+                best, bestdist = target, dist
+        if best is None or maxdist is not None and bestdist > maxdist:
+            return None
+        return best
@@ -0,0 +1,119 @@
+# Binary protocol for remote players
+# Every message is a frame: a 4-byte big-endian length, a 1-byte type and the
+# payload, so that messages of any size can be sent without truncation.
+# Actions take two bytes each (opcode and direction, then the cell) and the
+# state is sent once in full and then as deltas carrying only what changed
+# (see views.py for how they are computed).
+
+import json
+import struct
+
+from kingandassassins import POPULATION
+from rules import DIRS
+
+# Frame types
+JSON, ACTIONS, STATE, DELTA = range(4)
+
+HEADER = struct.Struct('>IB')
+MAX_FRAME = 1 << 20
+
+OPCODES = ('move', 'arrest', 'kill', 'attack', 'reveal')
+
+# Piece ids used in deltas, the villagers follow the fixed pieces
+PIECES = (None, 'king', 'knight', 'assassin') + tuple(sorted(POPULATION))
+PIECE_IDS = {piece: i for i, piece in enumerate(PIECES)}
+HEALTH = ('healthy', 'injured', 'dead')
+NO_CARD = 0xff
+
+
+class ProtocolError(Exception):
+    '''Exception raised when a frame cannot be decoded.'''
+    pass
+
+
+def frame(type, payload):
+    return HEADER.pack(len(payload), type) + payload
+
+
+def jsonframe(message):
+    return frame(JSON, json.dumps(message, separators=(',', ':')).encode())
+
+
+async def readframe(reader):
+    '''Read one frame from an asyncio stream and return its (type, payload).'''
+    length, type = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if length > MAX_FRAME:
+        raise ProtocolError('frame of {} bytes is too large'.format(length))
+    return type, await reader.readexactly(length)
+
+
+def encodeactions(actions):
+    data = bytearray()
+    for action in actions:
+        try:
+            op = OPCODES.index(action[0])
+            dir = DIRS.index(action[3]) if op != 4 else 0
+            cell = int(action[1]) * 10 + int(action[2])
+        except (ValueError, IndexError, TypeError):
+            raise ProtocolError('{}: action cannot be encoded'.format(action))
+        if not 0 <= cell < 100:
+            raise ProtocolError('{}: position off the board'.format(action))
+        data.append(op << 2 | dir)
+        data.append(cell)
+    return bytes(data)
+
+
+def decodeactions(data):
+    if len(data) % 2:
+        raise ProtocolError('truncated action list')
+    actions = []
+    for i in range(0, len(data), 2):
+        op, cell = data[i] >> 2, data[i + 1]
+        if op >= len(OPCODES) or cell >= 100:
+            raise ProtocolError('invalid action {!r}'.format(data[i:i + 2]))
+        x, y = divmod(cell, 10)
+        if OPCODES[op] == 'reveal':
+            actions.append(('reveal', x, y))
+        else:
+            actions.append((OPCODES[op], x, y, DIRS[data[i] & 3]))
+    return actions
+
+
+def encodediff(diff):
+    '''Encode a view diff produced by views.ViewTracker.diff().'''
+    card = diff['card']
+    data = bytearray(struct.pack('>II', diff['version'], diff['base']))
+    data += bytes([NO_CARD] * 4 if card is None else [card[0], card[1], int(card[2]), card[3]])
+    data += bytes([HEALTH.index(diff['king']), diff['killed']['knights'], diff['killed']['assassins']])
+    data.append(len(diff['arrested']))
+    data += bytes(PIECE_IDS[name] for name in diff['arrested'])
+    data.append(len(diff['cells']))
+    for (x, y), piece in diff['cells']:
+        data += bytes((x * 10 + y, PIECE_IDS[piece]))
+    data += encodeactions(diff['lastopponentmove'])
+    return bytes(data)
+
+
+def decodediff(data):
+    '''Decode a view diff, to be applied with views.applydiff().'''
+    try:
+        version, base = struct.unpack_from('>II', data)
+        card = data[8:12]
+        n = data[15]
+        i = 16 + n
+        changes = data[i]
+        end = i + 1 + 2 * changes
+        if end > len(data):
+            raise ProtocolError('truncated delta')
+        return {
+            'version': version,
+            'base': base,
+            'card': None if card[0] == NO_CARD else [card[0], card[1], bool(card[2]), card[3]],
+            'king': HEALTH[data[12]],
+            'killed': {'knights': data[13], 'assassins': data[14]},
+            'arrested': [PIECES[id] for id in data[16:i]],
+            'cells': [(divmod(data[j], 10), PIECES[data[j + 1]]) for j in range(i + 1, end, 2)],
+            'lastopponentmove': decodeactions(data[end:])
+        }
+    except (IndexError, struct.error):
+        raise ProtocolError('truncated delta')
@@ -0,0 +1,146 @@
+# Precompiled rule tables used to validate the actions
+# Pieces are reduced to a type id, and who may do an action and on what target
+# are boolean matrices indexed by those ids, so that a check is a table lookup
+# instead of string comparisons. Rule variants are other matrices given to
+# RuleTables.
+
+SIZE = 10
+CELLS = SIZE * SIZE
+
+# Piece types, every name that is not one of the others is a villager
+EMPTY, KING, KNIGHT, ASSASSIN, VILLAGER = range(5)
+TYPES = (EMPTY, KING, KNIGHT, ASSASSIN, VILLAGER)
+KINDS = {None: EMPTY, 'king': KING, 'knight': KNIGHT, 'assassin': ASSASSIN}
+
+ACTIONS = ('move', 'arrest', 'kill', 'attack', 'reveal')
+DIRS = ('N', 'E', 'S', 'W')
+DIRECTIONS = {
+    'E': (0, 1),
+    'W': (0, -1),
+    'S': (1, 0),
+    'N': (-1, 0)
+}
+DIR_INDEX = {d: i for i, d in enumerate(DIRS)}
+
+# Neighbour of a cell off the board
+OFF = -1
+
+# Pieces each player may do each action with
+ACTORS = {
+    'move': {0: {VILLAGER, ASSASSIN}, 1: {KING, KNIGHT}},
+    'arrest': {0: set(), 1: {KNIGHT}},
+    'kill': {0: {ASSASSIN}, 1: {KNIGHT}},
+    'attack': {0: {ASSASSIN}, 1: set()},
+    'reveal': {0: {VILLAGER}, 1: set()}
+}
+
+# Pieces each type of piece may target with each action, knights may move on
+# occupied cells to push people (see PUSHED)
+TARGETS = {
+    'move': {KING: {EMPTY}, KNIGHT: set(TYPES), ASSASSIN: {EMPTY}, VILLAGER: {EMPTY}},
+    'arrest': {KNIGHT: {VILLAGER}},
+    'kill': {ASSASSIN: {KNIGHT}, KNIGHT: {ASSASSIN}},
+    'attack': {ASSASSIN: {KING}},
+    'reveal': {}
+}
+
+# Pieces a knight may push, and pieces that may be pushed on a roof
+PUSHED = {KNIGHT, ASSASSIN, VILLAGER}
+ROOFED = set()
+
+# Count of the visible state each type of killed piece adds to, no other type may be killed
+KILLED = {KNIGHT: 'knights', ASSASSIN: 'assassins'}
+
+
+def kindof(name):
+    return KINDS.get(name, VILLAGER)
+
+
+def cell(x, y):
+    return x * SIZE + y
+
+
+class RuleTables:
+    '''Class holding the tables of a board and a set of rules.
+
+    actor[action][player][type] tells whether player may do action with a
+    piece of that type, target[action][type][target type] whether a piece
+    of that type may do it on a piece of the target type, neighbour[c][i]
+    is the cell next to c in direction DIRS[i] (OFF if off the board),
+    kingstep[c][i] whether the king may step from c in that direction,
+    pushed[type] whether a knight may push a piece of that type and
+    roofed[type] whether it may be pushed on a roof. Raises ValueError if
+    the kill targets have a type no count of KILLED keeps.'''
+
+    def __init__(self, board, castle, actors=ACTORS, targets=TARGETS, pushed=PUSHED, roofed=ROOFED):
+        uncounted = set().union(*targets['kill'].values()) - set(KILLED)
+        if uncounted:
+            raise ValueError('killed pieces of types {} are not counted'.format(sorted(uncounted)))
+        self.coords = tuple(divmod(c, SIZE) for c in range(CELLS))
+        self.neighbour = []
+        for c in range(CELLS):
+            x, y = self.coords[c]
+            row = []
+            for d in DIRS:
+                nx, ny = x + DIRECTIONS[d][0], y + DIRECTIONS[d][1]
+                row.append(cell(nx, ny) if 0 <= nx < SIZE and 0 <= ny < SIZE else OFF)
+            self.neighbour.append(tuple(row))
+        self.neighbour = tuple(self.neighbour)
+        # The king may only step on a roof through a door of the castle
+        doors = {(x, y, d) for x, y, d in castle}
+        self.kingstep = tuple(
+            tuple(
+                t != OFF and (board[t // SIZE][t % SIZE] == 'G' or self.coords[c] + (DIRS[i],) in doors)
+                for i, t in enumerate(self.neighbour[c])
+            )
+            for c in range(CELLS)
+        )
+        self.actor = {
+            action: tuple(tuple(kind in actors[action][player] for kind in TYPES) for player in range(2))
+            for action in ACTIONS
+        }
+        self.target = {
+            action: tuple(tuple(t in targets[action].get(kind, ()) for t in TYPES) for kind in TYPES)
+            for action in ACTIONS
+        }
+        self.roof = tuple(board[x][y] == 'R' for x, y in self.coords)
+        self.pushed = tuple(kind in pushed for kind in TYPES)
+        self.roofed = tuple(kind in roofed for kind in TYPES)
+        # Whether a player may do an action at all, whatever the piece
+        self.allowed = {action: tuple(any(self.actor[action][player]) for player in range(2)) for action in ACTIONS}
+
+    def step(self, x, y, d):
+        '''Cell next to (x, y) in direction d, OFF if it is off the board or the action is malformed.'''
+        i = DIR_INDEX.get(d)
+        if i is None or not (0 <= x < SIZE and 0 <= y < SIZE):
+            return OFF
+        return self.neighbour[cell(x, y)][i]
+
+    def push(self, kindat, c, i):
+        '''Chain of the people pushed by a knight stepping from c in direction DIRS[i].
+
+        kindat(cell) is the type of the piece on a cell. The chain is the
+        list of the occupied cells in front of the knight followed by the
+        free cell the last person is pushed on, it is found in one walk along
+        the neighbour table. Returns a (chain, reason) pair, chain being None
+        and reason telling why if the push is forbidden.'''
+        chain = []
+        t = self.neighbour[c][i]
+        while t != OFF:
+            kind = kindat(t)
+            chain.append(t)
+            if kind == EMPTY:
+                return chain, None
+            if not self.pushed[kind]:
+                return None, 'the {} cannot be pushed'.format('king' if kind == KING else 'piece')
+            t = self.neighbour[t][i]
+            if t != OFF and self.roof[t] and not self.roofed[kind]:
+                return None, 'cannot push people on a roof'
+        return None, 'cannot push people off the board'
+
+    def pushcost(self, kindat, c, i):
+        '''AP a knight stepping from c in direction DIRS[i] spends on pushing, None if it cannot.
+
+        Each pushed person costs one AP on top of the move.'''
+        chain, reason = self.push(kindat, c, i)
+        return None if chain is None else len(chain) - 1
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# selfplay.py
+# In-process match engine: drives KingAndAssassinsState.update() directly
+# with player callables, without sockets, JSON or printing
+
+import argparse
+import cProfile
+import json
+import os
+import random
+
+from lib import game
+from kingandassassins import POPULATION, KingAndAssassinsClient, KingAndAssassinsState, new_game
+from gamelog import GameLog, GameRecord
+from movegen import END, budget, spend, legalactions, piece, pushed
+
+# A player is a callable player(state, playernb) returning:
+# - a list of villagers' names when state.isinitial() (assassins selection)
+# - a list of actions otherwise
+# The state must not be modified by the player.
+
+
+def gameseed(seed, index):
+    '''Deterministic seed of the index-th game of a run started with seed.'''
+    return (seed * 1000003 + index) & 0xffffffff
+
+
+def playgame(players, seed, log=None):
+    '''Play one game and return a (winner, plies, invalid) tuple.
+
+    An invalid move makes the player who sent it lose the game, invalid is
+    then the number of that player and None otherwise. An exception raised
+    by a player is not an invalid move, it is left to the caller. The game
+    is appended to log, a GameLog, if one is given.'''
+    state = new_game(seed)
+    record = GameRecord.fromstate(state) if log is not None else None
+    current = 0
+    plies = 0
+    while True:
+        move = players[current](state, current)
+        try:
+            if state.isinitial():
+                if len(move) != 3 or not set(move) <= POPULATION:
+                    raise game.InvalidMoveException('Three villagers must be chosen as assassins')
+                state.setassassins(move)
+                state.update([], 0)
+                if record is not None:
+                    record.setassassins(move)
+                    record.addturn([])
+            else:
+                state.update(move, current)
+                if record is not None:
+                    record.addturn(move)
+        except (game.InvalidMoveException, LookupError, TypeError, ValueError):
+            # The move is refused by the rules or is malformed, as KingAndAssassinsServer.applymove would
+            return _endgame(log, record, (1 - current, plies, current))
+        plies += 1
+        winner = state.winner()
+        if winner != -1:
+            return _endgame(log, record, (winner, plies, None))
+        current = 1 - current
+
+
+def _endgame(log, record, result):
+    if record is not None:
+        record.winner = result[0]
+        log.append(record)
+    return result
+
+
+def runmatches(factories, games, seed=0, log=None, profile=None):
+    '''Play games seeded games and return aggregate statistics by side.
+
+    factories is a pair of callables building a fresh player for each game.
+    If profile is a directory, the cProfile statistics of game i are
+    written to game-i.prof in it.'''
+    stats = newstats()
+    for index in range(games):
+        players = (factories[0](), factories[1]())
+        try:
+            if profile is None:
+                result = playgame(players, gameseed(seed, index), log)
+            else:
+                profiler = cProfile.Profile()
+                result = profiler.runcall(playgame, players, gameseed(seed, index), log)
+                profiler.dump_stats(os.path.join(profile, 'game-{}.prof'.format(index)))
+        finally:
+            closeplayers(players)
+        addresult(stats, result)
+    return stats
+
+
+def closeplayers(players):
+    '''Release what the players hold (the processes of an MCTSPlayer), for those that have a close() method.'''
+    for player in players:
+        close = getattr(player, 'close', None)
+        if close is not None:
+            close()
+
+
+def newstats():
+    return {'games': 0, 'wins': [0, 0], 'invalid': [0, 0], 'plies': 0}
+
+
+def addresult(stats, result):
+    winner, plies, invalid = result
+    stats['games'] += 1
+    stats['wins'][winner] += 1
+    stats['plies'] += plies
+    if invalid is not None:
+        stats['invalid'][invalid] += 1
+    return stats
+
+
+def mergestats(stats, other):
+    stats['games'] += other['games']
+    stats['plies'] += other['plies']
+    for side in range(2):
+        stats['wins'][side] += other['wins'][side]
+        stats['invalid'][side] += other['invalid'][side]
+    return stats
+
+
+def winrates(stats):
+    return [w / stats['games'] if stats['games'] else 0.0 for w in stats['wins']]
+
+
+def idleplayer(state, playernb):
+    '''Never moves, chooses the three first villagers in alphabetical order.'''
+    if state.isinitial():
+        return sorted(POPULATION)[:3]
+    return []
+
+
+class ScriptedPlayer:
+    '''Adapter running the scripted AI of KingAndAssassinsClient in-process.
+
+    The AI receives the same JSON view a remote client would get.'''
+
+    def __init__(self):
+        self._client = KingAndAssassinsClient.__new__(KingAndAssassinsClient)
+        self._client._turn = -1
+        self._client._ai = None
+        self._client._book = None
+        self._client._beliefs = None
+
+    def __call__(self, state, playernb):
+        self._client._playernb = playernb
+        view = KingAndAssassinsState(json.loads(json.dumps(state._state['visible'])))
+        move = json.loads(self._client._nextmove(view))
+        return move['assassins'] if state.isinitial() else move['actions']
+
+
+class RandomPlayer:
+    '''Plays uniformly random legal actions until it chooses to end its turn.
+
+    The random generator is seeded with the hash of the state, so that games
+    between random players only depend on the seed of the game.'''
+
+    def __call__(self, state, playernb):
+        rng = random.Random(state.zobrist())
+        if state.isinitial():
+            return rng.sample(sorted(POPULATION), 3)
+        left = budget(state._state['visible']['card'], playernb)
+        records = []
+        while True:
+            action = rng.choice(legalactions(state, playernb, left))
+            if action == END:
+                break
+            left = spend(left, action, piece(state, action), pushed(state, action))
+            records.append(state.make(action, playernb))
+        # Leave the state as it was given
+        for record in reversed(records):
+            state.unmake(record)
+        return [record[0] for record in records]
+
+
+# Players that can be selected by name, each entry builds a new player
+PLAYERS = {
+    'idle': lambda: idleplayer,
+    'random': RandomPlayer,
+    'scripted': ScriptedPlayer
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='King & Assassins self-play')
+    parser.add_argument('--assassins', help='player 0 (default: scripted)', choices=sorted(PLAYERS), default='scripted')
+    parser.add_argument('--king', help='player 1 (default: scripted)', choices=sorted(PLAYERS), default='scripted')
+    parser.add_argument('-n', '--games', help='number of games (default: 1000)', type=int, default=1000)
+    parser.add_argument('--seed', help='seed of the run (default: 0)', type=int, default=0)
+    parser.add_argument('--log', help='game log file to append the games to', default=None)
+    parser.add_argument('--metrics', help='file to write the metrics to, as JSON if it ends with .json (Prometheus text otherwise)', default=None)
+    parser.add_argument('--profile', help='directory to write the cProfile statistics of each game to', default=None)
+    args = parser.parse_args()
+
+    metrics = None
+    if args.metrics is not None:
+        from metrics import Metrics, install
+        metrics = install(Metrics(args.metrics))
+    if args.profile is not None:
+        os.makedirs(args.profile, exist_ok=True)
+    log = GameLog(args.log) if args.log is not None else None
+    stats = runmatches((PLAYERS[args.assassins], PLAYERS[args.king]), args.games, args.seed, log, args.profile)
+    if log is not None:
+        log.close()
+    if metrics is not None:
+        metrics.write()
+    stats['winrates'] = winrates(stats)
+    print(json.dumps(stats))
@@ -0,0 +1,40 @@
+# Copy-on-write people grid of the states
+# The rows of a grid are shared with the grids it was forked from and to, and a
+# row is only copied the first time one of its cells is written. Forking a
+# state then costs the ten row references, plus a copy of each row changed
+# afterwards, instead of a deep copy of the whole grid.
+
+
+class SharedGrid(list):
+    '''Class representing a grid of people whose rows are copied on the first write.
+
+    It is a list of rows, so grid[x][y] reads a cell and the grid can be
+    given to json.dumps() as before, but cells must be written with set():
+    a row written directly may be shared with other grids. The cells
+    changed by an update are journaled by the state (see
+    KingAndAssassinsState.recordchanges()), not by the grid.'''
+
+    __slots__ = ('_owned',)
+
+    def __init__(self, rows=()):
+        super().__init__(rows)
+        # Bit x is set when row x belongs to this grid only
+        self._owned = 0
+
+    def set(self, x, y, value):
+        if not self._owned >> x & 1:
+            self[x] = list(self[x])
+            self._owned |= 1 << x
+        self[x][y] = value
+
+    def fork(self):
+        '''New grid sharing every row with this one, both copy a row before writing it.
+
+        The content of this grid is left as it is, only its rows are marked
+        as shared again.'''
+        self._owned = 0
+        return SharedGrid(self)
+
+    def __reduce__(self):
+        # Pickled grids (sent to the search processes) are plain rows again
+        return SharedGrid, ([list(row) for row in self],)
@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+from asyncserver import Connection, Match
+
+
+class Writer:
+    '''Writer of a connection keeping what the server sends.'''
+
+    def __init__(self):
+        self.data = b''
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def connection(name, lines=(), eof=True):
+    reader = asyncio.StreamReader()
+    for line in lines:
+        reader.feed_data(line)
+    if eof:
+        reader.feed_eof()
+    return Connection(reader, Writer(), name)
+
+
+def test_move_that_is_not_an_object_ends_the_match():
+    async def main():
+        match = Match([connection('rogue', [b'[1,2]\n']), connection('fair')], 0, 1.0)
+        return match, await match.run()
+    match, winner = asyncio.run(main())
+    assert winner == 1
+    assert 'JSON object' in match.reason
+
+
+def test_resync_requests_share_the_timeout_of_the_turn():
+    async def main():
+        # The rogue keeps asking for the view and never plays
+        rogue = connection('rogue', [b'{"type":"resync"}\n'] * 100000, eof=False)
+        match = Match([rogue, connection('fair')], 0, 0.2)
+        return match, await match.run()
+    start = time.perf_counter()
+    match, winner = asyncio.run(main())
+    assert winner == 1
+    assert match.reason == 'rogue: timeout'
+    assert time.perf_counter() - start < 5
+
+
+def test_invalid_move_is_counted_once():
+    from metrics import Metrics, install, uninstall
+    metrics = install(Metrics())
+    try:
+        async def main():
+            assassins = connection('assassins', [b'{"assassins":["monk","farmer","squire"]}\n'])
+            king = connection('king', [b'{"actions":[["move",0,0,"S"]]}\n'])
+            match = Match([assassins, king], 0, 1.0, metrics)
+            return await match.run()
+        assert asyncio.run(main()) == 0
+    finally:
+        uninstall()
+    assert sum(metrics.invalid.values()) == 1
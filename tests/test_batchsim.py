@@ -0,0 +1,47 @@
+import pytest
+
+from kingandassassins import BOARD, KA_INITIAL_STATE
+from rules import ACTORS, KING, KNIGHT, RuleTables
+
+pytest.importorskip('numpy')
+from batchsim import KNIGHT_SLOTS, BatchSimulator
+
+
+def consistent(sim):
+    # Every piece on the board is in the slot of its cell and the other way round
+    for row in range(sim.games):
+        for s, c in enumerate(sim.cells[row]):
+            if c >= 0:
+                assert sim.slot[row, c] == s and sim.pieces[row, c] != 0
+        assert (sim.pieces[row] != 0).sum() == (sim.cells[row] >= 0).sum()
+
+
+def test_games_end_and_stay_consistent():
+    sim = BatchSimulator(200, seed=1)
+    player = 1
+    while (sim.winner == -1).any():
+        sim.ply(player)
+        consistent(sim)
+        player = 1 - player
+    assert sim.plies > 200
+    assert (sim.killed[:, 0] <= len(KNIGHT_SLOTS)).all() and (sim.killed[:, 1] <= 3).all()
+    assert (sim.health <= 2).all()
+
+
+def test_same_seed_same_games():
+    first, second = BatchSimulator(100, seed=3), BatchSimulator(100, seed=3)
+    assert (first.run() == second.run()).all()
+    assert (first.pieces == second.pieces).all() and first.plies == second.plies
+    assert (BatchSimulator(100, seed=4).names != first.names).any()
+
+
+def test_rules_variant_is_followed():
+    # The king's team may not move: the king never reaches the castle
+    still = RuleTables(BOARD, KA_INITIAL_STATE['castle'], actors=dict(ACTORS, move={0: ACTORS['move'][0], 1: set()}))
+    sim = BatchSimulator(100, seed=0, rules=still)
+    start = sim.pieces.copy()
+    wins = sim.run()
+    assert wins[1] == (sim.killed[:, 1] + (sim.arrested & sim.assassins).sum(axis=1) >= 3).sum()
+    # The king and the knights left on the board did not move
+    for kind in (KING, KNIGHT):
+        assert ((sim.pieces == kind) <= (start == kind)).all()
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from beliefs import AssassinBeliefs
+from kingandassassins import POPULATION, new_game
+from positions import PositionIndex
+from selfplay import RandomPlayer
+
+
+def observed(seed):
+    '''Beliefs of the knights' player at each of its turns in a random game, with the true assassins.'''
+    state = new_game(seed)
+    players = (RandomPlayer(), RandomPlayer())
+    beliefs = AssassinBeliefs(POPULATION)
+    current = 0
+    while True:
+        if current == 1 and not state.isinitial():
+            # The client only has the JSON view of the state
+            visible = json.loads(json.dumps(state._state['visible']))
+            beliefs.observe(visible, PositionIndex.fromgrid(visible['people']))
+            yield beliefs, state._state['hidden']['assassins']
+        move = players[current](state, current)
+        if state.isinitial():
+            state.setassassins(move)
+            state.update([], 0)
+        else:
+            state.update(move, current)
+        if state.winner() != -1:
+            return
+        current = 1 - current
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_true_triple_is_never_pruned(seed):
+    for beliefs, assassins in observed(seed):
+        truth = tuple(sorted(beliefs.names.index(name) for name in assassins))
+        assert beliefs.alive >> beliefs.triples.index(truth) & 1
+        probabilities = beliefs.probabilities()
+        assert sum(probabilities.values()) == pytest.approx(3)
+        for name in assassins:
+            assert probabilities[name] > 0
+
+
+def test_observations_restrict_the_triples():
+    beliefs = AssassinBeliefs(['a', 'b', 'c', 'd', 'e'])
+    assert len(beliefs) == 10
+    beliefs.assassin('a')
+    assert len(beliefs) == 6
+    beliefs.innocent('b')
+    assert len(beliefs) == 3
+    assert beliefs.probabilities()['a'] == pytest.approx(1)
+    assert beliefs.probabilities()['b'] == 0
+    # A contradiction is ignored
+    beliefs.innocent('a')
+    assert len(beliefs) == 3
+
+
+def test_suspect_prefers_the_most_probable_then_the_nearest():
+    beliefs = AssassinBeliefs(['a', 'b', 'c', 'd', 'e'])
+    beliefs.assassin('c')
+    candidates = [((0, 1), 'a'), ((5, 5), 'c'), ((0, 2), 'b')]
+    assert beliefs.suspect((0, 0), candidates) == (5, 5)
+    assert beliefs.suspect((0, 0), candidates, maxdist=3) == (0, 1)
+    assert beliefs.suspect((9, 9), [((0, 0), 'a')], maxdist=2) is None
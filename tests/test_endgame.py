@@ -0,0 +1,97 @@
+import random
+
+import pytest
+
+from endgame import Tablebase, Geometry, WIN, LOSS, NEVER, build, encodetables, solve
+from kingandassassins import BOARD, CARDS, KA_INITIAL_STATE, KingAndAssassinsState, SharedGrid
+
+np = pytest.importorskip('numpy')
+
+CASTLE = KA_INITIAL_STATE['castle']
+GROUNDS = [(x, y) for x in range(10) for y in range(10) if BOARD[x][y] == 'G']
+
+
+def endgame(king, assassins, blockers=(), health='healthy', card=CARDS[0], cardsleft=5):
+    '''Engine state of the king against revealed assassins, blockers being innocent villagers.'''
+    people = [[None] * 10 for row in range(10)]
+    people[king[0]][king[1]] = 'king'
+    for x, y in assassins:
+        people[x][y] = 'assassin'
+    for x, y in blockers:
+        people[x][y] = 'monk'
+    state = KingAndAssassinsState(dict(KA_INITIAL_STATE, people=people, card=card, king=health))
+    state._state['visible']['killed']['assassins'] = 3 - len(assassins)
+    state._state['hidden'] = {'assassins': set(), 'cards': [card] * cardsleft}
+    return state
+
+
+def test_king_next_to_a_door_wins_at_once(tmp_path):
+    path = tmp_path / 'endgame.tb'
+    path.write_bytes(encodetables(build(BOARD, CASTLE, (1,), CARDS)))
+    tablebase = Tablebase(BOARD, CASTLE, str(path))
+    # The king steps into the castle through the door north of (2, 2)
+    assert tablebase.probe((2, 2), [(9, 0)], 'healthy', 1, 1, CARDS[0], 1) == (WIN, 0)
+    state = endgame((2, 2), [(9, 0)], cardsleft=1)
+    assert tablebase.play(state._state['visible'], 1, 1) == [('move', 2, 2, 'N')]
+
+
+def test_cards_running_out_turn_a_win_into_a_loss():
+    tablebase = Tablebase(BOARD, CASTLE, '/nonexistent')
+    # The king has 2 AP and needs two more turns to reach a door
+    assert tablebase.probe((3, 5), [(9, 0)], 'healthy', 1, 2, CARDS[11], 3) == (WIN, 2)
+    assert tablebase.probe((3, 5), [(9, 0)], 'healthy', 1, 2, CARDS[11], 2) == (LOSS, 2)
+    assert tablebase.probe((3, 5), [(9, 0)], 'healthy', 0, 4, CARDS[11], 2)[0] == WIN
+
+
+def test_file_and_solved_tables_agree(tmp_path):
+    tables = build(BOARD, CASTLE, (1,), CARDS[:2])
+    path = tmp_path / 'endgame.tb'
+    path.write_bytes(encodetables(tables))
+    tablebase = Tablebase(BOARD, CASTLE, str(path))
+    geometry = Geometry(BOARD, CASTLE)
+    for key, table in tables.items():
+        assert table == solve(geometry, *key)
+        reader = tablebase._reader(key, frozenset())
+        assert all(reader(i) == table[i] for i in range(0, len(table), 97))
+
+
+def test_played_endgames_end_as_probed():
+    tablebase = Tablebase(BOARD, CASTLE, '/nonexistent')
+    rng = random.Random(0)
+    played = 0
+    for game in range(60):
+        cells = rng.sample(GROUNDS, 6)
+        king, assassin, blockers = cells[0], cells[1], cells[2:] if game % 2 else ()
+        card = rng.choice(CARDS)
+        cardsleft = rng.randint(1, 5)
+        player = rng.choice((0, 1))
+        state = endgame(king, [assassin], blockers, rng.choice(('healthy', 'injured')), card, cardsleft)
+        visible = state._state['visible']
+        result, turns = tablebase.probe(king, [assassin], visible['king'], player, card[0] if player else card[3], card, cardsleft, blockers)
+        expected = player if result == WIN else 1 - player
+        # The king does not play from the tables next to villagers
+        if expected == 1 and blockers:
+            continue
+        winner = -1
+        # The winner plays from the tables, the loser does not move at all
+        while winner == -1:
+            turn = tablebase.play(visible, player, len(state._state['hidden']['cards']))
+            if turn is not None:
+                played += 1
+            state.update(turn or [], player)
+            winner = state.winner()
+            player = 1 - player
+        assert winner == expected
+    assert played > 0
+
+
+def test_pieces_the_tables_keep_still_are_left_to_the_search():
+    tablebase = Tablebase(BOARD, CASTLE, '/nonexistent')
+    state = endgame((2, 2), [(9, 0)], cardsleft=1)
+    assert tablebase.play(state._state['visible'], 1, 1) == [('move', 2, 2, 'N')]
+    # A knight may push the king or arrest, villagers may block the door
+    knight = endgame((2, 2), [(9, 0)], cardsleft=1)
+    knight._state['visible']['people'][5][5] = 'knight'
+    assert tablebase.play(knight._state['visible'], 1, 1) is None
+    villager = endgame((2, 2), [(9, 0)], [(5, 5)], cardsleft=1)
+    assert tablebase.play(villager._state['visible'], 1, 1) is None
@@ -0,0 +1,76 @@
+import pytest
+
+from gamelog import GameLog, GameReader
+from kingandassassins import new_game
+from selfplay import RandomPlayer, ScriptedPlayer, playgame
+
+np = pytest.importorskip('numpy')
+from evalnet import ACTIONS, PLANES, EvalNet, Evaluator, actionindex, encode, examples
+
+
+def start():
+    state = new_game(0)
+    state.setassassins(['appleman', 'monk', 'squire'])
+    state.update([], 0)
+    return state
+
+
+def test_encoded_planes():
+    state = start()
+    visible = state._state['visible']
+    planes = encode(visible, 1)
+    assert planes.shape == (len(PLANES), 10, 10)
+    assert planes[PLANES.index('king'), 9, 9] == 1 and planes[PLANES.index('knight')].sum() == 7
+    assert planes[PLANES.index('villager'), 3, 4] == 1
+    assert planes[PLANES.index('door'), 1, 2] == 1 and planes[PLANES.index('door'), 4, 0] == 1
+    assert (planes[PLANES.index('player')] == 1).all() and (encode(visible, 0)[PLANES.index('player')] == 0).all()
+    assert 0 < planes.max() <= 1
+
+
+def test_action_indices():
+    assert actionindex(('move', 0, 0, 'N')) == 0
+    assert actionindex(('kill', 9, 9, 'W')) == ACTIONS - 1
+    assert actionindex(('reveal', 3, 4)) is None
+
+
+def test_forward_and_save_load(tmp_path):
+    net = EvalNet(hidden=8)
+    x = np.stack([encode(start()._state['visible'], p) for p in (0, 1)])
+    values, policies = net.forward(x)
+    assert values.shape == (2,) and ((0 < values) & (values < 1)).all()
+    assert policies.shape == (2, ACTIONS) and np.allclose(policies.sum(axis=1), 1)
+    path = str(tmp_path / 'net.npz')
+    net.save(path)
+    again = EvalNet.load(path)
+    assert all(np.array_equal(again.forward(x)[i], net.forward(x)[i]) for i in range(2))
+
+
+def test_training_on_logged_games_lowers_the_loss(tmp_path):
+    path = tmp_path / 'games.kagl'
+    with GameLog(path) as log:
+        for seed in range(4):
+            playgame((RandomPlayer(), ScriptedPlayer()), seed, log)
+    with GameReader(path) as reader:
+        x, values, actions = examples(reader)
+    assert len(x) == len(values) == len(actions) > 0
+    assert set(values) <= {0.0, 1.0} and (actions < ACTIONS).all()
+    losses = EvalNet(hidden=16).train(x, values, actions, epochs=10)
+    assert losses[-1] < losses[0]
+
+
+def test_evaluator_batches_positions_once():
+    class Counting(EvalNet):
+        batches = []
+
+        def forward(self, x):
+            self.batches.append(len(x))
+            return super().forward(x)
+
+    evaluator = Evaluator(Counting(hidden=8))
+    state = start()
+    results = evaluator.evaluatestates([state, state, state.fork()], [1, 1, 0])
+    # The two positions of player 1 are the same one, evaluated once
+    assert Counting.batches == [2] and evaluator.misses == 2
+    assert results[0] is results[1] and results[0][0] != results[2][0]
+    evaluator.evaluatestates([state], [0])
+    assert Counting.batches == [2] and evaluator.hits == 1
@@ -0,0 +1,78 @@
+import pytest
+
+from gamelog import MAGIC, GameLog, GameReader, GameRecord, Replay
+from kingandassassins import new_game
+from selfplay import RandomPlayer, ScriptedPlayer, playgame
+
+
+def play(path, seeds):
+    # Play and log a few games, returning their results
+    with GameLog(path) as log:
+        return [playgame((RandomPlayer(), ScriptedPlayer()), seed, log) for seed in seeds]
+
+
+def test_records_round_trip(tmp_path):
+    path = tmp_path / 'games.kagl'
+    results = play(path, range(4))
+    with GameReader(path) as reader:
+        assert len(reader) == 4
+        records = list(reader)
+        scanned = list(reader.scan())
+        for record, (offset, winner, count), (result, plies, invalid) in zip(records, scanned, results):
+            assert record.winner == winner == result
+            assert count == len(record.turns)
+            decoded = GameRecord.decode(record.encode())
+            assert (decoded.winner, decoded.layout, decoded.cards, decoded.assassins) == \
+                (record.winner, record.layout, record.cards, record.assassins)
+            assert decoded.turns == record.turns
+            assert reader.read(offset).turns == record.turns
+
+
+def test_record_rebuilds_the_initial_state():
+    state = new_game(7)
+    initial = GameRecord.fromstate(state).initialstate()
+    assert initial._state['visible']['people'] == state._state['visible']['people']
+    assert initial._state['hidden']['cards'] == state._state['hidden']['cards']
+
+
+def test_replay_seeks_to_any_turn(tmp_path):
+    path = tmp_path / 'games.kagl'
+    play(path, [5])
+    with GameReader(path) as reader:
+        record = reader[0]
+    replay = Replay(record, interval=3)
+    final = replay.state(len(replay))
+    assert final.winner() == record.winner
+    # Seeking backwards goes through the snapshots and gives the same states
+    for turn in reversed(range(len(replay) + 1)):
+        state = replay.state(turn)
+        again = Replay(record).state(turn)
+        assert state._state['visible'] == again._state['visible']
+    with pytest.raises(IndexError):
+        replay.state(len(replay) + 1)
+
+
+def test_truncated_last_record_is_ignored(tmp_path):
+    path = tmp_path / 'games.kagl'
+    play(path, range(2))
+    data = path.read_bytes()
+    path.write_bytes(data[:-3])
+    with GameReader(path) as reader:
+        assert len(reader) == 1
+
+
+def test_long_turns_are_logged():
+    # The rules do not limit the number of actions of a turn, nor does the log
+    record = GameRecord.fromstate(new_game(0))
+    record.record({'assassins': ['appleman', 'monk', 'squire']})
+    long = [('move', 3, 4, 'E'), ('move', 3, 5, 'W')] * 200
+    record.record({'actions': long})
+    record.record({'actions': []})
+    assert GameRecord.decode(record.encode()).turns == [[], long, []]
+
+
+def test_other_files_are_not_read(tmp_path):
+    path = tmp_path / 'games.kagl'
+    path.write_bytes(MAGIC[:-1] + b'\x01')
+    with pytest.raises(ValueError):
+        GameReader(path)
@@ -0,0 +1,54 @@
+import os
+import random
+import subprocess
+import sys
+
+from kingandassassins import KA_INITIAL_STATE, TEMPLATE, new_game
+from selfplay import RandomPlayer, playgame
+
+# Helpers of the AI, only imported once a client plays
+AI_MODULES = ('pathtable', 'planner', 'endgame', 'bestway', 'nextto', 'beliefs', 'mcts', 'evalnet', 'openingbook')
+
+
+def test_same_seed_same_game():
+    first, second, other = new_game(5), new_game(5), new_game(6)
+    assert first._state['visible']['people'] == second._state['visible']['people']
+    assert first._state['hidden']['cards'] == second._state['hidden']['cards']
+    assert (other._state['visible']['people'], other._state['hidden']['cards']) != \
+        (first._state['visible']['people'], first._state['hidden']['cards'])
+
+
+def test_new_game_leaves_the_global_random_state_alone():
+    random.seed(1)
+    expected = random.random()
+    random.seed(1)
+    new_game(3)
+    new_game()
+    assert random.random() == expected
+
+
+def test_games_do_not_change_the_initial_state():
+    people = [list(row) for row in KA_INITIAL_STATE['people']]
+    for seed in range(3):
+        playgame((RandomPlayer(), RandomPlayer()), seed)
+    assert [list(row) for row in KA_INITIAL_STATE['people']] == people
+    assert dict(KA_INITIAL_STATE['killed']) == {'knights': 0, 'assassins': 0}
+    assert KA_INITIAL_STATE['arrested'] == () and KA_INITIAL_STATE['card'] is None
+    # The king and the knights are where the template has them, the villagers on the other cells
+    state = new_game(0)
+    for row, template in zip(state._state['visible']['people'], TEMPLATE):
+        assert all(t is None or p == t for p, t in zip(row, template))
+
+
+def test_import_loads_no_ai_and_draws_no_random_number():
+    code = (
+        'import random, sys\n'
+        'random.seed(1)\n'
+        'import kingandassassins\n'
+        'print(random.random() == random.Random(1).random())\n'
+        'print(sorted(set(sys.modules) & set(sys.argv[1:])))\n'
+    )
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    output = subprocess.run([sys.executable, '-c', code] + list(AI_MODULES), env=env,
+                            capture_output=True, text=True, check=True).stdout.split('\n')
+    assert output[:2] == ['True', '[]']
@@ -0,0 +1,26 @@
+from kingandassassins import new_game
+from mcts import MCTSPlayer
+from selfplay import ScriptedPlayer, runmatches
+
+
+def test_close_shuts_the_worker_processes_down():
+    state = new_game(0)
+    state.setassassins(['appleman', 'monk', 'squire'])
+    state.update([], 0)
+    with MCTSPlayer(iterations=8, seconds=None, workers=2) as player:
+        player(state, 1)
+        processes = list(player._pool._processes.values())
+        assert processes
+    assert player._pool is None
+    assert all(not process.is_alive() for process in processes)
+
+
+def test_runmatches_closes_the_players():
+    closed = []
+
+    class Player(ScriptedPlayer):
+        def close(self):
+            closed.append(self)
+
+    runmatches((Player, Player), 2)
+    assert len(closed) == 4
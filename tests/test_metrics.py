@@ -0,0 +1,89 @@
+import asyncio
+import json
+
+import pytest
+
+from asyncserver import Connection
+from kingandassassins import new_game
+from lib import game
+from metrics import Histogram, Metrics, install, reason, uninstall
+
+
+class Writer:
+    def __init__(self):
+        self.data = b''
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+
+def test_histogram_is_cumulative():
+    h = Histogram((1, 2, 4))
+    for value in (0.5, 1, 3, 10):
+        h.observe(value)
+    assert list(h.cumulative()) == [(1, 2), (2, 2), (4, 3), (float('inf'), 4)]
+    assert h.sum == 14.5 and h.count == 4
+
+
+def test_invalid_moves_are_counted_by_reason():
+    metrics = Metrics()
+    metrics.invalidmove(game.InvalidMoveException("('move', 3, 4, 'E'): forbidden move"))
+    metrics.invalidmove(game.InvalidMoveException('["move", 0, 0, "S"]: forbidden move'))
+    assert reason(game.InvalidMoveException("('kill', 1, 2, 'N'): forbidden kill")) == 'forbidden kill'
+    assert metrics.invalid == {'forbidden move': 2}
+
+
+def test_install_times_the_engine_and_uninstall_puts_it_back():
+    update = type(new_game(0)).update
+    metrics = install(Metrics())
+    try:
+        state = new_game(0)
+        state.setassassins(['appleman', 'monk', 'squire'])
+        state.update([], 0)
+        state.update([('move', 7, 8, 'N')], 1)
+        with pytest.raises(game.InvalidMoveException):
+            state.update([('move', 0, 0, 'S')], 0)
+        state.winner()
+    finally:
+        uninstall()
+    assert type(state).update is update
+    assert metrics.latency['update'].count == 3 and metrics.latency['winner'].count == 1
+    assert [h.count for h in metrics.actions] == [1, 1]
+    assert sum(metrics.invalid.values()) == 1
+    # The engine does not count bytes, only the frames of the async server do
+    assert metrics.bytes == {'sent': 0, 'received': 0}
+
+
+def test_async_connection_counts_its_bytes():
+    metrics = Metrics()
+
+    async def main():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b'{"actions":[]}\n')
+        reader.feed_eof()
+        connection = Connection(reader, Writer(), 'king', metrics=metrics)
+        await connection.send({'type': 'end'})
+        await connection.receivemove()
+        return connection.writer.data
+
+    sent = asyncio.run(main())
+    assert metrics.bytes == {'sent': len(sent), 'received': 15}
+    assert 'ka_async_bytes_total{direction="sent"} ' + str(len(sent)) in metrics.toprometheus()
+
+
+def test_write_as_json_or_prometheus(tmp_path):
+    metrics = Metrics()
+    metrics.observe('nextmove', 0.003)
+    metrics.turn(1, [('move', 7, 8, 'N')])
+    metrics.write(str(tmp_path / 'metrics.json'))
+    data = json.loads((tmp_path / 'metrics.json').read_text())
+    assert data['latency_seconds']['nextmove']['count'] == 1
+    assert data['actions_per_turn'][1]['sum'] == 1
+    metrics.write(str(tmp_path / 'metrics.prom'))
+    text = (tmp_path / 'metrics.prom').read_text()
+    assert 'ka_latency_seconds_bucket{call="nextmove",le="0.005"} 1' in text
+    assert 'ka_actions_per_turn_count{player="1"} 1' in text
+    assert not (tmp_path / 'metrics.prom.tmp').exists()
@@ -0,0 +1,144 @@
+import random
+
+from kingandassassins import POPULATION, new_game
+from lib import game
+from movegen import END, budget, legalactions, piece, pushed, spend
+from positions import PositionIndex
+from zobrist import KEYS
+
+# Number of actions made by the fuzz test
+FUZZ_ACTIONS = 250000
+
+# Budgets large enough for every action to be listed
+BUDGETS = {0: (0, 0, 99, False), 1: (99, 99, 0, True)}
+
+
+def snapshot(state):
+    visible, hidden = state._state['visible'], state._state['hidden']
+    return (
+        [list(row) for row in visible['people']], visible['king'], dict(visible['killed']),
+        list(visible['arrested']), visible['card'], list(hidden['cards'])
+    )
+
+
+def candidates(state):
+    # Every action of the pieces on the board, an action from an empty cell is never legal
+    for x, y in sorted(state.index().at):
+        yield ('reveal', x, y)
+        for action in ('move', 'arrest', 'kill', 'attack'):
+            for d in 'NESW':
+                yield (action, x, y, d)
+
+
+def start(seed):
+    '''Server-side state of a game after the assassins are chosen, with its hash and index in use.'''
+    rng = random.Random(seed)
+    state = new_game(seed)
+    state.setassassins(rng.sample(sorted(POPULATION), 3))
+    state.update([], 0)
+    state.index()
+    state.zobrist()
+    return state, rng
+
+
+def check(state, tomove):
+    # The incremental hash and index are those computed from scratch
+    assert state.zobrist() == KEYS.full(state._state['visible'], state._state['hidden'], tomove)
+    index = PositionIndex.fromgrid(state._state['visible']['people'])
+    assert index.at == state.index().at and index.classes == state.index().classes
+
+
+def test_make_unmake_restores_state_hash_and_index():
+    state, rng = start(1)
+    player = 1
+    for turn in range(20):
+        before, hash = snapshot(state), state.zobrist()
+        index = state.index().copy()
+        records = []
+        left = budget(state._state['visible']['card'], player)
+        while True:
+            action = rng.choice(legalactions(state, player, left))
+            if action != END:
+                left = spend(left, action, piece(state, action), pushed(state, action))
+            records.append(state.make(action, player))
+            if action == END:
+                break
+        for record in reversed(records):
+            state.unmake(record)
+        assert snapshot(state) == before and state.zobrist() == hash
+        assert state.index().at == index.at and state.index().classes == index.classes
+        for record in records:
+            state.make(record[0], player)
+        if state.winner() != -1:
+            break
+        player = 1 - player
+
+
+def test_incremental_zobrist_matches_full_rehash():
+    for seed in range(5):
+        state, rng = start(seed)
+        player = 1
+        check(state, player)
+        while state.winner() == -1:
+            left = budget(state._state['visible']['card'], player)
+            while True:
+                action = rng.choice(legalactions(state, player, left))
+                if action == END:
+                    break
+                left = spend(left, action, piece(state, action), pushed(state, action))
+                state.make(action, player)
+                check(state, player)
+            state.update([], player)
+            check(state, 1 - player)
+            player = 1 - player
+
+
+def agree(state, player):
+    # _apply, the generator and the bitboard accept the same actions
+    legal = set(legalactions(state, player, BUDGETS[player])) - {END}
+    bb = state.tobitboard()
+    for action in candidates(state):
+        try:
+            state.fork()._apply(action, player)
+            applied = True
+        except game.InvalidMoveException:
+            applied = False
+        try:
+            bb.validate(action, player)
+            validated = True
+        except game.InvalidMoveException:
+            validated = False
+        assert applied == validated == (action in legal), action
+
+
+def test_fuzz_make_unmake_movegen_and_bitboard_agree():
+    made = 0
+    seed = 0
+    while made < FUZZ_ACTIONS:
+        state, rng = start(seed)
+        bb = state.tobitboard()
+        player = 1
+        while state.winner() == -1 and made < FUZZ_ACTIONS:
+            if seed % 20 == 0:
+                agree(state, player)
+            left = budget(state._state['visible']['card'], player)
+            while True:
+                action = rng.choice(legalactions(state, player, left))
+                if action != END:
+                    left = spend(left, action, piece(state, action), pushed(state, action))
+                    bb.apply(action, player)
+                before, hash = snapshot(state), state.zobrist()
+                record = state.make(action, player)
+                made += 1
+                if rng.random() < 0.3:
+                    state.unmake(record)
+                    assert snapshot(state) == before and state.zobrist() == hash
+                    state.make(action, player)
+                if action == END:
+                    break
+            bb.update([], player)
+            check(state, 1 - player)
+            assert bb.tostate()[0]['people'] == snapshot(state)[0]
+            assert bb.winner() == state.winner()
+            player = 1 - player
+        seed += 1
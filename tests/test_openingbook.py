@@ -0,0 +1,75 @@
+import pytest
+
+from kingandassassins import CARDS, new_game
+from openingbook import MAGIC, BookPlayer, OpeningBook, candidates, cardkey, cardseeds, encodebook, playable
+from selfplay import RandomPlayer, playgame
+
+TRIPLE = ((3, 4), (3, 6), (5, 2))
+KNIGHT_TURN = [('move', 7, 8, 'N'), ('move', 6, 8, 'N')]
+
+
+def book(tmp_path, triples=(TRIPLE,), openings=None):
+    path = tmp_path / 'openings.book'
+    path.write_bytes(encodebook(list(triples), openings or {(CARDS[0], 1): KNIGHT_TURN}))
+    return OpeningBook(str(path))
+
+
+def started(seed=0):
+    state = new_game(seed)
+    people = state._state['visible']['people']
+    state.setassassins([people[x][y] for x, y in TRIPLE])
+    state.update([], 0)
+    return state
+
+
+def test_book_round_trip(tmp_path):
+    opening = [('move', 3, 4, 'E'), ('reveal', 3, 5), ('kill', 3, 5, 'E')]
+    openings = {(CARDS[0], 1): KNIGHT_TURN, (CARDS[5], 0): opening}
+    loaded = book(tmp_path, [TRIPLE, ((5, 5), (5, 7), (7, 1))], openings)
+    assert loaded.triple() == TRIPLE and len(loaded.triples()) == 2
+    assert loaded.opening(list(CARDS[0]), 1) == KNIGHT_TURN
+    assert loaded.opening(CARDS[5], 0) == opening
+    assert loaded.opening(CARDS[5], 1) is None
+
+
+def test_missing_book_is_empty_and_other_files_are_refused(tmp_path):
+    empty = OpeningBook(str(tmp_path / 'missing.book'))
+    assert empty.triple() is None and empty.opening(CARDS[0], 1) is None
+    path = tmp_path / 'other.book'
+    path.write_bytes(MAGIC[:-1] + b'\x00')
+    with pytest.raises(ValueError):
+        OpeningBook(str(path)).triple()
+
+
+def test_only_playable_openings_are_played(tmp_path):
+    state = started()
+    visible = state._state['visible']
+    loaded = book(tmp_path, openings={(cardkey(visible['card']), 1): KNIGHT_TURN})
+    assert loaded.play(visible, 1) == KNIGHT_TURN
+    # Once the knight moved away, the same turn cannot be played
+    state.update([('move', 7, 8, 'W')], 1)
+    assert not playable(visible, KNIGHT_TURN, 1)
+    assert loaded.play(visible, 1) is None
+
+
+def test_card_seeds_and_candidates():
+    card = CARDS[3]
+    seeds = cardseeds(card, 3, 0)
+    assert len(seeds) == 3 and all(new_game(s)._state['hidden']['cards'][-1] == card for s in seeds)
+    turns = candidates(card, 1, TRIPLE, 8, 0)
+    assert turns[0] == [] and len(turns) > 1
+    assert all(playable(started(seeds[0])._state['visible'], turn, 1) for turn in turns)
+
+
+def test_book_player_plays_its_triple_and_opening():
+    state = new_game(4)
+    people = state._state['visible']['people']
+    player = BookPlayer(RandomPlayer(), TRIPLE)
+    assert player(state, 0) == [people[x][y] for x, y in TRIPLE]
+    state = started(4)
+    king = BookPlayer(RandomPlayer(), None, KNIGHT_TURN)
+    assert king(state, 1) == KNIGHT_TURN
+    # The opening is only the first turn, the base player plays the next ones
+    assert not king._first
+    winner, plies, invalid = playgame((BookPlayer(RandomPlayer(), TRIPLE), BookPlayer(RandomPlayer(), None, KNIGHT_TURN)), 4)
+    assert winner in (0, 1) and invalid is None
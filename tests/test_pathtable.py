@@ -0,0 +1,70 @@
+import random
+
+from kingandassassins import BOARD, KA_INITIAL_STATE, new_game
+from pathtable import PathTable
+from rules import DIRECTIONS
+
+TABLE = PathTable(BOARD)
+EMPTY = [[None] * 10 for x in range(10)]
+
+
+def walk(src, path):
+    x, y = src
+    cells = []
+    for d in path:
+        x, y = x + DIRECTIONS[d][0], y + DIRECTIONS[d][1]
+        cells.append((x, y))
+    return cells
+
+
+def test_routes_are_shortest_paths():
+    rng = random.Random(0)
+    for _ in range(200):
+        src, dst = divmod(rng.randrange(100), 10), divmod(rng.randrange(100), 10)
+        assert TABLE.distance(src, dst) == abs(src[0] - dst[0]) + abs(src[1] - dst[1])
+        d = TABLE.distance(src, dst, 'ground')
+        assert d == TABLE.distance(dst, src, 'ground')
+        route = TABLE.route(src, dst, 'ground')
+        if d is None:
+            assert route is None and TABLE.nexthop(src, dst, 'ground') is None
+            continue
+        assert len(route) == d and (not route or walk(src, route)[-1] == dst)
+        assert all(BOARD[x][y] == 'G' for x, y in walk(src, route))
+        assert TABLE.nexthop(src, dst, 'ground') == (route[0] if route else None)
+
+
+def test_roofs_are_only_reached_on_the_roof_layer():
+    assert TABLE.distance((9, 9), (0, 0), 'ground') is None
+    assert TABLE.distance((9, 9), (0, 0)) == 18
+    # The king goes round the houses in the middle of the board
+    assert TABLE.distance((5, 4), (5, 7), 'ground') == 7
+
+
+def test_astar_goes_round_or_through_people():
+    people = [list(row) for row in EMPTY]
+    for y in range(2, 10):
+        people[8][y] = 'monk'
+    # The row of villagers ends on the roofs in the west, the king cannot go round it
+    assert TABLE.astar(people, (9, 4), [(7, 4)], 'ground') is None
+    path = TABLE.astar(people, (9, 4), [(7, 4)], 'ground', push=lambda c, i: 1)
+    assert walk((9, 4), path)[-1] == (7, 4) and len(path) == 2
+    # Over the roofs there is a way round
+    path = TABLE.astar(people, (9, 4), [(7, 4)])
+    assert walk((9, 4), path)[-1] == (7, 4) and len(path) == 8
+    assert all(people[x][y] is None for x, y in walk((9, 4), path))
+    # An occupied goal is only reached with pushes
+    assert TABLE.astar(people, (9, 4), [(8, 4)], 'ground') is None
+
+
+def test_king_routes_to_a_door():
+    people = [list(row) for row in new_game(0)._state['visible']['people']]
+    # The knights wall the king in at the start
+    assert TABLE.kingroute(people, (9, 9), KA_INITIAL_STATE['castle']) is None
+    people[8][9] = None
+    route = TABLE.kingroute(people, (9, 9), KA_INITIAL_STATE['castle'])
+    cells = walk((9, 9), route[:-1])
+    assert (cells[-1][0], cells[-1][1], route[-1]) in KA_INITIAL_STATE['castle']
+    assert all(people[x][y] is None for x, y in cells)
+    approach = TABLE.approach(people, (5, 2), (9, 9), 'ground')
+    x, y = walk((5, 2), approach)[-1]
+    assert abs(x - 9) + abs(y - 9) == 1
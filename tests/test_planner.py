@@ -0,0 +1,55 @@
+from kingandassassins import BOARD, CARDS, KA_INITIAL_STATE, KingAndAssassinsState
+from pathtable import PathTable
+from planner import AssassinPlanner
+from positions import PositionIndex
+
+PLANNER = AssassinPlanner(PathTable(BOARD), deadline=1.0)
+
+
+def position(pieces, assassins=()):
+    '''Engine state with the given {(x, y): name} pieces, assassins being the hidden ones.'''
+    people = [[None] * 10 for x in range(10)]
+    for (x, y), name in pieces.items():
+        people[x][y] = name
+    state = KingAndAssassinsState(dict(KA_INITIAL_STATE, people=people, card=CARDS[0]))
+    state._state['hidden'] = {'assassins': set(assassins), 'cards': list(CARDS[1:])}
+    return state
+
+
+def plan(state, ap, health=2):
+    people = state._state['visible']['people']
+    index = PositionIndex.fromgrid(people)
+    cells = sorted((x, y) for x, row in enumerate(people) for y, name in enumerate(row)
+                   if name == 'assassin' or name in state._state['hidden']['assassins'])
+    hidden = [people[x][y] != 'assassin' for x, y in cells]
+    actions = PLANNER.plan(people, index, cells, hidden, ap, health)
+    for action in actions:
+        state._apply(action, 0)
+    assert sum(1 for action in actions if action[0] != 'reveal') <= ap
+    return actions
+
+
+def test_king_in_reach_is_killed():
+    state = position({(5, 3): 'king', (5, 0): 'assassin', (9, 9): 'knight'})
+    actions = plan(state, 5)
+    assert [a[0] for a in actions] == ['move', 'move', 'attack', 'attack']
+    assert state._state['visible']['king'] == 'dead'
+
+
+def test_hidden_assassin_reveals_itself_before_it_hits():
+    state = position({(9, 9): 'king', (5, 2): 'monk', (5, 4): 'knight'}, ['monk'])
+    actions = plan(state, 3)
+    assert actions == [('move', 5, 2, 'E'), ('reveal', 5, 3), ('kill', 5, 3, 'E')]
+    assert state._state['visible']['killed']['knights'] == 1
+
+
+def test_two_assassins_never_chase_the_same_knight():
+    state = position({(9, 9): 'king', (3, 2): 'assassin', (3, 6): 'assassin', (3, 4): 'knight', (8, 4): 'knight'})
+    actions = plan(state, 4)
+    kills = [a for a in actions if a[0] == 'kill']
+    assert len(kills) == 1 and state._state['visible']['killed']['knights'] == 1
+
+
+def test_no_plan_out_of_reach():
+    state = position({(9, 9): 'king', (2, 2): 'assassin', (8, 2): 'knight'})
+    assert plan(state, 3) == []
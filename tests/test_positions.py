@@ -0,0 +1,36 @@
+from kingandassassins import BOARD, new_game
+from pathtable import PathTable
+from positions import PositionIndex
+
+
+def test_index_follows_the_changes_of_the_grid():
+    people = new_game(0)._state['visible']['people']
+    index = PositionIndex.fromgrid(people)
+    assert index.where['king'] == (9, 9) and index.where['appleman'] == (3, 4)
+    assert len(index.classes['knight']) == 7 and len(index.classes['villager']) == 12
+    copy = index.copy()
+    index.set((3, 4), 'assassin')
+    index.set((9, 9), None)
+    index.set((8, 9), 'king')
+    assert 'appleman' not in index.where and (3, 4) in index.classes['assassin']
+    assert index.where['king'] == (8, 9) and index.at[(8, 9)] == 'king'
+    assert (8, 9) not in index.classes['knight']
+    # The copy is not changed
+    assert copy.where['appleman'] == (3, 4) and copy.at[(8, 9)] == 'knight'
+
+
+def test_nearest_target():
+    index = PositionIndex.fromgrid(new_game(0)._state['visible']['people'])
+    # Ties are broken on the coordinates
+    assert index.nearest((9, 9), 'knight') == (8, 9)
+    assert index.nearest((0, 0), 'knight', maxdist=2) is None
+    assert index.nearest((0, 0), 'assassin') is None
+    # On the ground, the king has to go round the houses
+    paths = PathTable(BOARD)
+    index = PositionIndex.fromgrid([[None] * 10 for x in range(10)])
+    index.set((5, 7), 'knight')
+    index.set((9, 4), 'knight')
+    assert index.nearest((5, 4), 'knight') == (5, 7)
+    assert index.nearest((5, 4), 'knight', paths=paths) == (5, 7)
+    assert index.nearest((5, 4), 'knight', paths=paths, layer='ground') == (9, 4)
+    assert index.nearest((5, 4), 'knight', maxdist=3, paths=paths, layer='ground') is None
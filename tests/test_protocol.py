@@ -0,0 +1,53 @@
+import asyncio
+import json
+
+import pytest
+
+import protocol
+
+ACTIONS = [('move', 0, 0, 'N'), ('arrest', 9, 9, 'W'), ('kill', 4, 7, 'E'), ('attack', 5, 1, 'S'), ('reveal', 3, 8)]
+
+
+def test_actions_round_trip():
+    data = protocol.encodeactions(ACTIONS)
+    assert len(data) == 2 * len(ACTIONS)
+    assert protocol.decodeactions(data) == ACTIONS
+
+
+@pytest.mark.parametrize('action', [('move', 10, 0, 'N'), ('jump', 1, 1, 'N'), ('move', 1, 1, 'X'), ('move', 1)])
+def test_malformed_actions_are_not_encoded(action):
+    with pytest.raises(protocol.ProtocolError):
+        protocol.encodeactions([action])
+
+
+def test_truncated_data_is_not_decoded():
+    with pytest.raises(protocol.ProtocolError):
+        protocol.decodeactions(protocol.encodeactions(ACTIONS)[:-1])
+    with pytest.raises(protocol.ProtocolError):
+        protocol.decodediff(b'\x00\x00\x00\x01')
+
+
+def test_frames_are_read_back():
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(protocol.jsonframe({'type': 'hello'}) + protocol.frame(protocol.ACTIONS, b'\x01\x02'))
+        reader.feed_eof()
+        return [await protocol.readframe(reader), await protocol.readframe(reader)]
+    first, second = asyncio.run(read())
+    assert first[0] == protocol.JSON and json.loads(first[1]) == {'type': 'hello'}
+    assert second == (protocol.ACTIONS, b'\x01\x02')
+
+
+def test_diff_round_trip():
+    diff = {
+        'version': 7,
+        'base': 5,
+        'card': [1, 6, True, 5],
+        'king': 'injured',
+        'killed': {'knights': 2, 'assassins': 1},
+        'arrested': ['monk'],
+        'cells': [((3, 4), None), ((3, 5), 'assassin'), ((9, 9), 'king')],
+        'lastopponentmove': ACTIONS
+    }
+    assert protocol.decodediff(protocol.encodediff(diff)) == diff
+    assert protocol.decodediff(protocol.encodediff(dict(diff, card=None)))['card'] is None
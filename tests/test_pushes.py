@@ -0,0 +1,45 @@
+import pytest
+
+from kingandassassins import CARDS, KA_INITIAL_STATE, RULES, KingAndAssassinsState
+from lib import game
+from movegen import budget, legalactions, pushed, spend
+from rules import kindof
+
+
+def position(pieces):
+    people = [[None] * 10 for x in range(10)]
+    for (x, y), name in pieces.items():
+        people[x][y] = name
+    state = KingAndAssassinsState(dict(KA_INITIAL_STATE, people=people, card=CARDS[0]))
+    state._state['hidden'] = {'assassins': {'monk'}, 'cards': list(CARDS[1:])}
+    return state
+
+
+def test_knight_pushes_a_chain_for_one_ap_per_person():
+    state = position({(8, 2): 'knight', (8, 3): 'monk', (8, 4): 'farmer', (9, 9): 'king'})
+    left = budget(state._state['visible']['card'], 1)
+    action = ('move', 8, 2, 'E')
+    assert action in legalactions(state, 1, left)
+    assert RULES.pushcost(lambda t: kindof(state._state['visible']['people'][t // 10][t % 10]), 82, 1) == 2
+    after = spend(left, action, 'knight', pushed(state, action))
+    assert left[1] - after[1] == 3
+    bb = state.tobitboard()
+    bb.apply(action, 1)
+    state._apply(action, 1)
+    people = state._state['visible']['people']
+    assert [people[8][y] for y in range(2, 6)] == [None, 'knight', 'monk', 'farmer']
+    assert bb.tostate()[0]['people'] == people
+
+
+@pytest.mark.parametrize('pieces, action, reason', [
+    ({(8, 7): 'knight', (8, 8): 'monk', (8, 9): 'farmer'}, ('move', 8, 7, 'E'), 'off the board'),
+    ({(2, 5): 'knight', (3, 5): 'monk'}, ('move', 2, 5, 'S'), 'roof'),
+    ({(8, 7): 'knight', (8, 8): 'king'}, ('move', 8, 7, 'E'), 'cannot be pushed'),
+])
+def test_forbidden_pushes(pieces, action, reason):
+    state = position(pieces)
+    assert action not in legalactions(state, 1, (99, 99, 0, True))
+    with pytest.raises(game.InvalidMoveException, match=reason):
+        state.tobitboard().validate(action, 1)
+    with pytest.raises(game.InvalidMoveException, match=reason):
+        state._apply(action, 1)
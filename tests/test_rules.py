@@ -0,0 +1,107 @@
+import random
+
+import pytest
+
+from kingandassassins import BOARD, KA_INITIAL_STATE, POPULATION, RULES, new_game
+from lib import game
+from movegen import END, legalactions
+from rules import ACTORS, ASSASSIN, KING, KNIGHT, PUSHED, TARGETS, VILLAGER, RuleTables
+
+# Budgets large enough for every action to be listed
+BUDGETS = {0: (0, 0, 99, False), 1: (99, 99, 0, True)}
+
+# Villagers may not move, and assassins may kill each other
+VARIANT = RuleTables(
+    BOARD, KA_INITIAL_STATE['castle'],
+    actors=dict(ACTORS, move={0: {ASSASSIN}, 1: {KING, KNIGHT}}),
+    targets=dict(TARGETS, kill={ASSASSIN: {KNIGHT, ASSASSIN}, KNIGHT: {ASSASSIN}})
+)
+
+# Knights may push the king
+PUSHING = RuleTables(BOARD, KA_INITIAL_STATE['castle'], pushed=PUSHED | {KING})
+
+
+def candidates():
+    for x in range(10):
+        for y in range(10):
+            yield ('reveal', x, y)
+            for action in ('move', 'arrest', 'kill', 'attack'):
+                for d in 'NESW':
+                    yield (action, x, y, d)
+
+
+def accepted(state, player):
+    '''Actions _apply accepts, and those the bitboard of the state accepts.'''
+    applied, validated = set(), set()
+    bb = state.tobitboard()
+    for action in candidates():
+        try:
+            state.fork()._apply(action, player)
+            applied.add(action)
+        except game.InvalidMoveException:
+            pass
+        try:
+            bb.validate(action, player)
+            validated.add(action)
+        except game.InvalidMoveException:
+            pass
+    return applied, validated
+
+
+def positions(count, seed):
+    '''States met in a game of random actions, with the player to move.'''
+    rng = random.Random(seed)
+    state = new_game(seed)
+    state.setassassins(rng.sample(sorted(POPULATION), 3))
+    state.update([], 0)
+    player = 1
+    for _ in range(count):
+        yield state, player
+        for _ in range(4):
+            actions = legalactions(state, player, BUDGETS[player])
+            action = rng.choice(actions)
+            if action == END:
+                break
+            state._apply(action, player)
+        player = 1 - player
+
+
+@pytest.mark.parametrize('rules', [RULES, VARIANT, PUSHING])
+def test_legalactions_and_apply_read_the_same_tables(rules):
+    for state, player in positions(12, 5):
+        state = state.fork()
+        state.rules = rules
+        applied, validated = accepted(state, player)
+        assert set(legalactions(state, player, BUDGETS[player])) - {END} == applied
+        assert validated == applied
+
+
+def test_modified_tables_change_the_actions():
+    state = new_game(0)
+    state.setassassins(['appleman', 'farmer', 'squire'])
+    state.update([], 0)
+    # The appleman and the farmer are revealed and the appleman steps next to the farmer
+    state._apply(('reveal', 3, 4), 0)
+    state._apply(('reveal', 3, 6), 0)
+    state._apply(('move', 3, 4, 'E'), 0)
+    default = set(legalactions(state, 0, BUDGETS[0]))
+    state.rules = VARIANT
+    variant = set(legalactions(state, 0, BUDGETS[0]))
+    people = state._state['visible']['people']
+    assert variant - default == {('kill', 3, 5, 'E'), ('kill', 3, 6, 'W')}
+    fork = state.fork()
+    fork._apply(('kill', 3, 5, 'E'), 0)
+    assert fork._state['visible']['killed'] == {'knights': 0, 'assassins': 1}
+    bb = state.tobitboard()
+    bb.apply(('kill', 3, 5, 'E'), 0)
+    assert bb.killed == fork._state['visible']['killed']
+    removed = default - variant
+    assert removed and all(action[0] == 'move' and people[action[1]][action[2]] != 'assassin' for action in removed)
+    for action in removed:
+        with pytest.raises(game.InvalidMoveException):
+            state.fork()._apply(action, 0)
+
+
+def test_kills_that_no_count_keeps_are_refused():
+    with pytest.raises(ValueError):
+        RuleTables(BOARD, KA_INITIAL_STATE['castle'], targets=dict(TARGETS, kill={ASSASSIN: {KNIGHT, VILLAGER}}))
@@ -0,0 +1,17 @@
+import pytest
+
+from selfplay import idleplayer, playgame
+
+
+def test_malformed_move_is_an_invalid_move():
+    def malformed(state, playernb):
+        return idleplayer(state, playernb) if state.isinitial() else [('move', 9, 9)]
+    winner, plies, invalid = playgame((idleplayer, malformed), 0)
+    assert (winner, invalid) == (0, 1)
+
+
+def test_crash_of_a_player_is_not_an_invalid_move():
+    def crashing(state, playernb):
+        raise RuntimeError('bug in the AI')
+    with pytest.raises(RuntimeError):
+        playgame((crashing, idleplayer), 0)
@@ -0,0 +1,63 @@
+import pickle
+
+from kingandassassins import KingAndAssassinsState, new_game
+from snapshot import SharedGrid
+
+
+def grid():
+    return SharedGrid([[10 * x + y for y in range(3)] for x in range(3)])
+
+
+def test_fork_shares_rows_until_written():
+    parent = grid()
+    child = parent.fork()
+    assert all(a is b for a, b in zip(parent, child))
+    child.set(1, 2, None)
+    assert parent[1][2] == 12 and child[1][2] is None
+    assert parent[0] is child[0] and parent[1] is not child[1]
+
+
+def test_parent_writes_after_a_fork_are_not_seen_by_the_child():
+    parent = grid()
+    child = parent.fork()
+    parent.set(0, 0, 'king')
+    grandchild = child.fork()
+    grandchild.set(2, 1, 'knight')
+    assert child[0][0] == 0 and grandchild[0][0] == 0
+    assert parent[2][1] == child[2][1] == 21
+
+
+def test_pickled_grid_owns_its_rows():
+    people = grid()
+    copy = pickle.loads(pickle.dumps(people))
+    assert copy == people
+    copy.set(0, 1, None)
+    assert people[0][1] == 1
+
+
+def test_forked_states_are_isolated():
+    state = new_game(0)
+    state.setassassins(['appleman', 'monk', 'squire'])
+    state.update([], 0)
+    fork = state.fork()
+    fork.update([('move', 3, 4, 'E')], 0)
+    people = state._state['visible']['people']
+    assert people[3][4] == 'appleman' and people[3][5] is None
+    assert fork._state['visible']['people'][3][5] == 'appleman'
+    assert fork._state['hidden']['cards'] != state._state['hidden']['cards']
+
+
+def test_building_a_state_from_another_keeps_its_journal():
+    state = new_game(0)
+    state.setassassins(['appleman', 'monk', 'squire'])
+    state.update([], 0)
+    state.recordchanges()
+    state.update([('move', 3, 4, 'E')], 0)
+    # A search or a scratch state made from the visible state must not disturb the recording
+    scratch = KingAndAssassinsState(state._state['visible'])
+    scratch._apply(('move', 3, 5, 'N'), 0)
+    state.update([('move', 3, 5, 'S')], 0)
+    assert state.takechanges() == [(3, 5, None), (3, 4, 'appleman'), (4, 5, None), (3, 5, 'appleman')]
+    people = state._state['visible']['people']
+    assert people[4][5] == 'appleman' and people[2][5] is None
+    assert scratch._state['visible']['people'][2][5] == 'appleman'
@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from tournament import Tournament, playchunk
+
+
+def test_results_do_not_depend_on_chunks_nor_workers():
+    single = Tournament('random', 'scripted', 12, seed=3, chunksize=12).run(workers=1)
+    split = Tournament('random', 'scripted', 12, seed=3, chunksize=5).run(workers=2)
+    assert single == split and single['games'] == 12
+    assert sum(single['wins']) == 12
+
+
+def test_interrupted_run_resumes_from_its_checkpoint(tmp_path):
+    checkpoint = str(tmp_path / 'run.json')
+    tournament = Tournament('random', 'random', 10, seed=1, chunksize=4, checkpoint=checkpoint)
+    # The first chunk was played before the run was interrupted
+    tournament.done.add(0)
+    tournament.stats = playchunk('random', 'random', 1, 0, 4)
+    tournament._save()
+    resumed = Tournament('random', 'random', 10, seed=1, chunksize=4, checkpoint=checkpoint)
+    assert resumed.done == {0}
+    seen = []
+    stats = resumed.run(workers=1, callback=lambda stats: seen.append(stats['games']))
+    # The two chunks left may complete together
+    assert seen in ([8, 10], [10])
+    assert stats == Tournament('random', 'random', 10, seed=1, chunksize=10).run(workers=1)
+    with open(checkpoint) as file:
+        assert json.load(file)['done'] == [0, 1, 2]
+
+
+def test_checkpoint_of_another_run_is_refused(tmp_path):
+    checkpoint = str(tmp_path / 'run.json')
+    Tournament('idle', 'idle', 2, checkpoint=checkpoint).run(workers=1)
+    with pytest.raises(ValueError):
+        Tournament('idle', 'idle', 3, checkpoint=checkpoint)
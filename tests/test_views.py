@@ -0,0 +1,54 @@
+import json
+import random
+
+import protocol
+from kingandassassins import POPULATION, new_game
+from movegen import END, budget, legalactions, piece, pushed, spend
+from views import ViewTracker, applydiff
+
+
+def randommove(state, player, rng):
+    # A random legal turn, applied to a fork to find the actions
+    state = state.fork()
+    left = budget(state._state['visible']['card'], player)
+    actions = []
+    while True:
+        action = rng.choice(legalactions(state, player, left))
+        if action == END:
+            return {'actions': actions}
+        left = spend(left, action, piece(state, action), pushed(state, action))
+        state.make(action, player)
+        actions.append(action)
+
+
+def fullview(tracker, player):
+    # A view as a client holds it after decoding the JSON sent by the server
+    return json.loads(json.dumps(tracker.view(player)))
+
+
+def test_encoded_diffs_rebuild_the_full_view():
+    rng = random.Random(3)
+    tracker = ViewTracker(new_game(3))
+    tracker.apply({'assassins': rng.sample(sorted(POPULATION), 3)}, 0)
+    views = [fullview(tracker, 0), fullview(tracker, 1)]
+    player = 1
+    while tracker.state.winner() == -1:
+        tracker.apply(randommove(tracker.state, player, rng), player)
+        # Player 0 skips every other diff, it gets the changes of both turns at once
+        for p in (1,) if player == 1 else (0, 1):
+            diff = protocol.decodediff(protocol.encodediff(tracker.diff(p, views[p]['version'])))
+            assert applydiff(views[p], diff)
+            assert views[p] == fullview(tracker, p)
+        player = 1 - player
+
+
+def test_stale_diffs_are_refused():
+    rng = random.Random(4)
+    tracker = ViewTracker(new_game(4), history=2)
+    tracker.apply({'assassins': rng.sample(sorted(POPULATION), 3)}, 0)
+    view = fullview(tracker, 1)
+    for player in (1, 0, 1):
+        tracker.apply(randommove(tracker.state, player, rng), player)
+    assert tracker.diff(1, view['version']) is None
+    diff = tracker.diff(0, tracker.version - 1)
+    assert not applydiff(view, diff)
@@ -0,0 +1,71 @@
+import pytest
+
+from kingandassassins import CARDS, POPULATION, new_game
+from mcts import Search
+from zobrist import EXACT, KEYS, LOWER, UPPER, TranspositionTable
+
+
+def test_stored_entries_are_probed():
+    table = TranspositionTable(bits=4)
+    assert table.probe(5) is None
+    table.store(5, 2, 0.25, LOWER, ('move', 3, 4, 'E'))
+    assert table.probe(5) == (2, 0.25, LOWER, ('move', 3, 4, 'E'))
+    # A key of the same bucket is not mistaken for another
+    assert table.probe(5 + 16) is None
+    assert table.stats() == {'hits': 1, 'misses': 2, 'stores': 1, 'hitrate': 1 / 3}
+    table.clear()
+    assert table.probe(5) is None and len(table) == 0
+
+
+def test_shallower_entries_go_to_the_always_replace_slot():
+    table = TranspositionTable(bits=4)
+    table.store(1, 3, 0.5)
+    table.store(17, 1, 0.1, UPPER)
+    assert table.probe(1) == (3, 0.5, EXACT, None)
+    assert table.probe(17) == (1, 0.1, UPPER, None)
+    # The newest shallow entry replaces the previous one, the deep one stays
+    table.store(33, 2, 0.2)
+    assert table.probe(17) is None
+    assert table.probe(1) == (3, 0.5, EXACT, None)
+    assert table.probe(33) == (2, 0.2, EXACT, None)
+    # A search as deep replaces the deep one, a shallower one of the same key does not
+    table.store(49, 3, 0.7)
+    assert table.probe(1) is None and table.probe(49) == (3, 0.7, EXACT, None)
+    table.store(49, 1, 0.9)
+    assert table.probe(49) == (3, 0.7, EXACT, None)
+    assert len(table) == 2
+
+
+def test_full_hash_has_the_side_to_move():
+    state = new_game(0)
+    state.setassassins(['appleman', 'monk', 'squire'])
+    state.update([], 0)
+    visible, hidden = state._state['visible'], state._state['hidden']
+    assert state.zobrist() == KEYS.full(visible, hidden, 1) == KEYS.full(visible, hidden, 0) ^ KEYS.side
+    state.update([], 1)
+    assert state.zobrist() == KEYS.full(visible, hidden, 0)
+    # A fork keeps the player to move, for a hash computed afresh too
+    fork = state.fork()
+    fork._hash = None
+    assert fork.zobrist() == state.zobrist()
+
+
+def test_evaluator_looks_the_positions_up_in_the_table():
+    pytest.importorskip('numpy')
+    from evalnet import EvalNet, Evaluator
+    state = new_game(3)
+    state.setassassins(sorted(POPULATION)[:3])
+    state.update([], 0)
+    evaluator = Evaluator(EvalNet(), bits=4)
+    first, other = evaluator.evaluatestates([state, state], [1, 0])
+    assert evaluator.misses == 2 and first[0] != other[0]
+    again, = evaluator.evaluatestates([state.fork()], [1])
+    assert evaluator.hits == 1 and again[0] == first[0]
+    # Another card of the same fetter flag gives the same hash, but another position
+    card = state._state['visible']['card']
+    fork = state.fork()
+    fork._state['visible']['card'] = next(c for c in CARDS if c[2] == card[2] and c[0] != card[0])
+    assert fork.zobrist() == state.zobrist() and Evaluator.key(fork, 1) != Evaluator.key(state, 1)
+    search = Search(state._state['visible'], 1, None, 14, [state._state['visible']['card']], seed=1, evaluator=evaluator)
+    search.run(100)
+    assert evaluator.hits > 1
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# tournament.py
+# Splits a large number of seeded self-play games over a process pool,
+# merging results as chunks complete and checkpointing them to disk
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from selfplay import PLAYERS, gameseed, playgame, closeplayers, newstats, addresult, mergestats, winrates
+
+
+def playchunk(assassins, king, seed, start, stop):
+    '''Play the games start..stop-1 of a run, players being given by name.'''
+    stats = newstats()
+    for index in range(start, stop):
+        players = (PLAYERS[assassins](), PLAYERS[king]())
+        try:
+            addresult(stats, playgame(players, gameseed(seed, index)))
+        finally:
+            closeplayers(players)
+    return stats
+
+
+class Tournament:
+    '''Class representing a resumable run of games between two players.
+
+    Game i always uses the seed gameseed(seed, i), so that the result of a run
+    does not depend on the number of workers nor on interruptions.'''
+
+    def __init__(self, assassins, king, games, seed=0, chunksize=500, checkpoint=None):
+        self.config = {
+            'assassins': assassins,
+            'king': king,
+            'games': games,
+            'seed': seed,
+            'chunksize': chunksize
+        }
+        self.checkpoint = checkpoint
+        self.done = set()
+        self.stats = newstats()
+        if checkpoint is not None and os.path.exists(checkpoint):
+            self._load()
+
+    @property
+    def chunks(self):
+        games, size = self.config['games'], self.config['chunksize']
+        return [(start, min(start + size, games)) for start in range(0, games, size)]
+
+    def _load(self):
+        with open(self.checkpoint) as file:
+            data = json.load(file)
+        if data['config'] != self.config:
+            raise ValueError('{}: checkpoint of a different tournament'.format(self.checkpoint))
+        self.done = set(data['done'])
+        self.stats = data['stats']
+
+    def _save(self):
+        # Write to a temporary file first so that a crash never leaves a truncated checkpoint
+        temp = self.checkpoint + '.tmp'
+        with open(temp, 'w') as file:
+            json.dump({'config': self.config, 'done': sorted(self.done), 'stats': self.stats}, file)
+        os.replace(temp, self.checkpoint)
+
+    def run(self, workers=None, callback=None):
+        '''Play the remaining chunks with a pool of workers processes.
+
+        callback(stats) is called with the merged statistics each time a chunk completes.'''
+        config = self.config
+        todo = [(i, chunk) for i, chunk in enumerate(self.chunks) if i not in self.done]
+        workers = workers or os.cpu_count()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = {}
+            while todo or pending:
+                # Keep a bounded number of chunks in flight
+                while todo and len(pending) < 2 * workers:
+                    i, (start, stop) = todo.pop(0)
+                    future = pool.submit(playchunk, config['assassins'], config['king'], config['seed'], start, stop)
+                    pending[future] = i
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    i = pending.pop(future)
+                    mergestats(self.stats, future.result())
+                    self.done.add(i)
+                if self.checkpoint is not None:
+                    self._save()
+                if callback is not None:
+                    callback(self.stats)
+        return self.stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='King & Assassins tournament')
+    parser.add_argument('--assassins', help='player 0 (default: scripted)', choices=sorted(PLAYERS), default='scripted')
+    parser.add_argument('--king', help='player 1 (default: scripted)', choices=sorted(PLAYERS), default='scripted')
+    parser.add_argument('-n', '--games', help='number of games (default: 100000)', type=int, default=100000)
+    parser.add_argument('--seed', help='seed of the run (default: 0)', type=int, default=0)
+    parser.add_argument('--chunksize', help='games per task (default: 500)', type=int, default=500)
+    parser.add_argument('-j', '--workers', help='number of processes (default: all cores)', type=int, default=None)
+    parser.add_argument('--checkpoint', help='file used to save and resume the run', default=None)
+    args = parser.parse_args()
+
+    tournament = Tournament(args.assassins, args.king, args.games, args.seed, args.chunksize, args.checkpoint)
+    stats = tournament.run(args.workers)
+    stats['winrates'] = winrates(stats)
+    print(json.dumps(stats))
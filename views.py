@@ -0,0 +1,88 @@
+# Per-player views of a match, maintained incrementally
+# The server applies every move through a ViewTracker, which records the cells
+# each move changed under a new version number. A client that has the view of
+# version v then only needs the diff since v, and a client whose version is
+# too old (for example after a lost message) gets a full view again.
+
+from collections import deque
+
+from kingandassassins import playmove
+
+
+class ViewTracker:
+    '''Class tracking the versions of the views of a state.
+
+    Only the last history versions are kept, older clients must resync.'''
+
+    def __init__(self, state, history=64):
+        self.state = state
+        self.version = 0
+        self._log = deque(maxlen=history)
+        self._lastmove = [[], []]
+
+    def apply(self, move, player):
+        '''Apply a move as playmove() does and record what it changed, even if it is invalid.'''
+        visible = self.state._state['visible']
+        arrested = len(visible['arrested'])
+        self.state.recordchanges()
+        try:
+            playmove(self.state, move, player)
+        finally:
+            changes = self.state.takechanges()
+            people = visible['people']
+            cells = {(x, y): people[x][y] for x, y, previous in changes}
+            self.version += 1
+            self._log.append((self.version, cells, arrested))
+            if isinstance(move, dict):
+                self._lastmove[1 - player] = list(move.get('actions', []))
+
+    def view(self, player):
+        '''Full view of player, with the last move of his opponent.'''
+        visible = dict(self.state._state['visible'])
+        visible['lastopponentmove'] = self._lastmove[player]
+        return {'version': self.version, 'state': visible}
+
+    def diff(self, player, since):
+        '''Changes of the view of player since version since, None if a full view is needed.
+
+        The diff holds the version, the base version it applies to, the new
+        scalars, the villagers arrested since the base version, the changed
+        cells as ((x, y), piece) pairs and the last move of the opponent.'''
+        if since > self.version or self.version - since > len(self._log):
+            return None
+        visible = self.state._state['visible']
+        cells = {}
+        arrested = len(visible['arrested'])
+        for version, changed, before in self._log:
+            if version > since:
+                cells.update(changed)
+                arrested = min(arrested, before)
+        return {
+            'version': self.version,
+            'base': since,
+            'card': visible['card'],
+            'king': visible['king'],
+            'killed': dict(visible['killed']),
+            'arrested': visible['arrested'][arrested:],
+            'cells': sorted(cells.items()),
+            'lastopponentmove': self._lastmove[player]
+        }
+
+
+def applydiff(view, diff):
+    '''Apply a diff to a full view received earlier, in place.
+
+    Returns False, leaving the view unchanged, if the diff does not apply to
+    the version of the view: a full view must then be requested.'''
+    if diff['base'] != view['version']:
+        return False
+    visible = view['state']
+    for (x, y), piece in diff['cells']:
+        visible['people'][x][y] = piece
+    visible['card'] = diff['card']
+    visible['king'] = diff['king']
+    visible['killed'] = dict(diff['killed'])
+    visible['arrested'] = list(visible['arrested']) + list(diff['arrested'])
+    visible['lastopponentmove'] = [list(action) for action in diff['lastopponentmove']]
+    view['version'] = diff['version']
+    return True
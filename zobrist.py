@@ -0,0 +1,135 @@
+# Zobrist hashing of King & Assassins states and a transposition table
+# The hash is the XOR of one random 64-bit key per (piece, cell) plus keys for
+# the king's health, the killed and arrested pieces, the fetter flag, the
+# number of cards left and the player to move
+
+import random
+
+SIZE = 10
+CELLS = SIZE * SIZE
+BITS = 64
+
+
+def _key(label):
+    # Keys are derived from a label so that every process computes the same hashes
+    return random.Random('zobrist:' + label).getrandbits(BITS)
+
+
+class ZobristKeys:
+    '''Class holding the random keys, piece keys are generated on first use.'''
+
+    def __init__(self):
+        self._pieces = {}
+        self.health = {h: _key('king:' + h) for h in ('healthy', 'injured', 'dead')}
+        self.killed = {
+            side: tuple(_key('killed:{}:{}'.format(side, n)) for n in range(CELLS))
+            for side in ('knights', 'assassins')
+        }
+        self.fetter = _key('fetter')
+        self.cards = tuple(_key('cards:{}'.format(n)) for n in range(CELLS))
+        self.side = _key('side')
+        self._arrested = {}
+        self._cards = {}
+
+    def piece(self, name, x, y):
+        keys = self._pieces.get(name)
+        if keys is None:
+            keys = self._pieces[name] = tuple(_key('{}:{}'.format(name, c)) for c in range(CELLS))
+        return keys[x * SIZE + y]
+
+    def arrested(self, name):
+        key = self._arrested.get(name)
+        if key is None:
+            key = self._arrested[name] = _key('arrested:' + name)
+        return key
+
+    def card(self, card):
+        '''Key of the current card, the hash of a state only has its fetter flag.'''
+        if card is None:
+            return 0
+        card = tuple(card)
+        key = self._cards.get(card)
+        if key is None:
+            key = self._cards[card] = _key('card:{}'.format(card))
+        return key
+
+    def scalars(self, visible, hidden):
+        '''Hash of everything but the pieces on the board.'''
+        h = self.health[visible['king']]
+        h ^= self.killed['knights'][visible['killed']['knights']]
+        h ^= self.killed['assassins'][visible['killed']['assassins']]
+        for name in visible['arrested']:
+            h ^= self.arrested(name)
+        card = visible['card']
+        if card is not None and card[2]:
+            h ^= self.fetter
+        if hidden is not None:
+            h ^= self.cards[len(hidden['cards'])]
+        return h
+
+    def full(self, visible, hidden, tomove):
+        '''Hash of a state computed from scratch, with the side key if player 1 is to move.'''
+        h = self.scalars(visible, hidden)
+        if tomove == 1:
+            h ^= self.side
+        for x, row in enumerate(visible['people']):
+            for y, name in enumerate(row):
+                if name is not None:
+                    h ^= self.piece(name, x, y)
+        return h
+
+
+KEYS = ZobristKeys()
+
+# Kind of value stored in the transposition table
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class TranspositionTable:
+    '''Class representing a fixed-size transposition table.
+
+    Each bucket has two slots: the first one keeps the entry searched the
+    deepest and the second one always receives the newest entry otherwise.'''
+
+    def __init__(self, bits=20):
+        self._mask = (1 << bits) - 1
+        self._slots = [None] * (2 << bits)
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def __len__(self):
+        return sum(1 for entry in self._slots if entry is not None)
+
+    def probe(self, key):
+        '''Return the (depth, value, flag, move) entry stored for key, or None.'''
+        i = (key & self._mask) << 1
+        for entry in (self._slots[i], self._slots[i + 1]):
+            if entry is not None and entry[0] == key:
+                self.hits += 1
+                return entry[1:]
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, value, flag=EXACT, move=None):
+        i = (key & self._mask) << 1
+        entry = (key, depth, value, flag, move)
+        deep = self._slots[i]
+        self.stores += 1
+        if deep is None or depth >= deep[1]:
+            self._slots[i] = entry
+        else:
+            self._slots[i + 1] = entry
+
+    def clear(self):
+        self._slots = [None] * len(self._slots)
+        self.hits = self.misses = self.stores = 0
+
+    def stats(self):
+        probes = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'hitrate': self.hits / probes if probes else 0.0
+        }